@@ -2,3 +2,8 @@
 Maestro AI Server 应用包
 @author LJY
 """
+
+import time
+
+# 第一次导入 app 包的时刻，启动耗时报告以此为起点
+STARTED_AT = time.perf_counter()
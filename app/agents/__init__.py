@@ -4,11 +4,12 @@ Maestro AI Server - Agent 模块
 """
 
 from app.agents.base import BaseAgent
-from app.agents.defect_agent import DefectDetectionAgent
+from app.agents.defect_agent import BatchDefectDetectionAgent, DefectDetectionAgent
 from app.agents.text_agent import TextExtractionAgent
 
 __all__ = [
     "BaseAgent",
+    "BatchDefectDetectionAgent",
     "DefectDetectionAgent",
     "TextExtractionAgent",
 ]
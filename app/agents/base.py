@@ -4,75 +4,158 @@ Maestro AI Server - Agent 基类
 @author LJY
 """
 
-import base64
+import asyncio
+import hashlib
+import json
+import time
 from abc import ABC, abstractmethod
-from typing import Any, TypeVar
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, TypeVar
 
 import structlog
-from langchain.agents import create_agent
-from langchain.agents.structured_output import ProviderStrategy
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
 from app.config import get_settings
-from app.utils.image import encode_image_to_base64, get_image_mime_type, resize_image_if_needed
+from app.core.admission import get_admission_controller
+from app.core.deadline import cancel_reason
+from app.core.executor import get_image_executor
+from app.core.metrics import (
+    observe_stage,
+    record_llm_cancelled,
+    record_tokens,
+    time_stage,
+    track_provider_time,
+)
+from app.core.router import LLMBackend, LLMRouter
+from app.core.tracing import get_langsmith_adapter, span
+from app.utils.image import PreparedImage, prepare_image
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 logger = structlog.get_logger()
 
 T = TypeVar("T", bound=BaseModel)
 
 
+def _token_usage(result: dict) -> dict[str, int]:
+    """
+    从 Agent 返回的最后一条 AI 消息中读取实际 token 用量
+    cached_tokens 优先取 OpenAI 的 prompt_tokens_details.cached_tokens，
+    其次取 Kimi 在 usage 顶层返回的 cached_tokens
+    """
+    messages = result.get("messages") or []
+    message = messages[-1] if messages else None
+    usage = getattr(message, "usage_metadata", None) or {}
+    raw = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached is None:
+        cached = raw.get("cached_tokens") or 0
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "cached_tokens": cached,
+    }
+
+
 class BaseAgent(ABC):
     """
     Agent 基类
     使用 LangChain v1 的 create_agent 和 ProviderStrategy 结构化输出
+    
+    消息布局按提供商的前缀缓存设计: 固定的 system_prompt 在最前，
+    之后是截图，最后是断言/查询等随请求变化的文本。相同截图上的连续断言可以复用
+    system + 图像部分的缓存
     """
     
-    def __init__(self, llm: ChatOpenAI, output_schema: type[T]):
-        self.llm = llm
+    # 固定的系统提示词 (角色、规则和输出格式)，不能包含随请求变化的内容
+    system_prompt: str = ""
+    
+    # 子类使用的 Prompt 模板，参与 Prompt 版本计算，模板变化后旧的缓存结果自动失效
+    prompt_templates: tuple[str, ...] = ()
+    
+    def __init__(self, llm: "ChatOpenAI | LLMRouter", output_schema: type[T]):
+        # LangChain 导入较慢，推迟到创建 Agent 时 (应用启动预热或第一个请求)
+        from langchain.agents import create_agent
+        from langchain.agents.structured_output import ProviderStrategy
+        
+        if not isinstance(llm, LLMRouter):
+            llm = LLMRouter([LLMBackend("default", llm)])
+        self.router = llm
         self.output_schema = output_schema
         self.settings = get_settings()
         
-        # 创建带结构化输出的 Agent
-        self.agent = create_agent(
-            model=llm,
-            tools=[],  # 纯视觉分析，无需工具
-            response_format=ProviderStrategy(output_schema)
-        )
+        # 每个后端创建一个带结构化输出的 Agent
+        self.agents = {
+            backend.name: create_agent(
+                model=backend.llm,
+                tools=[],  # 纯视觉分析，无需工具
+                system_prompt=self.system_prompt or None,
+                response_format=ProviderStrategy(output_schema)
+            )
+            for backend in self.router.backends
+        }
     
     @abstractmethod
     def get_prompt(self, **kwargs) -> str:
-        """生成用户提示词"""
+        """生成随请求变化的用户提示词 (断言/查询)"""
         pass
     
-    def _create_image_message(self, image_data: bytes) -> dict:
+    @cached_property
+    def prompt_version(self) -> str:
+        """Prompt 模板和输出 Schema 的指纹"""
+        digest = hashlib.sha256(self.system_prompt.encode("utf-8"))
+        for template in self.prompt_templates:
+            digest.update(template.encode("utf-8"))
+        digest.update(json.dumps(self.output_schema.model_json_schema(), sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()[:12]
+    
+    @property
+    def cache_namespace(self) -> str:
+        """结果缓存命名空间: Agent 类型 + Prompt 版本 + 模型名称"""
+        return f"{self.__class__.__name__}:{self.prompt_version}:{self.router.model_name}"
+    
+    async def prepare_image(self, image: PreparedImage | bytes) -> PreparedImage:
+        """
+        确保图像已完成预处理
+        缩放和编码在图像处理执行器中完成，避免阻塞事件循环；已预处理的图像直接复用
+        """
+        if isinstance(image, PreparedImage) and image.is_prepared:
+            return image
+        with time_stage("image_prepare"):
+            if isinstance(image, PreparedImage):
+                image = await get_image_executor().run(image.prepare)
+            else:
+                image = await get_image_executor().run(prepare_image, image)
+            for stage, seconds in image.timings.items():
+                observe_stage(stage, seconds)
+        return image
+    
+    def _create_image_message(self, image: PreparedImage) -> dict:
         """创建包含图像的消息"""
-        # 缩放图像以避免超出限制
-        processed_image = resize_image_if_needed(image_data)
-        base64_image = encode_image_to_base64(processed_image)
-        mime_type = get_image_mime_type(processed_image)
-        
         return {
             "type": "image",
             "source_type": "base64",
-            "data": base64_image,
-            "mime_type": mime_type,
+            "data": image.base64,
+            "mime_type": image.mime_type,
         }
     
-    async def invoke(self, image_data: bytes, **kwargs) -> T:
+    async def invoke(self, image: PreparedImage | bytes, **kwargs) -> T:
         """
         调用 Agent 进行推理
         返回结构化输出
         """
         prompt = self.get_prompt(**kwargs)
-        image_msg = self._create_image_message(image_data)
+        image = await self.prepare_image(image)
+        image_msg = self._create_image_message(image)
         
         messages = [
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": prompt},
-                    image_msg
+                    image_msg,
+                    {"type": "text", "text": prompt}
                 ]
             }
         ]
@@ -80,10 +163,55 @@ class BaseAgent(ABC):
         logger.info(
             "invoking_agent",
             agent=self.__class__.__name__,
-            model=self.llm.model_name,
+            model=self.router.model_name,
         )
         
-        result = await self.agent.ainvoke({"messages": messages})
+        # 按采样率挂上 LangSmith 回调 (截图已脱敏)，未采样的调用不产生任何追踪开销
+        langsmith = get_langsmith_adapter(self.settings)
+        config = {"callbacks": langsmith.callbacks()} if langsmith is not None else None
+        
+        async def call(backend: LLMBackend) -> dict:
+            admission = get_admission_controller(self.settings, backend.name)
+            estimated = self.settings.llm_estimated_tokens
+            queued = time.perf_counter()
+            with span("llm_call", agent=self.__class__.__name__, backend=backend.name, model=backend.model_name) as llm_span:
+                try:
+                    async with admission.admit(tokens=estimated) as reservation:
+                        started = time.perf_counter()
+                        observe_stage("admission_wait", started - queued)
+                        with track_provider_time() as provider_seconds:
+                            result = await self.agents[backend.name].ainvoke({"messages": messages}, config=config)
+                        usage = _token_usage(result)
+                        # 提供商未返回用量时按预估结算
+                        reservation.actual = usage["total_tokens"] or estimated
+                        # Agent 图执行和结构化输出解析: ainvoke 总耗时扣除提供商 HTTP 耗时
+                        observe_stage("llm_parse", max(0.0, time.perf_counter() - started - sum(provider_seconds)))
+                except asyncio.CancelledError:
+                    # 客户端断开、超过截止时间或对冲请求中输掉: 发往提供商的 HTTP 请求随任务取消
+                    reason = cancel_reason()
+                    record_llm_cancelled(backend.name, reason, estimated)
+                    logger.info(
+                        "llm_call_cancelled",
+                        agent=self.__class__.__name__,
+                        backend=backend.name,
+                        reason=reason,
+                        elapsed_ms=round((time.perf_counter() - queued) * 1000),
+                    )
+                    raise
+            
+            backend.record_usage(usage["input_tokens"], usage["cached_tokens"], usage["output_tokens"])
+            if llm_span is not None:
+                llm_span.set_attributes(usage)
+            record_tokens(backend.model_name, usage["input_tokens"], usage["output_tokens"], usage["cached_tokens"])
+            logger.info(
+                "llm_usage",
+                agent=self.__class__.__name__,
+                backend=backend.name,
+                **usage,
+            )
+            return result
+        
+        result = await self.router.call(call)
         
         # LangChain v1 的结构化响应在 structured_response 键中
         structured_response = result.get("structured_response")
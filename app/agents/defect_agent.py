@@ -10,10 +10,17 @@ from pydantic import BaseModel, Field
 from app.agents.base import BaseAgent
 from app.agents.prompts import (
     ASSERTION_SECTION_TEMPLATE,
+    BATCH_ASSERTION_ITEM_TEMPLATE,
+    BATCH_DEFECT_DETECTION_OUTPUT_PROMPT,
+    BATCH_DEFECT_DETECTION_USER_PROMPT,
+    DEFECT_DETECTION_OUTPUT_PROMPT,
     DEFECT_DETECTION_SYSTEM_PROMPT,
     DEFECT_DETECTION_USER_PROMPT,
+    PRECHECK_HINTS_TEMPLATE,
 )
+from app.core import ValidationError
 from app.schemas import Defect
+from app.utils.image import PreparedImage
 
 logger = structlog.get_logger()
 
@@ -26,37 +33,68 @@ class DefectDetectionOutput(BaseModel):
     )
 
 
+class AssertionVerdict(BaseModel):
+    """单条断言的验证结果"""
+    index: int = Field(description="断言序号，从 1 开始")
+    passed: bool = Field(description="断言是否成立")
+    reasoning: str = Field(description="断言成立或不成立的原因")
+
+
+class BatchDefectDetectionOutput(BaseModel):
+    """批量断言缺陷检测结构化输出"""
+    defects: list[Defect] = Field(
+        default_factory=list,
+        description="与断言无关的缺陷列表"
+    )
+    verdicts: list[AssertionVerdict] = Field(
+        default_factory=list,
+        description="每条断言的验证结果"
+    )
+
+
 class DefectDetectionAgent(BaseAgent):
     """缺陷检测 Agent"""
     
+    system_prompt = f"{DEFECT_DETECTION_SYSTEM_PROMPT}\n{DEFECT_DETECTION_OUTPUT_PROMPT}"
+    
+    prompt_templates = (
+        DEFECT_DETECTION_USER_PROMPT,
+        ASSERTION_SECTION_TEMPLATE,
+        PRECHECK_HINTS_TEMPLATE,
+    )
+    
     def __init__(self, llm):
         super().__init__(llm, DefectDetectionOutput)
     
-    def get_prompt(self, assertion: str | None = None, **kwargs) -> str:
+    def get_prompt(self, assertion: str | None = None, hints: list[str] | None = None, **kwargs) -> str:
         if assertion:
             assertion_section = ASSERTION_SECTION_TEMPLATE.format(assertion=assertion)
         else:
             assertion_section = "请检测所有可见的 UI 缺陷和问题。"
         
-        prompt = f"{DEFECT_DETECTION_SYSTEM_PROMPT}\n\n{DEFECT_DETECTION_USER_PROMPT.format(assertion_section=assertion_section)}"
+        prompt = DEFECT_DETECTION_USER_PROMPT.format(assertion_section=assertion_section)
+        if hints:
+            prompt += "\n" + PRECHECK_HINTS_TEMPLATE.format(hints="\n".join(f"- {hint}" for hint in hints))
         return prompt
     
     async def detect(
         self,
-        image_data: bytes,
-        assertion: str | None = None
+        image: PreparedImage | bytes,
+        assertion: str | None = None,
+        hints: list[str] | None = None
     ) -> list[Defect]:
         """
         检测屏幕截图中的缺陷
         
         Args:
-            image_data: 原始图像字节
+            image: 预处理图像或原始图像字节
             assertion: 可选的断言条件
+            hints: 本地预检给出的提示
         
         Returns:
             检测到的缺陷列表
         """
-        result: DefectDetectionOutput = await self.invoke(image_data, assertion=assertion)
+        result: DefectDetectionOutput = await self.invoke(image, assertion=assertion, hints=hints)
         
         logger.info(
             "defects_detected",
@@ -65,3 +103,81 @@ class DefectDetectionAgent(BaseAgent):
         )
         
         return result.defects
+
+
+class BatchDefectDetectionAgent(BaseAgent):
+    """
+    批量断言缺陷检测 Agent
+    一次调用验证同一截图上的多条断言，截图只上传一次
+    """
+    
+    system_prompt = f"{DEFECT_DETECTION_SYSTEM_PROMPT}\n{BATCH_DEFECT_DETECTION_OUTPUT_PROMPT}"
+    
+    prompt_templates = (
+        BATCH_DEFECT_DETECTION_USER_PROMPT,
+        BATCH_ASSERTION_ITEM_TEMPLATE,
+    )
+    
+    def __init__(self, llm):
+        super().__init__(llm, BatchDefectDetectionOutput)
+    
+    def get_prompt(self, assertions: list[str] = (), **kwargs) -> str:
+        items = "\n".join(
+            BATCH_ASSERTION_ITEM_TEMPLATE.format(index=i, assertion=assertion)
+            for i, assertion in enumerate(assertions, start=1)
+        )
+        return BATCH_DEFECT_DETECTION_USER_PROMPT.format(assertions=items)
+    
+    async def detect_batch(
+        self,
+        image: PreparedImage | bytes,
+        assertions: list[str]
+    ) -> list[list[Defect]]:
+        """
+        批量验证断言
+        
+        Args:
+            image: 预处理图像或原始图像字节
+            assertions: 断言条件列表
+        
+        Returns:
+            与 assertions 一一对应的缺陷列表，与单条断言调用的返回格式一致
+        
+        Raises:
+            ValidationError: 结构化输出无法解析或没有覆盖每条断言
+        """
+        from langchain.agents.structured_output import StructuredOutputError
+        
+        try:
+            result: BatchDefectDetectionOutput | None = await self.invoke(image, assertions=assertions)
+        except StructuredOutputError as e:
+            raise ValidationError(f"批量断言结构化输出无效: {e}") from e
+        
+        return split_verdicts(result, len(assertions))
+
+
+def split_verdicts(result: BatchDefectDetectionOutput | None, count: int) -> list[list[Defect]]:
+    """把批量输出拆分为每条断言的缺陷列表: 公共缺陷 + 断言不成立时的 ASSERTION_FAILED"""
+    if result is None:
+        raise ValidationError("批量断言结构化输出为空")
+    
+    verdicts = {v.index: v for v in result.verdicts}
+    if len(result.verdicts) != count or set(verdicts) != set(range(1, count + 1)):
+        raise ValidationError(
+            f"批量断言结果与断言不对应 (期望 {count} 条，返回序号 {sorted(verdicts)})"
+        )
+    
+    common = [d for d in result.defects if d.category != "ASSERTION_FAILED"]
+    defects = []
+    for index in range(1, count + 1):
+        verdict = verdicts[index]
+        failed = [] if verdict.passed else [Defect(category="ASSERTION_FAILED", reasoning=verdict.reasoning)]
+        defects.append(common + failed)
+    
+    logger.info(
+        "batch_assertions_verified",
+        assertions=count,
+        failed=sum(not v.passed for v in result.verdicts),
+        defect_count=len(common),
+    )
+    return defects
@@ -5,10 +5,16 @@ Maestro AI Server - Prompt 模块
 
 from app.agents.prompts.defect_detection import (
     ASSERTION_SECTION_TEMPLATE,
+    BATCH_ASSERTION_ITEM_TEMPLATE,
+    BATCH_DEFECT_DETECTION_OUTPUT_PROMPT,
+    BATCH_DEFECT_DETECTION_USER_PROMPT,
+    DEFECT_DETECTION_OUTPUT_PROMPT,
     DEFECT_DETECTION_SYSTEM_PROMPT,
     DEFECT_DETECTION_USER_PROMPT,
+    PRECHECK_HINTS_TEMPLATE,
 )
 from app.agents.prompts.text_extraction import (
+    TEXT_EXTRACTION_OUTPUT_PROMPT,
     TEXT_EXTRACTION_SYSTEM_PROMPT,
     TEXT_EXTRACTION_USER_PROMPT,
 )
@@ -16,7 +22,13 @@ from app.agents.prompts.text_extraction import (
 __all__ = [
     "DEFECT_DETECTION_SYSTEM_PROMPT",
     "DEFECT_DETECTION_USER_PROMPT",
+    "DEFECT_DETECTION_OUTPUT_PROMPT",
     "ASSERTION_SECTION_TEMPLATE",
+    "PRECHECK_HINTS_TEMPLATE",
+    "BATCH_DEFECT_DETECTION_USER_PROMPT",
+    "BATCH_DEFECT_DETECTION_OUTPUT_PROMPT",
+    "BATCH_ASSERTION_ITEM_TEMPLATE",
     "TEXT_EXTRACTION_SYSTEM_PROMPT",
     "TEXT_EXTRACTION_USER_PROMPT",
+    "TEXT_EXTRACTION_OUTPUT_PROMPT",
 ]
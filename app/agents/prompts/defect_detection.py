@@ -24,31 +24,70 @@ DEFECT_DETECTION_SYSTEM_PROMPT = """你是一个专业的 UI/UX 质量检测专
 - 对于断言验证，严格按照用户提供的断言条件判断
 """
 
-DEFECT_DETECTION_USER_PROMPT = """请分析这个屏幕截图，识别其中的 UI 缺陷和问题。
-
-{assertion_section}
-
+DEFECT_DETECTION_OUTPUT_PROMPT = """## 输出格式
 请按照以下 JSON 格式返回结果：
 ```json
-{{
+{
   "defects": [
-    {{
+    {
       "category": "缺陷类别",
       "reasoning": "详细的推理说明"
-    }}
+    }
   ]
-}}
+}
 ```
 
 如果没有发现任何缺陷，返回：
 ```json
-{{
+{
   "defects": []
-}}
+}
 ```
 """
 
+DEFECT_DETECTION_USER_PROMPT = """请分析这个屏幕截图，识别其中的 UI 缺陷和问题。
+
+{assertion_section}
+"""
+
 ASSERTION_SECTION_TEMPLATE = """**断言条件**: {assertion}
 
 请验证屏幕截图是否满足上述断言条件。如果不满足，在缺陷列表中添加一个 category 为 "ASSERTION_FAILED" 的缺陷，并在 reasoning 中说明为什么断言失败。
 """
+
+PRECHECK_HINTS_TEMPLATE = """**本地预检提示** (基于像素统计，仅供参考):
+{hints}
+"""
+
+BATCH_DEFECT_DETECTION_OUTPUT_PROMPT = """## 输出格式
+用户会给出若干条编号的断言条件，请识别截图中的 UI 缺陷，并逐条验证断言，按照以下 JSON 格式返回结果：
+```json
+{
+  "defects": [
+    {
+      "category": "缺陷类别",
+      "reasoning": "详细的推理说明"
+    }
+  ],
+  "verdicts": [
+    {
+      "index": 1,
+      "passed": true,
+      "reasoning": "断言成立或不成立的原因"
+    }
+  ]
+}
+```
+
+- defects 只包含与断言无关的 UI 缺陷，不要使用 ASSERTION_FAILED 类别；没有发现缺陷时返回空列表
+- verdicts 必须为每个断言条件返回且只返回一条结果，index 与断言序号一致
+- 每条断言独立判断，严格按照断言条件本身判断是否成立
+"""
+
+BATCH_DEFECT_DETECTION_USER_PROMPT = """请分析这个屏幕截图，识别其中的 UI 缺陷和问题，并逐条验证以下断言条件。
+
+**断言条件**:
+{assertions}
+"""
+
+BATCH_ASSERTION_ITEM_TEMPLATE = "{index}. {assertion}"
@@ -17,21 +17,23 @@ TEXT_EXTRACTION_SYSTEM_PROMPT = """你是一个专业的文本提取助手。你
 - 不要编造或推测不存在的文本
 """
 
-TEXT_EXTRACTION_USER_PROMPT = """请从这个屏幕截图中提取以下信息：
-
-**查询条件**: {query}
-
+TEXT_EXTRACTION_OUTPUT_PROMPT = """## 输出格式
 请按照以下 JSON 格式返回结果：
 ```json
-{{
+{
   "text": "提取的文本内容"
-}}
+}
 ```
 
 如果找不到匹配的文本，返回：
 ```json
-{{
+{
   "text": ""
-}}
+}
 ```
 """
+
+TEXT_EXTRACTION_USER_PROMPT = """请从这个屏幕截图中提取以下信息：
+
+**查询条件**: {query}
+"""
@@ -9,9 +9,11 @@ from pydantic import BaseModel, Field
 
 from app.agents.base import BaseAgent
 from app.agents.prompts import (
+    TEXT_EXTRACTION_OUTPUT_PROMPT,
     TEXT_EXTRACTION_SYSTEM_PROMPT,
     TEXT_EXTRACTION_USER_PROMPT,
 )
+from app.utils.image import PreparedImage
 
 logger = structlog.get_logger()
 
@@ -24,25 +26,30 @@ class TextExtractionOutput(BaseModel):
 class TextExtractionAgent(BaseAgent):
     """文本提取 Agent"""
     
+    system_prompt = f"{TEXT_EXTRACTION_SYSTEM_PROMPT}\n{TEXT_EXTRACTION_OUTPUT_PROMPT}"
+    
+    prompt_templates = (
+        TEXT_EXTRACTION_USER_PROMPT,
+    )
+    
     def __init__(self, llm):
         super().__init__(llm, TextExtractionOutput)
     
     def get_prompt(self, query: str, **kwargs) -> str:
-        prompt = f"{TEXT_EXTRACTION_SYSTEM_PROMPT}\n\n{TEXT_EXTRACTION_USER_PROMPT.format(query=query)}"
-        return prompt
+        return TEXT_EXTRACTION_USER_PROMPT.format(query=query)
     
-    async def extract(self, image_data: bytes, query: str) -> str:
+    async def extract(self, image: PreparedImage | bytes, query: str) -> str:
         """
         从屏幕截图中提取文本
         
         Args:
-            image_data: 原始图像字节
+            image: 预处理图像或原始图像字节
             query: 查询条件
         
         Returns:
             提取的文本
         """
-        result: TextExtractionOutput = await self.invoke(image_data, query=query)
+        result: TextExtractionOutput = await self.invoke(image, query=query)
         
         logger.info(
             "text_extracted",
@@ -3,12 +3,21 @@ Maestro AI Server - API 依赖注入
 @author LJY
 """
 
-from typing import Annotated
+import time
+from typing import Annotated, Any, Callable, Coroutine, TypeVar, get_origin
 
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
 
 from app.config import get_settings
+from app.core.metrics import observe_stage, time_stage
+from app.schemas import ExtractTextRequest, FindDefectsBatchRequest, FindDefectsRequest
 from app.services import DefectService, TextService, get_defect_service, get_text_service
+from app.utils.screen_parser import ScreenBodyParser
+
+T = TypeVar("T", bound=BaseModel)
 
 
 async def verify_api_key(
@@ -41,7 +50,147 @@ async def verify_api_key(
     return token
 
 
+async def use_result_cache(
+    cache_control: Annotated[str | None, Header()] = None
+) -> bool:
+    """
+    是否使用结果缓存
+    请求头 Cache-Control 含 no-cache 或 no-store 时跳过缓存，强制调用 LLM
+    """
+    if not cache_control:
+        return True
+    directives = {d.strip().lower() for d in cache_control.split(",")}
+    return not directives & {"no-cache", "no-store"}
+
+
+def _validation_error(msg: str, error_type: str = "json_invalid") -> RequestValidationError:
+    return RequestValidationError([{
+        "type": error_type,
+        "loc": ("body",),
+        "msg": msg,
+        "input": {},
+        "ctx": {"error": msg},
+    }])
+
+
+async def _json_fields(request: Request) -> dict[str, Any]:
+    """application/json: 流式解析，screen 可以是有符号字节数组或 Base64 字符串"""
+    parser = ScreenBodyParser()
+    # 解析与接收交替进行，只累计解析本身的 CPU 耗时
+    decode_seconds = 0.0
+    try:
+        async for chunk in request.stream():
+            started = time.perf_counter()
+            parser.feed(chunk)
+            decode_seconds += time.perf_counter() - started
+        return parser.close()
+    except ValueError as e:
+        raise _validation_error(str(e))
+    finally:
+        observe_stage("screen_decode", decode_seconds)
+
+
+async def _raw_fields(request: Request, model: type[BaseModel]) -> dict[str, Any]:
+    """application/octet-stream / image/*: 请求体即截图，其余字段来自查询参数"""
+    screen = bytearray()
+    async for chunk in request.stream():
+        screen += chunk
+    return {**_query_fields(request.query_params, model), "screen": bytes(screen)}
+
+
+async def _multipart_fields(request: Request, model: type[BaseModel]) -> dict[str, Any]:
+    """multipart/form-data: screen 为文件 (或 Base64 文本)，其余字段为表单字段或查询参数"""
+    form = await request.form()
+    try:
+        fields = {**_query_fields(request.query_params, model), **_query_fields(form, model)}
+        screen = form.get("screen")
+        if isinstance(screen, UploadFile):
+            fields["screen"] = await screen.read()
+        elif screen is not None:
+            fields["screen"] = screen
+        return fields
+    finally:
+        await form.close()
+
+
+def _query_fields(params: Any, model: type[BaseModel]) -> dict[str, Any]:
+    """从查询参数/表单中取出 screen 以外的模型字段，列表字段取全部同名参数"""
+    fields = {}
+    for name, field in model.model_fields.items():
+        if name == "screen" or name not in params:
+            continue
+        values = [v for v in params.getlist(name) if isinstance(v, str)]
+        if get_origin(field.annotation) is list:
+            fields[name] = values
+        elif values:
+            fields[name] = values[0]
+    return fields
+
+
+def screen_body(model: type[T]) -> Callable[[Request], Coroutine[Any, Any, T]]:
+    """
+    创建解析截图请求体的依赖，按 Content-Type 选择解析方式
+    
+    - application/json (默认): 随 ASGI receive 消息逐块解码 screen，兼容 Maestro CLI 的有符号字节数组
+    - application/octet-stream、image/*: 请求体即原始截图，其余字段通过查询参数传递
+    - multipart/form-data: screen 为上传文件，其余字段为表单字段
+    
+    接收和解析请求体的耗时记为 body_read 阶段，字段校验 (含 Base64 解码) 记为 body_validate 阶段
+    """
+    async def parse(request: Request) -> T:
+        content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+        with time_stage("body_read"):
+            if content_type in ("", "application/json"):
+                fields = await _json_fields(request)
+            elif content_type == "application/octet-stream" or content_type.startswith("image/"):
+                fields = await _raw_fields(request, model)
+            elif content_type == "multipart/form-data":
+                fields = await _multipart_fields(request, model)
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail=f"不支持的 Content-Type: {content_type}"
+                )
+        
+        try:
+            with time_stage("body_validate"):
+                return model.model_validate(fields)
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ])
+    
+    return parse
+
+
+def screen_body_openapi(model: type[BaseModel]) -> dict:
+    """流式解析的端点不声明 Body 参数，手动补充 OpenAPI 请求体描述"""
+    schema = model.model_json_schema()
+    form = {
+        **schema,
+        "properties": {
+            **schema["properties"],
+            "screen": {"type": "string", "format": "binary", "description": "屏幕截图文件"},
+        },
+    }
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": schema},
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+                "multipart/form-data": {"schema": form},
+            },
+        }
+    }
+
+
 # 类型别名
 ApiKeyDep = Annotated[str, Depends(verify_api_key)]
 DefectServiceDep = Annotated[DefectService, Depends(get_defect_service)]
 TextServiceDep = Annotated[TextService, Depends(get_text_service)]
+UseCacheDep = Annotated[bool, Depends(use_result_cache)]
+FindDefectsBodyDep = Annotated[FindDefectsRequest, Depends(screen_body(FindDefectsRequest))]
+FindDefectsBatchBodyDep = Annotated[FindDefectsBatchRequest, Depends(screen_body(FindDefectsBatchRequest))]
+ExtractTextBodyDep = Annotated[ExtractTextRequest, Depends(screen_body(ExtractTextRequest))]
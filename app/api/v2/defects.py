@@ -4,10 +4,24 @@ Maestro AI Server - 缺陷检测 API 端点
 """
 
 import structlog
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, status
 
-from app.api.deps import ApiKeyDep, DefectServiceDep
-from app.schemas import FindDefectsRequest, FindDefectsResponse
+from app.api.deps import (
+    ApiKeyDep,
+    DefectServiceDep,
+    FindDefectsBatchBodyDep,
+    FindDefectsBodyDep,
+    UseCacheDep,
+    screen_body_openapi,
+)
+from app.config import get_settings
+from app.schemas import (
+    AssertionResult,
+    FindDefectsBatchRequest,
+    FindDefectsBatchResponse,
+    FindDefectsRequest,
+    FindDefectsResponse,
+)
 
 logger = structlog.get_logger()
 
@@ -18,19 +32,24 @@ router = APIRouter()
     "/find-defects",
     response_model=FindDefectsResponse,
     summary="检测屏幕截图中的缺陷",
-    description="分析屏幕截图，识别 UI 缺陷。可选传入断言条件进行验证。"
+    description="分析屏幕截图，识别 UI 缺陷。可选传入断言条件进行验证。",
+    openapi_extra=screen_body_openapi(FindDefectsRequest),
 )
 async def find_defects(
-    request: FindDefectsRequest,
     api_key: ApiKeyDep,
+    request: FindDefectsBodyDep,
     service: DefectServiceDep,
+    use_cache: UseCacheDep,
 ) -> FindDefectsResponse:
     """
     检测屏幕截图中的缺陷
     
-    - **screen**: Base64 编码的屏幕截图
+    - **screen**: 屏幕截图，有符号字节数组 (Maestro CLI) 或 Base64 字符串；
+      也可以 `application/octet-stream` 直接上传截图 (其余字段放在查询参数中) 或 multipart 上传
     - **assertion**: 可选的断言条件 (用于 assertWithAI 命令)
     
+    相同截图和断言的结果会被缓存，请求头 `Cache-Control: no-cache` 可跳过缓存。
+    
     返回检测到的缺陷列表，每个缺陷包含类别和推理说明。
     """
     logger.info(
@@ -40,7 +59,53 @@ async def find_defects(
     
     defects = await service.find_defects(
         screen=request.screen,
-        assertion=request.assertion
+        assertion=request.assertion,
+        use_cache=use_cache
     )
     
     return FindDefectsResponse(defects=defects)
+
+
+@router.post(
+    "/find-defects/batch",
+    response_model=FindDefectsBatchResponse,
+    summary="在同一截图上批量验证断言",
+    description="一次请求验证同一屏幕截图上的多条断言，截图只上传一次，多条断言合并为一次 LLM 调用。",
+    openapi_extra=screen_body_openapi(FindDefectsBatchRequest),
+)
+async def find_defects_batch(
+    api_key: ApiKeyDep,
+    request: FindDefectsBatchBodyDep,
+    service: DefectServiceDep,
+    use_cache: UseCacheDep,
+) -> FindDefectsBatchResponse:
+    """
+    在同一截图上批量验证断言
+    
+    - **screen**: 屏幕截图，格式同 /v2/find-defects
+    - **assertions**: 断言条件列表
+    
+    每条断言的结果与单独调用 /v2/find-defects 的返回格式一致，顺序与请求相同。
+    """
+    max_assertions = get_settings().batch_max_assertions
+    if len(request.assertions) > max_assertions:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"断言数量超过上限 ({len(request.assertions)}/{max_assertions})"
+        )
+    
+    logger.info(
+        "api_find_defects_batch",
+        assertions=len(request.assertions)
+    )
+    
+    results = await service.find_defects_batch(
+        screen=request.screen,
+        assertions=request.assertions,
+        use_cache=use_cache
+    )
+    
+    return FindDefectsBatchResponse(results=[
+        AssertionResult(assertion=assertion, defects=defects)
+        for assertion, defects in zip(request.assertions, results)
+    ])
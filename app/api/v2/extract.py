@@ -6,7 +6,13 @@ Maestro AI Server - 文本提取 API 端点
 import structlog
 from fastapi import APIRouter
 
-from app.api.deps import ApiKeyDep, TextServiceDep
+from app.api.deps import (
+    ApiKeyDep,
+    ExtractTextBodyDep,
+    TextServiceDep,
+    UseCacheDep,
+    screen_body_openapi,
+)
 from app.schemas import ExtractTextRequest, ExtractTextResponse
 
 logger = structlog.get_logger()
@@ -18,19 +24,24 @@ router = APIRouter()
     "/extract-text",
     response_model=ExtractTextResponse,
     summary="从屏幕截图中提取文本",
-    description="根据查询条件从屏幕截图中提取指定的文本内容。"
+    description="根据查询条件从屏幕截图中提取指定的文本内容。",
+    openapi_extra=screen_body_openapi(ExtractTextRequest),
 )
 async def extract_text(
-    request: ExtractTextRequest,
     api_key: ApiKeyDep,
+    request: ExtractTextBodyDep,
     service: TextServiceDep,
+    use_cache: UseCacheDep,
 ) -> ExtractTextResponse:
     """
     从屏幕截图中提取文本
     
-    - **screen**: Base64 编码的屏幕截图
+    - **screen**: 屏幕截图，有符号字节数组 (Maestro CLI) 或 Base64 字符串；
+      也可以 `application/octet-stream` 直接上传截图 (其余字段放在查询参数中) 或 multipart 上传
     - **query**: 查询条件，描述需要提取的文本
     
+    相同截图和查询的结果会被缓存，请求头 `Cache-Control: no-cache` 可跳过缓存。
+    
     返回提取的文本内容。
     """
     logger.info(
@@ -40,7 +51,8 @@ async def extract_text(
     
     text = await service.extract_text(
         screen=request.screen,
-        query=request.query
+        query=request.query,
+        use_cache=use_cache
     )
     
     return ExtractTextResponse(text=text)
@@ -6,8 +6,9 @@ Maestro AI Server 配置管理模块
 
 from enum import Enum
 from functools import lru_cache
+from typing import Literal
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -17,6 +18,15 @@ class LLMProvider(str, Enum):
     KIMI = "kimi"
 
 
+class LLMBackendConfig(BaseModel):
+    """OpenAI 兼容的 LLM 后端 (Kimi、OpenAI、自建网关等)"""
+    name: str = Field(description="后端名称，用于日志和准入控制")
+    base_url: str = Field(description="API Base URL")
+    api_key: str = Field(description="API Key")
+    model: str = Field(description="模型名称")
+    weight: float = Field(default=1.0, gt=0, description="路由权重，越大分到的请求越多")
+
+
 class Settings(BaseSettings):
     """应用配置"""
     
@@ -52,13 +62,235 @@ class Settings(BaseSettings):
     )
     openai_model: str = Field(default="gpt-4o", description="OpenAI 模型名称")
     
-    # 重试配置
-    max_retries: int = Field(default=3, description="最大重试次数")
-    retry_initial_delay: float = Field(default=1.0, description="重试初始延迟(秒)")
-    retry_backoff_factor: float = Field(default=2.0, description="重试退避因子")
+    # 多后端路由配置
+    llm_backends: list[LLMBackendConfig] = Field(
+        default_factory=list,
+        description="LLM 后端列表 (JSON)，为空时只使用 llm_provider 对应的后端"
+    )
+    llm_router_ewma_alpha: float = Field(
+        default=0.2,
+        gt=0.0,
+        le=1.0,
+        description="后端延迟和错误率 EWMA 平滑系数"
+    )
+    llm_router_error_half_life: float = Field(
+        default=30.0,
+        gt=0.0,
+        description="后端错误率的衰减半衰期 (秒)，没有新的失败时错误率随时间下降，不健康的后端恢复后重新参与路由"
+    )
+    llm_hedge_enabled: bool = Field(
+        default=False,
+        description="启用对冲请求: 首选后端超过延迟分位数未返回时向次选后端再发一次，取先返回的结果"
+    )
+    llm_hedge_percentile: float = Field(
+        default=0.95,
+        gt=0.0,
+        lt=1.0,
+        description="触发对冲请求的首选后端延迟分位数"
+    )
+    llm_hedge_min_delay: float = Field(
+        default=2.0,
+        ge=0.0,
+        description="触发对冲请求的最短等待时间(秒)，延迟样本不足时使用"
+    )
+    
+    # LLM HTTP 连接池配置 (所有后端共用一个 httpx.AsyncClient)
+    llm_http_max_connections: int = Field(default=100, ge=1, description="连接池最大连接数")
+    llm_http_max_keepalive: int = Field(default=20, ge=0, description="连接池最多保留的空闲连接数")
+    llm_http_keepalive_expiry: float = Field(default=60.0, gt=0, description="空闲连接保留时间(秒)")
+    llm_http2: bool = Field(default=True, description="启用 HTTP/2 多路复用 (需安装 h2，未安装时回退 HTTP/1.1)")
+    llm_keep_warm_interval: float = Field(
+        default=0.0,
+        ge=0.0,
+        description="连接保温间隔(秒)，启动后及每隔该时间向各后端发一次轻量请求，0 表示不保温"
+    )
+    
+    # 重试配置 (路由层统一重试，OpenAI SDK 不再自动重试)
+    max_retries: int = Field(default=3, ge=0, description="同一后端暂时性故障 (连接失败、超时、429、5xx) 的最大重试次数")
+    retry_initial_delay: float = Field(default=1.0, gt=0, description="重试初始延迟(秒)，实际等待在 0 到退避上限之间随机")
+    retry_backoff_factor: float = Field(default=2.0, ge=1.0, description="重试退避因子，第 n 次重试的等待上限为初始延迟乘以因子的 n-1 次方")
+    retry_max_delay: float = Field(default=10.0, gt=0, description="单次重试等待的上限(秒)")
+    retry_budget_ratio: float = Field(
+        default=0.1,
+        ge=0.0,
+        description="服务级重试预算: 滑动窗口内重试次数不超过请求数的该比例"
+    )
+    retry_budget_min_retries: int = Field(default=3, ge=0, description="滑动窗口内始终允许的最少重试次数 (低流量时)")
+    retry_budget_window: float = Field(default=10.0, gt=0, description="重试预算的滑动窗口(秒)")
+    
+    # 熔断配置 (按后端)
+    circuit_breaker_failure_threshold: int = Field(
+        default=5,
+        ge=1,
+        description="连续暂时性故障达到该次数时打开熔断器，打开期间跳过该后端"
+    )
+    circuit_breaker_recovery_timeout: float = Field(
+        default=30.0,
+        gt=0,
+        description="熔断器打开后经过该时间(秒)放行一个探测调用，成功则恢复"
+    )
+    
+    # LLM 调用准入控制 (按提供商)
+    llm_max_concurrency: int = Field(default=8, ge=1, description="同时进行的 LLM 调用数上限")
+    llm_max_queue: int = Field(default=64, ge=0, description="等待 LLM 调用名额的最大排队请求数，超出时返回 503")
+    llm_queue_timeout: float = Field(default=30.0, gt=0, description="等待 LLM 调用名额的最长时间(秒)")
+    llm_rpm: int = Field(default=0, ge=0, description="提供商每分钟请求数限制，0 表示不限制")
+    llm_tpm: int = Field(default=0, ge=0, description="提供商每分钟 token 数限制，0 表示不限制")
+    llm_estimated_tokens: int = Field(
+        default=2000,
+        ge=1,
+        description="单次调用的预估 token 用量，用于 TPM 限速，调用完成后按实际用量修正"
+    )
+    llm_ready_queue_ratio: float = Field(
+        default=0.8,
+        gt=0.0,
+        le=1.0,
+        description="排队深度达到 max_queue 的该比例时 /health/ready 返回未就绪"
+    )
+    
+    # 请求体解压配置
+    request_max_decompressed_size: int = Field(
+        default=64 * 1024 * 1024,
+        ge=1,
+        description="压缩请求体 (gzip/deflate/zstd) 解压后的最大字节数，超出时返回 413"
+    )
+    
+    # 请求截止时间配置
+    request_deadline_enabled: bool = Field(
+        default=True,
+        description="客户端断开或超过截止时间时取消请求处理，包括进行中的 LLM 调用"
+    )
+    request_timeouts: dict[str, float] = Field(
+        default_factory=lambda: {
+            "/v2/find-defects": 60.0,
+            "/v2/find-defects/batch": 120.0,
+            "/v2/extract-text": 60.0,
+        },
+        description="各端点的默认截止时间(秒) (JSON)，未列出的端点只在客户端断开时取消"
+    )
+    request_max_timeout: float = Field(
+        default=300.0,
+        gt=0,
+        description="X-Request-Timeout 请求头指定的截止时间上限(秒)"
+    )
+    
+    # 图像处理配置
+    image_executor: Literal["thread", "process"] = Field(
+        default="thread",
+        description="图像预处理执行器类型: thread 线程池 / process 进程池"
+    )
+    image_executor_workers: int = Field(
+        default=0,
+        ge=0,
+        description="图像预处理并行数，0 表示使用 CPU 核数"
+    )
+    image_executor_queue_size: int = Field(
+        default=32,
+        ge=0,
+        description="图像预处理最大排队任务数，超出时返回 503"
+    )
+    
+    # 结果缓存配置
+    result_cache_enabled: bool = Field(default=True, description="启用 LLM 结果缓存")
+    result_cache_max_entries: int = Field(default=1024, ge=1, description="结果缓存最大条目数")
+    result_cache_max_bytes: int = Field(
+        default=16 * 1024 * 1024,
+        ge=1,
+        description="结果缓存最大字节数 (按序列化后大小计算)"
+    )
+    result_cache_ttl: float = Field(default=3600.0, gt=0, description="结果缓存有效期(秒)")
+    result_cache_backend: Literal["memory", "sqlite"] = Field(
+        default="memory",
+        description="结果缓存后端: memory (进程内) 或 sqlite (持久化，同机多 worker 共享)"
+    )
+    result_cache_sqlite_path: str = Field(
+        default="data/result_cache.sqlite3",
+        description="SQLite 结果缓存数据库路径"
+    )
+    result_cache_sqlite_max_entries: int = Field(
+        default=100_000,
+        ge=1,
+        description="SQLite 结果缓存最大条目数"
+    )
+    result_cache_sqlite_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        ge=1,
+        description="SQLite 结果缓存最大字节数 (按序列化后大小计算)"
+    )
+    
+    # 批量断言配置
+    batch_max_assertions: int = Field(
+        default=16,
+        ge=1,
+        description="/v2/find-defects/batch 单次请求的最大断言数"
+    )
+    batch_chunk_size: int = Field(
+        default=8,
+        ge=1,
+        description="单次 LLM 调用验证的最大断言数，超出时拆分为多次并发调用"
+    )
+    
+    # 近似截图匹配配置 (仅缺陷检测)
+    near_duplicate_enabled: bool = Field(
+        default=False,
+        description="启用感知哈希近似截图匹配，复用近似截图的缺陷检测结果"
+    )
+    near_duplicate_hash_size: int = Field(
+        default=16,
+        ge=4,
+        le=64,
+        description="感知哈希边长，哈希位数为其平方"
+    )
+    near_duplicate_threshold: int = Field(default=4, ge=0, description="判定为近似截图的最大汉明距离")
+    near_duplicate_mask_top: float = Field(
+        default=0.04,
+        ge=0.0,
+        lt=1.0,
+        description="计算感知哈希时忽略的顶部区域高度比例 (状态栏)"
+    )
+    near_duplicate_mask_bottom: float = Field(
+        default=0.0,
+        ge=0.0,
+        lt=1.0,
+        description="计算感知哈希时忽略的底部区域高度比例 (导航栏)"
+    )
+    
+    # 截图本地预检配置 (缺陷检测调用 LLM 之前)
+    precheck_enabled: bool = Field(default=True, description="启用截图本地预检")
+    precheck_black_frame: bool = Field(default=True, description="全黑截图直接判定为缺陷 (仅无断言的缺陷检测)")
+    precheck_black_max_luma: int = Field(default=16, ge=0, le=255, description="判定为全黑截图的最大亮度")
+    precheck_blank_frame: bool = Field(
+        default=False,
+        description="单一颜色的空白截图直接判定为缺陷 (仅无断言的缺陷检测；纯色启动页、空状态页面会被误判，默认关闭)"
+    )
+    precheck_blank_max_range: int = Field(
+        default=8,
+        ge=0,
+        le=255,
+        description="判定为单一颜色截图时各颜色通道允许的最大差值 (容忍压缩噪声)"
+    )
+    precheck_low_variance: bool = Field(default=True, description="内容很少的截图给 LLM 附加提示")
+    precheck_low_variance_max_stddev: float = Field(
+        default=6.0,
+        ge=0.0,
+        description="判定为内容很少的最大亮度标准差"
+    )
+    precheck_sample_size: int = Field(default=256, ge=16, description="计算像素统计前截图缩小到的最大边长")
+    precheck_mask_top: float = Field(
+        default=0.05,
+        ge=0.0,
+        lt=1.0,
+        description="预检时忽略的顶部区域高度比例 (状态栏)"
+    )
+    precheck_mask_bottom: float = Field(
+        default=0.05,
+        ge=0.0,
+        lt=1.0,
+        description="预检时忽略的底部区域高度比例 (导航栏)"
+    )
     
     # LangSmith 配置
-    langchain_tracing_v2: bool = Field(default=True, description="启用 LangSmith 追踪")
+    langchain_tracing_v2: bool = Field(default=True, description="启用 LangSmith 追踪 (需配置 API Key，按 langsmith_sample_rate 采样)")
     langchain_endpoint: str = Field(
         default="https://api.smith.langchain.com",
         description="LangSmith API 端点"
@@ -68,10 +300,46 @@ class Settings(BaseSettings):
         default="maestro-ai-server",
         description="LangSmith 项目名称"
     )
+    langsmith_sample_rate: float = Field(
+        default=0.05,
+        ge=0.0,
+        le=1.0,
+        description="上传到 LangSmith 的 Agent 调用比例，上传前截图 Base64 替换为摘要"
+    )
+    
+    # 本地链路追踪
+    trace_exporter: Literal["none", "stdout", "file"] = Field(
+        default="none",
+        description="本地 span 导出方式 (OTLP JSON，每个请求一行): none / stdout / file"
+    )
+    trace_file_path: str = Field(default="traces.jsonl", description="trace_exporter=file 时的导出文件")
+    trace_sample_rate: float = Field(
+        default=0.1,
+        ge=0.0,
+        le=1.0,
+        description="本地追踪的请求采样率，带 traceparent 请求头的请求沿用其采样标记"
+    )
     
     # 服务配置
     port: int = Field(default=8000, description="服务端口")
-    log_level: str = Field(default="INFO", description="日志级别")
+    log_level: str = Field(default="INFO", description="日志级别: DEBUG / INFO / WARNING / ERROR")
+    log_format: Literal["console", "json"] = Field(
+        default="console",
+        description="日志格式: console 为彩色控制台输出 (开发)，json 为 JSON 行，由后台线程批量写出 (生产)"
+    )
+    log_queue_size: int = Field(default=10000, ge=1, description="json 日志队列容量，队列已满时丢弃新日志并计数")
+    log_batch_size: int = Field(default=256, ge=1, description="json 日志后台线程每次写出的最大条数")
+    eager_startup: bool = Field(
+        default=True,
+        description="启动时预先导入 LangChain、创建 Agent 并生成 Schema，第一个请求不再承担这些开销"
+    )
+    metrics_enabled: bool = Field(default=True, description="启用 Prometheus 指标 (/metrics 端点和请求指标中间件)")
+    log_sample_rate: float = Field(
+        default=0.01,
+        ge=0.0,
+        le=1.0,
+        description="请求详细日志 (Header/请求体摘要) 的采样率，出错请求始终记录详细信息"
+    )
     
     @property
     def current_api_key(self) -> str:
@@ -27,3 +27,21 @@ class ValidationError(MaestroAIError):
 class AuthenticationError(MaestroAIError):
     """认证异常"""
     pass
+
+
+class OverloadedError(MaestroAIError):
+    """服务过载异常 (队列已满，拒绝新任务)"""
+    
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(OverloadedError):
+    """超出 LLM 提供商速率限制 (RPM/TPM)"""
+    pass
+
+
+class CircuitOpenError(OverloadedError):
+    """LLM 后端熔断中，没有可用的后端"""
+    pass
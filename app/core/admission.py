@@ -0,0 +1,229 @@
+"""
+Maestro AI Server - LLM 调用准入控制
+按提供商限制并发调用数和 RPM/TPM 速率，排队有上限和超时，饱和时快速拒绝
+@author LJY
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import structlog
+
+from app.config import Settings, get_settings
+from app.core import OverloadedError, RateLimitedError
+
+logger = structlog.get_logger()
+
+
+class TokenBucket:
+    """
+    令牌桶
+    
+    - 按每分钟速率匀速补充，容量为一分钟的配额
+    - consume 允许余额为负 (预约)，之后的调用需要等待更久
+    """
+    
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+    
+    def delay(self, amount: float) -> float:
+        """获得 amount 个令牌需要等待的秒数"""
+        self._refill()
+        missing = min(amount, self.capacity) - self._tokens
+        return max(0.0, missing / self.rate)
+    
+    def consume(self, amount: float) -> None:
+        """扣除令牌"""
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+    
+    def refund(self, amount: float) -> None:
+        """退还令牌 (实际用量小于预估时)，amount 为负表示补扣"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class TokenReservation:
+    """
+    一次调用预约的 TPM 令牌，准入结束时按 actual 结算
+    
+    actual 默认为 0: 调用失败或被取消时退还全部预约；调用成功后由调用方填入实际用量
+    """
+    
+    def __init__(self, estimated: int):
+        self.estimated = estimated
+        self.actual = 0
+
+
+class AdmissionController:
+    """
+    LLM 调用准入控制
+    
+    - 同时进行的调用不超过 max_concurrency，其余请求排队
+    - 排队请求数达到 max_queue 时直接拒绝 (503)，排队超过 queue_timeout 同样拒绝
+    - 获得并发名额后按 RPM/TPM 令牌桶限速，等待时间超出剩余期限时拒绝 (429)
+    - 排队深度低于 max_queue * ready_ratio 时视为就绪，供负载均衡提前摘流
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 8,
+        max_queue: int = 64,
+        queue_timeout: float = 30.0,
+        rpm: int = 0,
+        tpm: int = 0,
+        ready_ratio: float = 0.8
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.ready_ratio = ready_ratio
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+    
+    @property
+    def ready(self) -> bool:
+        """排队深度是否低于就绪阈值"""
+        return self.waiting < max(1, math.ceil(self.max_queue * self.ready_ratio))
+    
+    @asynccontextmanager
+    async def admit(self, tokens: int = 0) -> AsyncIterator[TokenReservation]:
+        """
+        获得一次 LLM 调用的准入，tokens 为预估的 token 用量
+        退出时按预约的 actual 结算 TPM 令牌，失败或取消的调用不占用预估的配额
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        await self._acquire()
+        try:
+            await self._throttle(tokens, deadline)
+            self.admitted += 1
+            self.active += 1
+            reservation = TokenReservation(tokens)
+            try:
+                yield reservation
+            finally:
+                self.active -= 1
+                self.settle(reservation.estimated, reservation.actual)
+        finally:
+            self._semaphore.release()
+    
+    def settle(self, estimated: int, actual: int) -> None:
+        """按实际 token 用量修正 TPM 令牌桶，actual 为 0 时退还全部预估"""
+        if self.tpm is not None and estimated > 0:
+            self.tpm.refund(estimated - actual)
+    
+    def stats(self) -> dict:
+        """准入统计"""
+        return {
+            "provider": self.name,
+            "ready": self.ready,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+        }
+    
+    async def _acquire(self) -> None:
+        """获取并发名额，排队已满或超时时拒绝"""
+        if not self._semaphore.locked() and self.waiting == 0:
+            await self._semaphore.acquire()
+            return
+        
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(
+                f"LLM 调用排队已满 ({self.waiting}/{self.max_queue})",
+                retry_after=self.queue_timeout / 2,
+            )
+        
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(
+                f"LLM 调用排队超时 ({self.queue_timeout:g}s)",
+                retry_after=self.queue_timeout / 2,
+            ) from None
+        finally:
+            self.waiting -= 1
+    
+    async def _throttle(self, tokens: int, deadline: float) -> None:
+        """按 RPM/TPM 限速，需要等待的时间超过剩余期限时拒绝"""
+        wait = 0.0
+        if self.rpm is not None:
+            wait = max(wait, self.rpm.delay(1))
+        if self.tpm is not None and tokens > 0:
+            wait = max(wait, self.tpm.delay(tokens))
+        
+        if wait > deadline - time.monotonic():
+            self.rate_limited += 1
+            raise RateLimitedError(f"超出 {self.name} 速率限制", retry_after=wait)
+        
+        if self.rpm is not None:
+            self.rpm.consume(1)
+        if self.tpm is not None and tokens > 0:
+            self.tpm.consume(tokens)
+        
+        if wait > 0:
+            logger.info("llm_call_throttled", provider=self.name, wait_ms=round(wait * 1000))
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 等待限速期间被取消，退还已扣除的 token
+                self.settle(tokens, 0)
+                raise
+
+
+# 准入控制单例 (按提供商)
+_admission_controllers: dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(settings: Settings | None = None, name: str | None = None) -> AdmissionController:
+    """获取 LLM 后端的准入控制单例，name 默认为当前 LLM 提供商"""
+    if settings is None:
+        settings = get_settings()
+    if name is None:
+        name = settings.llm_provider.value
+    controller = _admission_controllers.get(name)
+    if controller is None:
+        controller = AdmissionController(
+            name=name,
+            max_concurrency=settings.llm_max_concurrency,
+            max_queue=settings.llm_max_queue,
+            queue_timeout=settings.llm_queue_timeout,
+            rpm=settings.llm_rpm,
+            tpm=settings.llm_tpm,
+            ready_ratio=settings.llm_ready_queue_ratio,
+        )
+        _admission_controllers[name] = controller
+    return controller
+
+
+def get_admission_controllers(settings: Settings | None = None) -> list[AdmissionController]:
+    """所有已创建的准入控制 (至少包含当前 LLM 提供商)"""
+    if not _admission_controllers:
+        get_admission_controller(settings)
+    return list(_admission_controllers.values())
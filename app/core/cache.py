@@ -0,0 +1,369 @@
+"""
+Maestro AI Server - LLM 结果缓存
+按 (图像内容哈希, 归一化断言/查询, Prompt 版本, 模型) 寻址，相同截图的重复断言直接返回
+支持进程内内存缓存和同机多 worker 共享的 SQLite 持久化缓存
+@author LJY
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import structlog
+
+from app.config import Settings, get_settings
+
+logger = structlog.get_logger()
+
+
+def normalize_text(text: str | None) -> str:
+    """归一化断言/查询文本: 去除首尾空白并合并连续空白"""
+    if not text:
+        return ""
+    return " ".join(text.split())
+
+
+def make_cache_key(namespace: str, content_hash: str, text: str | None) -> str:
+    """
+    生成缓存键
+    namespace 由 Agent 提供，包含 Agent 类型、Prompt 版本和模型名称
+    """
+    raw = "\x00".join((namespace, content_hash, normalize_text(text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _serialize(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class ResultCache(ABC):
+    """结果缓存接口，值需可 JSON 序列化"""
+    
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        """读取缓存，未命中或已过期返回 None"""
+    
+    @abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        """写入缓存"""
+    
+    @abstractmethod
+    def stats(self) -> dict:
+        """缓存统计"""
+    
+    async def warm_up(self) -> int:
+        """启动预热，返回加载的条目数"""
+        return 0
+    
+    async def close(self) -> None:
+        """释放资源"""
+
+
+class MemoryResultCache(ResultCache):
+    """
+    进程内 LLM 结果缓存
+    
+    - LRU 淘汰，同时受条目数和序列化后总字节数限制
+    - 每个条目有 TTL，过期后在读取时删除
+    - 值以 JSON 序列化存储，读取方拿到的是独立副本
+    """
+    
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    async def get(self, key: str) -> Any | None:
+        """读取缓存，未命中或已过期返回 None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return json.loads(payload)
+    
+    async def set(self, key: str, value: Any) -> None:
+        """写入缓存，超出限制时按 LRU 淘汰"""
+        self.put_serialized(key, _serialize(value), self.ttl)
+    
+    def put_serialized(self, key: str, payload: bytes, ttl: float) -> None:
+        """写入已序列化的值"""
+        if len(payload) > self.max_bytes or ttl <= 0:
+            return
+        
+        if key in self._entries:
+            self._remove(key)
+        
+        self._entries[key] = (time.monotonic() + ttl, payload)
+        self._bytes += len(payload)
+        
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def stats(self) -> dict:
+        """缓存统计"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+    
+    def _remove(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+
+class SQLiteResultCache(ResultCache):
+    """
+    SQLite 持久化结果缓存
+    
+    - WAL 模式，同机多个 uvicorn worker 共享同一个数据库文件，重启/发布后结果仍然有效
+    - 前置一层进程内 MemoryResultCache，热点结果不必每次查询数据库
+    - 超出条目数/字节数时按最近访问时间淘汰，过期条目在读取和淘汰时删除
+    - 条目数和总字节数由触发器维护在 results_totals 中 (多个 worker 共享)，写入时不必扫描全表
+    - 数据库操作在专用线程中串行执行，不阻塞事件循环
+    """
+    
+    _SCHEMA = """
+        BEGIN IMMEDIATE;
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_accessed_at ON results (accessed_at);
+        CREATE INDEX IF NOT EXISTS idx_results_expires_at ON results (expires_at);
+        CREATE TABLE IF NOT EXISTS results_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            entries INTEGER NOT NULL,
+            bytes INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO results_totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM results;
+        CREATE TRIGGER IF NOT EXISTS results_totals_insert AFTER INSERT ON results BEGIN
+            UPDATE results_totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS results_totals_update AFTER UPDATE OF size ON results BEGIN
+            UPDATE results_totals SET bytes = bytes + new.size - old.size WHERE id = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS results_totals_delete AFTER DELETE ON results BEGIN
+            UPDATE results_totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 0;
+        END;
+        COMMIT;
+    """
+    
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: float = 3600.0,
+        memory: MemoryResultCache | None = None
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache")
+        self._conn: sqlite3.Connection | None = None
+    
+    async def get(self, key: str) -> Any | None:
+        if self.memory is not None:
+            value = await self.memory.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+        
+        row = await self._run(self._get, key)
+        if row is None:
+            self.misses += 1
+            return None
+        
+        payload, expires_at = row
+        if self.memory is not None:
+            self.memory.put_serialized(key, payload, expires_at - time.time())
+        self.hits += 1
+        return json.loads(payload)
+    
+    async def set(self, key: str, value: Any) -> None:
+        payload = _serialize(value)
+        if self.memory is not None:
+            self.memory.put_serialized(key, payload, self.ttl)
+        await self._run(self._set, key, payload)
+    
+    async def warm_up(self) -> int:
+        """把最近访问的未过期结果加载进内存层"""
+        if self.memory is None:
+            await self._run(self._connect)
+            return 0
+        rows = await self._run(self._recent, self.memory.max_entries)
+        now = time.time()
+        # 按访问时间从旧到新写入，保持内存层的 LRU 顺序
+        for key, payload, expires_at in reversed(rows):
+            self.memory.put_serialized(key, payload, expires_at - now)
+        logger.info("result_cache_warm_up", path=str(self.path), loaded=len(rows))
+        return len(rows)
+    
+    async def close(self) -> None:
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        stats = {
+            "backend": "sqlite",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        if self.memory is not None:
+            stats["memory"] = self.memory.stats()
+        return stats
+    
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    def _get(self, key: str) -> tuple[bytes, float] | None:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM results WHERE key = ? AND expires_at < ?", (key, now))
+            return None
+        conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+    
+    def _set(self, key: str, payload: bytes) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT INTO results (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+            (key, payload, len(payload), now + self.ttl, now),
+        )
+        self._evict(conn, now)
+    
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """删除过期条目，再按最近访问时间淘汰超出限制的条目"""
+        self.evictions += conn.execute("DELETE FROM results WHERE expires_at < ?", (now,)).rowcount
+        
+        count, total = self._totals()
+        excess_entries = count - self.max_entries
+        excess_bytes = total - self.max_bytes
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+        
+        # 从最久未访问的条目开始，淘汰到条目数和字节数都回到限制以内
+        victims = []
+        freed = 0
+        cursor = conn.execute("SELECT key, size FROM results ORDER BY accessed_at")
+        for key, size in cursor:
+            if len(victims) >= excess_entries and freed >= excess_bytes:
+                break
+            victims.append(key)
+            freed += size
+        cursor.close()
+        self.evictions += conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT value FROM json_each(?))",
+            (json.dumps(victims),),
+        ).rowcount
+    
+    def _totals(self) -> tuple[int, int]:
+        """条目数和总字节数"""
+        return self._connect().execute("SELECT entries, bytes FROM results_totals WHERE id = 0").fetchone()
+    
+    def _recent(self, limit: int) -> list[tuple[str, bytes, float]]:
+        conn = self._connect()
+        return conn.execute(
+            "SELECT key, value, expires_at FROM results WHERE expires_at >= ? ORDER BY accessed_at DESC LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+    
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# 缓存单例
+_result_cache: ResultCache | None = None
+
+
+def create_result_cache(settings: Settings) -> ResultCache:
+    """按配置创建结果缓存后端"""
+    memory = MemoryResultCache(
+        max_entries=settings.result_cache_max_entries,
+        max_bytes=settings.result_cache_max_bytes,
+        ttl=settings.result_cache_ttl,
+    )
+    if settings.result_cache_backend == "sqlite":
+        return SQLiteResultCache(
+            path=settings.result_cache_sqlite_path,
+            max_entries=settings.result_cache_sqlite_max_entries,
+            max_bytes=settings.result_cache_sqlite_max_bytes,
+            ttl=settings.result_cache_ttl,
+            memory=memory,
+        )
+    return memory
+
+
+def get_result_cache(settings: Settings | None = None) -> ResultCache | None:
+    """获取结果缓存单例，未启用时返回 None"""
+    global _result_cache
+    if settings is None:
+        settings = get_settings()
+    if not settings.result_cache_enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = create_result_cache(settings)
+    return _result_cache
+
+
+async def close_result_cache() -> None:
+    """关闭结果缓存单例"""
+    global _result_cache
+    if _result_cache is not None:
+        await _result_cache.close()
+        _result_cache = None
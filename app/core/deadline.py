@@ -0,0 +1,82 @@
+"""
+Maestro AI Server - 请求截止时间
+每个请求的截止时间取自 X-Request-Timeout 请求头 (秒)，没有时使用端点的默认值。
+截止时间中间件在截止时间到达或客户端断开时取消请求处理任务，进行中的 LLM 调用
+(包括发往提供商的 HTTP 请求) 随之取消，并记录取消原因
+@author LJY
+"""
+
+import math
+import time
+from contextvars import ContextVar, Token
+
+from app.config import Settings, get_settings
+
+# 客户端指定截止时间的请求头 (秒)
+DEADLINE_HEADER = b"x-request-timeout"
+
+# 取消原因
+CANCEL_DISCONNECT = "disconnect"
+CANCEL_DEADLINE = "deadline"
+# 不是请求被取消 (对冲请求中输掉的一方、服务关闭等)
+CANCEL_SUPERSEDED = "superseded"
+
+
+class RequestDeadline:
+    """单个请求的截止时间和取消原因，timeout 为 None 表示没有截止时间"""
+    
+    def __init__(self, timeout: float | None):
+        self.timeout = timeout
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+        self.cancel_reason: str | None = None
+    
+    def remaining(self) -> float | None:
+        """距截止时间的秒数，没有截止时间时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+# 当前请求的截止时间，由截止时间中间件设置，请求处理中创建的子任务继承
+_current: ContextVar[RequestDeadline | None] = ContextVar("request_deadline", default=None)
+
+
+def set_deadline(deadline: RequestDeadline) -> Token:
+    return _current.set(deadline)
+
+
+def reset_deadline(token: Token) -> None:
+    _current.reset(token)
+
+
+def current_deadline() -> RequestDeadline | None:
+    return _current.get()
+
+
+def cancel_reason() -> str:
+    """当前任务被取消的原因: disconnect / deadline / superseded"""
+    deadline = _current.get()
+    if deadline is None or deadline.cancel_reason is None:
+        return CANCEL_SUPERSEDED
+    return deadline.cancel_reason
+
+
+def parse_timeout(value: str) -> float | None:
+    """解析 X-Request-Timeout 请求头，无效或非正数时返回 None"""
+    try:
+        timeout = float(value)
+    except ValueError:
+        return None
+    if not math.isfinite(timeout) or timeout <= 0:
+        return None
+    return timeout
+
+
+def resolve_timeout(path: str, header: str | None, settings: Settings | None = None) -> float | None:
+    """请求的截止时间: 请求头 (不超过 request_max_timeout) 优先，其次是端点默认值"""
+    if settings is None:
+        settings = get_settings()
+    timeout = parse_timeout(header) if header is not None else None
+    if timeout is not None:
+        return min(timeout, settings.request_max_timeout)
+    return settings.request_timeouts.get(path)
@@ -0,0 +1,117 @@
+"""
+Maestro AI Server - 图像处理执行器
+将 Pillow 等 CPU 密集型图像处理移出事件循环，在有界线程池/进程池中执行
+@author LJY
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+import structlog
+
+from app.config import Settings, get_settings
+from app.core import OverloadedError
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+
+def _timed_call(fn: Callable[..., T], *args: Any) -> tuple[T, float, float]:
+    """在工作线程/进程中执行任务，并返回开始和结束时刻用于统计排队与执行耗时"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter()
+
+
+class ImageExecutor:
+    """
+    图像处理执行器
+    
+    - kind="thread": 线程池，Pillow 的解码/缩放/编码会释放 GIL，可以多核并行
+    - kind="process": 进程池，任务函数和参数需可 pickle
+    - 正在排队和执行的任务总数超过 max_workers + queue_size 时直接拒绝，避免请求无限堆积
+    """
+    
+    def __init__(self, kind: str = "thread", max_workers: int = 0, queue_size: int = 32):
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = self.max_workers + queue_size
+        self._pending = 0
+        self._pool: Executor = (
+            ProcessPoolExecutor(max_workers=self.max_workers)
+            if kind == "process"
+            else ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image")
+        )
+    
+    @property
+    def pending(self) -> int:
+        """正在排队和执行的任务数"""
+        return self._pending
+    
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """在池中执行任务，事件循环只等待结果"""
+        if self._pending >= self.max_pending:
+            raise OverloadedError(f"图像处理队列已满 ({self._pending}/{self.max_pending})")
+        
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        future = self._pool.submit(_timed_call, fn, *args)
+        self._pending += 1
+        # 名额在池中的任务结束时归还: 等待方被取消时已开始的任务仍会执行完，不能提前归还。
+        # 先于 wrap_future 注册，等待方恢复时名额已经归还
+        future.add_done_callback(lambda _: self._release(loop))
+        result, started, finished = await asyncio.wrap_future(future)
+        
+        logger.debug(
+            "image_task_complete",
+            task=getattr(fn, "__name__", str(fn)),
+            queue_ms=round((started - submitted) * 1000, 2),
+            run_ms=round((finished - started) * 1000, 2),
+            pending=self._pending,
+        )
+        return result
+    
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        """池中的任务结束 (完成、失败或排队时被取消)，在事件循环中归还名额"""
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # 事件循环已关闭
+            self._pending -= 1
+    
+    def _decrement(self) -> None:
+        self._pending -= 1
+    
+    def shutdown(self) -> None:
+        """关闭执行器"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 执行器单例
+_image_executor: ImageExecutor | None = None
+
+
+def get_image_executor(settings: Settings | None = None) -> ImageExecutor:
+    """获取图像处理执行器单例"""
+    global _image_executor
+    if _image_executor is None:
+        if settings is None:
+            settings = get_settings()
+        _image_executor = ImageExecutor(
+            kind=settings.image_executor,
+            max_workers=settings.image_executor_workers,
+            queue_size=settings.image_executor_queue_size,
+        )
+    return _image_executor
+
+
+def shutdown_image_executor() -> None:
+    """关闭图像处理执行器单例"""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown()
+        _image_executor = None
@@ -0,0 +1,214 @@
+"""
+Maestro AI Server - 共享 HTTP 客户端
+所有 LLM 客户端共用一个带连接池的 httpx.AsyncClient，由应用 lifespan 创建和关闭，
+稳态调用复用已建立的连接，跳过 DNS / TCP / TLS 握手
+@author LJY
+"""
+
+import asyncio
+import importlib.util
+import time
+from typing import Any
+
+import httpx
+import structlog
+
+from app.config import LLMProvider, Settings, get_settings
+from app.core.metrics import LLM_HTTP_ERRORS, record_provider_request
+
+logger = structlog.get_logger()
+
+# HTTP/2 需要可选依赖 h2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ConnectionStats:
+    """
+    连接复用统计
+    
+    通过 httpcore 的 trace 扩展观察每个请求: 发送请求头前新建了 TCP 连接的记为新连接，
+    否则记为复用已有连接 (HTTP/2 同一连接上的多路复用也算复用)。
+    LLM 调用 (POST) 同时记录提供商耗时 (发送请求头到收到响应头)、SDK 重试和错误响应的指标
+    """
+    
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+        self.connect_seconds = 0.0
+        self.keep_warm_pings = 0
+        self.keep_warm_failures = 0
+    
+    async def on_request(self, request: httpx.Request) -> None:
+        """httpx 请求事件钩子，为每个请求挂上 trace 回调"""
+        started: dict[str, float] = {}
+        # 保温请求 (GET) 不计入提供商指标
+        llm_call = request.method == "POST"
+        
+        async def trace(event: str, info: dict[str, Any]) -> None:
+            if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+                started[event] = time.perf_counter()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                if event == "connection.connect_tcp.complete":
+                    self.new_connections += 1
+                else:
+                    self.tls_handshakes += 1
+                begin = started.pop(event.replace(".complete", ".started"), None)
+                if begin is not None:
+                    self.connect_seconds += time.perf_counter() - begin
+            elif event.endswith(".send_request_headers.started"):
+                self.requests += 1
+                started["request"] = time.perf_counter()
+                if event.startswith("http2."):
+                    self.http2_requests += 1
+            elif llm_call and event.endswith(".receive_response_headers.complete"):
+                begin = started.pop("request", None)
+                if begin is not None:
+                    record_provider_request(time.perf_counter() - begin)
+        
+        request.extensions["trace"] = trace
+    
+    async def on_response(self, response: httpx.Response) -> None:
+        """httpx 响应事件钩子，统计 LLM 提供商的错误响应"""
+        if response.status_code >= 400:
+            LLM_HTTP_ERRORS.labels(host=response.request.url.host, status=response.status_code).inc()
+    
+    def snapshot(self) -> dict:
+        reused = max(0, self.requests - self.new_connections)
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_requests": self.http2_requests,
+            "connect_seconds": round(self.connect_seconds, 4),
+            "keep_warm_pings": self.keep_warm_pings,
+            "keep_warm_failures": self.keep_warm_failures,
+        }
+
+
+def create_http_client(settings: Settings | None = None, stats: ConnectionStats | None = None) -> httpx.AsyncClient:
+    """
+    创建带连接池的 httpx.AsyncClient
+    
+    未安装 h2 时即使开启 llm_http2 也只使用 HTTP/1.1
+    """
+    if settings is None:
+        settings = get_settings()
+    
+    http2 = settings.llm_http2 and HTTP2_AVAILABLE
+    if settings.llm_http2 and not HTTP2_AVAILABLE:
+        logger.warning("http2_unavailable", reason="h2 未安装，回退到 HTTP/1.1")
+    
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.llm_http_max_connections,
+            max_keepalive_connections=settings.llm_http_max_keepalive,
+            keepalive_expiry=settings.llm_http_keepalive_expiry,
+        ),
+        # 超时由 ChatOpenAI 按请求传入，这里只作兜底
+        timeout=httpx.Timeout(600.0, connect=10.0),
+        event_hooks={"request": [stats.on_request], "response": [stats.on_response]} if stats is not None else None,
+    )
+
+
+def keep_warm_targets(settings: Settings) -> list[tuple[str, str]]:
+    """需要保温的后端 (base_url, api_key) 列表，与 create_llm_backends 的后端一致"""
+    if settings.llm_backends:
+        return [(config.base_url, config.api_key) for config in settings.llm_backends]
+    if settings.llm_provider == LLMProvider.KIMI:
+        return [(settings.kimi_api_base, settings.kimi_api_key)]
+    return [(settings.openai_api_base, settings.openai_api_key)]
+
+
+class SharedHTTPClient:
+    """
+    共享 HTTP 客户端及其保温任务
+    
+    keep_warm_interval > 0 时启动后立即、之后每隔该秒数向每个后端发一次轻量请求
+    (GET {base_url}/models)，让连接池中始终有已握手的空闲连接；间隔应小于 keepalive_expiry
+    """
+    
+    def __init__(self, settings: Settings | None = None):
+        self.settings = settings or get_settings()
+        self.stats = ConnectionStats()
+        self.client = create_http_client(self.settings, self.stats)
+        self._keep_warm_task: asyncio.Task | None = None
+    
+    @property
+    def http2(self) -> bool:
+        return self.settings.llm_http2 and HTTP2_AVAILABLE
+    
+    def start(self) -> None:
+        """启动保温任务 (需要在事件循环中调用)"""
+        interval = self.settings.llm_keep_warm_interval
+        if interval > 0 and self._keep_warm_task is None:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm(interval))
+    
+    async def ping(self) -> None:
+        """向每个后端发一次保温请求，失败只记录不抛出"""
+        
+        async def ping_one(base_url: str, api_key: str) -> None:
+            try:
+                await self.client.get(
+                    f"{base_url.rstrip('/')}/models",
+                    headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+                    timeout=10.0,
+                )
+                self.stats.keep_warm_pings += 1
+            except httpx.HTTPError as e:
+                self.stats.keep_warm_failures += 1
+                logger.debug("keep_warm_failed", base_url=base_url, error=str(e))
+        
+        await asyncio.gather(*(ping_one(*target) for target in keep_warm_targets(self.settings)))
+    
+    async def _keep_warm(self, interval: float) -> None:
+        while True:
+            await self.ping()
+            await asyncio.sleep(interval)
+    
+    async def close(self) -> None:
+        """停止保温任务并关闭连接池"""
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+        await self.client.aclose()
+
+
+# 共享客户端单例
+_shared_http_client: SharedHTTPClient | None = None
+
+
+def get_shared_http_client(settings: Settings | None = None) -> SharedHTTPClient:
+    """获取共享 HTTP 客户端单例"""
+    global _shared_http_client
+    if _shared_http_client is None:
+        _shared_http_client = SharedHTTPClient(settings)
+    return _shared_http_client
+
+
+def get_http_client(settings: Settings | None = None) -> httpx.AsyncClient:
+    """获取注入 ChatOpenAI 的共享 httpx.AsyncClient"""
+    return get_shared_http_client(settings).client
+
+
+def get_http_client_stats() -> dict:
+    """共享 HTTP 客户端的连接复用统计"""
+    if _shared_http_client is None:
+        return {"http2": False, **ConnectionStats().snapshot()}
+    return {"http2": _shared_http_client.http2, **_shared_http_client.stats.snapshot()}
+
+
+async def close_http_client() -> None:
+    """关闭共享 HTTP 客户端单例"""
+    global _shared_http_client
+    if _shared_http_client is not None:
+        await _shared_http_client.close()
+        _shared_http_client = None
@@ -1,19 +1,29 @@
 """
 Maestro AI Server - LLM 客户端工厂
-支持 Kimi 和 OpenAI
+支持 Kimi、OpenAI 以及任意 OpenAI 兼容的后端
+langchain_openai 导入较慢，推迟到第一次创建客户端时导入
 @author LJY
 """
 
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING
 
 from app.config import LLMProvider, Settings, get_settings
+from app.core.http import get_http_client
+from app.core.resilience import CircuitBreaker, RetryBudget
+from app.core.router import LLMBackend, LLMRouter
 
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
-def create_llm_client(settings: Settings | None = None) -> ChatOpenAI:
+
+def create_llm_client(settings: Settings | None = None) -> "ChatOpenAI":
     """
     创建 LLM 客户端
-    Kimi API 兼容 OpenAI 格式，使用 ChatOpenAI 配合自定义 base_url
+    Kimi API 兼容 OpenAI 格式，使用 ChatOpenAI 配合自定义 base_url，
+    HTTP 请求走共享连接池；重试由路由层按退避策略和重试预算统一处理，SDK 不再自动重试
     """
+    from langchain_openai import ChatOpenAI
+    
     if settings is None:
         settings = get_settings()
     
@@ -22,12 +32,102 @@ def create_llm_client(settings: Settings | None = None) -> ChatOpenAI:
             model=settings.kimi_model,
             api_key=settings.kimi_api_key,
             base_url=settings.kimi_api_base,
-            max_retries=settings.max_retries,
+            max_retries=0,
+            http_async_client=get_http_client(settings),
         )
     else:
         return ChatOpenAI(
             model=settings.openai_model,
             api_key=settings.openai_api_key,
             base_url=settings.openai_api_base,
+            max_retries=0,
+            http_async_client=get_http_client(settings),
+        )
+
+
+def create_circuit_breaker(settings: Settings, name: str) -> CircuitBreaker:
+    """按配置创建后端的熔断器"""
+    return CircuitBreaker(
+        name,
+        failure_threshold=settings.circuit_breaker_failure_threshold,
+        recovery_timeout=settings.circuit_breaker_recovery_timeout,
+    )
+
+
+def create_llm_backends(settings: Settings | None = None) -> list[LLMBackend]:
+    """
+    创建 LLM 后端列表
+    未配置 llm_backends 时只有 llm_provider 对应的一个后端
+    """
+    if settings is None:
+        settings = get_settings()
+    
+    if not settings.llm_backends:
+        return [LLMBackend(
+            settings.llm_provider.value,
+            create_llm_client(settings),
+            alpha=settings.llm_router_ewma_alpha,
+            error_half_life=settings.llm_router_error_half_life,
+            breaker=create_circuit_breaker(settings, settings.llm_provider.value),
+        )]
+    
+    from langchain_openai import ChatOpenAI
+    
+    return [
+        LLMBackend(
+            config.name,
+            ChatOpenAI(
+                model=config.model,
+                api_key=config.api_key,
+                base_url=config.base_url,
+                max_retries=0,
+                http_async_client=get_http_client(settings),
+            ),
+            weight=config.weight,
+            alpha=settings.llm_router_ewma_alpha,
+            error_half_life=settings.llm_router_error_half_life,
+            breaker=create_circuit_breaker(settings, config.name),
+        )
+        for config in settings.llm_backends
+    ]
+
+
+# 路由单例
+_llm_router: LLMRouter | None = None
+
+
+def get_llm_router(settings: Settings | None = None) -> LLMRouter:
+    """获取 LLM 路由单例"""
+    global _llm_router
+    if _llm_router is None:
+        if settings is None:
+            settings = get_settings()
+        _llm_router = LLMRouter(
+            create_llm_backends(settings),
+            hedge_enabled=settings.llm_hedge_enabled,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_delay=settings.llm_hedge_min_delay,
             max_retries=settings.max_retries,
+            retry_initial_delay=settings.retry_initial_delay,
+            retry_backoff_factor=settings.retry_backoff_factor,
+            retry_max_delay=settings.retry_max_delay,
+            retry_budget=RetryBudget(
+                ratio=settings.retry_budget_ratio,
+                min_retries=settings.retry_budget_min_retries,
+                window=settings.retry_budget_window,
+            ),
         )
+    return _llm_router
+
+
+def reset_llm_router() -> None:
+    """丢弃 LLM 路由单例: 其中的客户端绑定已关闭的共享 HTTP 客户端，下次使用时按新的连接池重新创建"""
+    global _llm_router
+    _llm_router = None
+
+
+def get_llm_router_stats() -> dict | None:
+    """LLM 路由统计，路由尚未创建时返回 None"""
+    if _llm_router is None:
+        return None
+    return _llm_router.stats()
@@ -0,0 +1,242 @@
+"""
+Maestro AI Server - 日志配置
+按 Settings.log_level 过滤日志，两种输出模式:
+
+- console: 彩色控制台输出，直接打印到 stdout (开发环境)
+- json: 每条日志渲染为一行 JSON (安装 orjson 时使用 orjson)，放入有界队列，由后台线程批量写入 stdout；
+  队列已满时丢弃新日志并计数，事件循环从不等待日志 I/O
+@author LJY
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from typing import Any, BinaryIO
+
+import structlog
+
+from app.config import Settings, get_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装时使用标准库 json
+    orjson = None
+
+
+def _dumps(event: dict, **kwargs: Any) -> bytes:
+    """JSON 序列化，无法序列化的值转为字符串"""
+    if orjson is not None:
+        return orjson.dumps(event, default=str)
+    return json.dumps(event, default=str, ensure_ascii=False).encode("utf-8")
+
+
+class LogSink:
+    """
+    后台批量写日志
+    
+    - write 只把渲染好的一行放入有界队列，队列已满时丢弃并计数
+    - 写线程每次取出最多 batch_size 条，一次 write + flush 写出；
+      有日志被丢弃时在下一批中写一条 log_records_dropped 记录 (report_dropped=False 时只计数)
+    """
+    
+    def __init__(
+        self,
+        stream: BinaryIO | None = None,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.2,
+        report_dropped: bool = True,
+        name: str = "log-sink"
+    ):
+        self.stream = stream or sys.stdout.buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.report_dropped = report_dropped
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._reported_dropped = 0
+        self._closed = False
+        self._queue: queue.Queue[bytes | None] = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def write(self, line: bytes) -> None:
+        if self._closed:
+            # 写线程已停止 (关闭之后的少量日志)，直接同步写出
+            self._flush([line])
+            return
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+    
+    def close(self, timeout: float = 2.0) -> None:
+        """写出队列中剩余的日志并停止写线程"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+    
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+    
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._report_dropped([])
+                continue
+            
+            batch = []
+            stop = first is None
+            if not stop:
+                batch.append(first)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    line = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if line is None:
+                    stop = True
+                else:
+                    batch.append(line)
+            
+            self._report_dropped(batch)
+            if batch:
+                self._flush(batch)
+            if stop:
+                return
+    
+    def _report_dropped(self, batch: list[bytes]) -> None:
+        dropped = self.dropped
+        if not self.report_dropped or dropped == self._reported_dropped:
+            return
+        record = {
+            "event": "log_records_dropped",
+            "level": "warning",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "dropped": dropped - self._reported_dropped,
+            "dropped_total": dropped,
+        }
+        self._reported_dropped = dropped
+        batch.append(_dumps(record))
+        if len(batch) == 1:
+            self._flush(batch)
+    
+    def _flush(self, batch: list[bytes]) -> None:
+        try:
+            self.stream.write(b"\n".join(batch) + b"\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            # stdout 已关闭 (进程退出中)，丢弃这一批
+            self.dropped += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+
+class SinkLogger:
+    """structlog 底层 logger，把渲染好的日志行交给 LogSink"""
+    
+    def __init__(self, sink: LogSink):
+        self._sink = sink
+    
+    def msg(self, message: bytes | str) -> None:
+        self._sink.write(message if isinstance(message, bytes) else message.encode("utf-8"))
+    
+    log = debug = info = warn = warning = error = critical = exception = fatal = msg
+
+
+class SinkLoggerFactory:
+    def __init__(self, sink: LogSink):
+        self._logger = SinkLogger(sink)
+    
+    def __call__(self, *args: Any) -> SinkLogger:
+        return self._logger
+
+
+def parse_log_level(level: str) -> int:
+    """日志级别名称 (DEBUG / INFO / WARNING / ERROR / CRITICAL) 转为数值，无法识别时为 INFO"""
+    value = logging.getLevelName(level.strip().upper())
+    return value if isinstance(value, int) else logging.INFO
+
+
+# 日志写入单例 (仅 json 模式)
+_log_sink: LogSink | None = None
+
+
+def configure_logging(settings: Settings | None = None) -> None:
+    """按配置设置 structlog，重复调用时替换之前的配置"""
+    global _log_sink
+    if settings is None:
+        settings = get_settings()
+    
+    shared = [
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+    ]
+    if settings.log_format == "json":
+        if _log_sink is None:
+            _log_sink = LogSink(
+                max_queue=settings.log_queue_size,
+                batch_size=settings.log_batch_size,
+            )
+            atexit.register(close_log_sink)
+        processors = [
+            *shared,
+            structlog.processors.TimeStamper(fmt="iso", utc=True),
+            structlog.processors.dict_tracebacks,
+            structlog.processors.JSONRenderer(serializer=_dumps),
+        ]
+        logger_factory = SinkLoggerFactory(_log_sink)
+    else:
+        processors = [
+            *shared,
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+            structlog.dev.ConsoleRenderer(),  # 开发环境使用彩色输出
+        ]
+        logger_factory = structlog.PrintLoggerFactory()  # 直接打印到 stdout
+    
+    structlog.configure(
+        processors=processors,
+        wrapper_class=structlog.make_filtering_bound_logger(parse_log_level(settings.log_level)),
+        context_class=dict,
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
+
+
+def get_log_sink() -> LogSink | None:
+    """json 模式下的日志写入单例，其他写 stdout 的组件共用它以免输出交错"""
+    return _log_sink
+
+
+def get_log_stats() -> dict | None:
+    """后台写日志统计，console 模式返回 None"""
+    return _log_sink.stats() if _log_sink is not None else None
+
+
+def close_log_sink() -> None:
+    """写出剩余日志并停止写线程"""
+    global _log_sink
+    if _log_sink is not None:
+        _log_sink.close()
+        _log_sink = None
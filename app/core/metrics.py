@@ -0,0 +1,454 @@
+"""
+Maestro AI Server - Prometheus 指标
+进程内的最小指标注册表 (Counter / Gauge / Histogram)，按 Prometheus 文本格式 0.0.4 输出。
+热路径上的记录只有一次字典查找和几次加法；缓存、准入、路由、连接池等组件已有的统计在抓取时读取，
+不在请求路径上重复计数
+@author LJY
+"""
+
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Iterable, Iterator
+
+from app.core.tracing import record_span, span
+
+# 默认的耗时分桶 (秒)，覆盖毫秒级的图像处理到分钟级的 LLM 调用
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Value:
+    """Counter / Gauge 的单个时间序列"""
+    
+    __slots__ = ("value",)
+    
+    def __init__(self):
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+    
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+    
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramValue:
+    """Histogram 的单个时间序列，counts 按桶分别计数，输出时再累加"""
+    
+    __slots__ = ("bounds", "counts", "sum")
+    
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """
+    指标基类
+    
+    labels(**values) 返回对应标签组合的时间序列，没有标签的指标直接在指标对象上记录。
+    只在事件循环线程中记录，不加锁
+    """
+    
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._series[()] = self._new_series()
+    
+    def _new_series(self) -> Any:
+        return _Value()
+    
+    def labels(self, **values: Any) -> Any:
+        key = tuple(str(values[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = self._new_series()
+        return series
+    
+    def value(self, **values: Any) -> float:
+        """当前值 (测试和调试用)"""
+        return self.labels(**values).value
+    
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, series in self._series.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.value)}"
+
+
+class Counter(Metric):
+    """单调递增的计数器，名称以 _total 结尾"""
+    
+    kind = "counter"
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self._series[()].inc(amount)
+
+
+class Gauge(Metric):
+    """可增可减的瞬时值"""
+    
+    kind = "gauge"
+    
+    def inc(self, amount: float = 1.0) -> None:
+        self._series[()].inc(amount)
+    
+    def dec(self, amount: float = 1.0) -> None:
+        self._series[()].dec(amount)
+    
+    def set(self, value: float) -> None:
+        self._series[()].set(value)
+
+
+class Histogram(Metric):
+    """分桶直方图，输出累计的 _bucket、_sum 和 _count"""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+    
+    def _new_series(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+    
+    def observe(self, value: float) -> None:
+        self._series[()].observe(value)
+    
+    def count(self, **values: Any) -> int:
+        """观测次数 (测试和调试用)"""
+        return sum(self.labels(**values).counts)
+    
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        names = self.labelnames + ("le",)
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), series.counts):
+                cumulative += count
+                labels = _format_labels(names, (*key, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    
+    - counter / gauge / histogram 注册在请求路径上直接记录的指标
+    - register_collector 注册抓取时调用的函数，返回按组件已有统计临时构造的指标
+    """
+    
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], Iterable[Metric]]] = []
+    
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def register_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        self._collectors.append(collector)
+    
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "maestro_http_requests_total", "HTTP 请求数", ("method", "endpoint", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "maestro_http_request_duration_seconds", "HTTP 请求耗时 (秒)", ("method", "endpoint")
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge("maestro_http_requests_in_flight", "正在处理的 HTTP 请求数")
+SCREEN_BYTES_IN_FLIGHT = REGISTRY.gauge("maestro_screen_bytes_in_flight", "正在处理的请求持有的截图字节数")
+STAGE_DURATION = REGISTRY.histogram(
+    "maestro_stage_duration_seconds", "请求处理各阶段耗时 (秒)", ("endpoint", "stage")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "maestro_llm_tokens_total", "LLM token 用量，kind 为 prompt / completion / cached", ("endpoint", "model", "kind")
+)
+LLM_BACKEND_FAILURES = REGISTRY.counter(
+    "maestro_llm_backend_failures_total", "LLM 后端调用失败次数 (路由层，含故障转移前的失败)", ("backend", "error")
+)
+LLM_HTTP_ERRORS = REGISTRY.counter(
+    "maestro_llm_http_errors_total", "LLM 提供商返回的 HTTP 错误响应数", ("host", "status")
+)
+LLM_RETRIES = REGISTRY.counter(
+    "maestro_llm_retries_total", "路由层按退避策略重试的 LLM 调用数 (OpenAI SDK 重试已关闭)", ("backend",)
+)
+LLM_RETRIES_DENIED = REGISTRY.counter(
+    "maestro_llm_retries_denied_total", "重试预算用尽而放弃的 LLM 重试次数", ("backend",)
+)
+REQUESTS_CANCELLED = REGISTRY.counter(
+    "maestro_requests_cancelled_total", "客户端断开或超过截止时间而取消的请求数", ("endpoint", "reason")
+)
+LLM_CALLS_CANCELLED = REGISTRY.counter(
+    "maestro_llm_calls_cancelled_total", "完成前被取消的 LLM 调用数 (含排队中)", ("endpoint", "backend", "reason")
+)
+LLM_TOKENS_SAVED = REGISTRY.counter(
+    "maestro_llm_tokens_saved_total", "取消 LLM 调用节省的 token 数 (按单次调用预估用量计)", ("endpoint", "backend", "reason")
+)
+
+# 当前请求的端点 (路由路径)，由指标中间件设置，阶段耗时和 token 用量按端点区分
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="")
+
+# 当前 Agent 调用内 LLM HTTP 请求的耗时，用于从 ainvoke 总耗时中扣除提供商耗时
+_provider_seconds: ContextVar[list[float] | None] = ContextVar("metrics_provider_seconds", default=None)
+
+
+def set_endpoint(endpoint: str) -> Token:
+    return _endpoint.set(endpoint)
+
+
+def reset_endpoint(token: Token) -> None:
+    _endpoint.reset(token)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """记录当前端点某个刚刚结束的处理阶段的耗时，同时补记为当前追踪的子 span"""
+    STAGE_DURATION.labels(endpoint=_endpoint.get(), stage=stage).observe(seconds)
+    record_span(stage, seconds)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """记录代码块耗时 (异常退出也记录)，代码块同时作为当前追踪的子 span"""
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        STAGE_DURATION.labels(endpoint=_endpoint.get(), stage=stage).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def hold_screen_bytes(size: int) -> Iterator[None]:
+    """代码块执行期间把截图字节数计入 maestro_screen_bytes_in_flight"""
+    SCREEN_BYTES_IN_FLIGHT.inc(size)
+    try:
+        yield
+    finally:
+        SCREEN_BYTES_IN_FLIGHT.dec(size)
+
+
+@contextmanager
+def track_provider_time() -> Iterator[list[float]]:
+    """收集代码块内 (包括其创建的子任务) 每次 LLM HTTP 请求的耗时"""
+    samples: list[float] = []
+    token = _provider_seconds.set(samples)
+    try:
+        yield samples
+    finally:
+        _provider_seconds.reset(token)
+
+
+def record_provider_request(seconds: float) -> None:
+    """记录一次 LLM HTTP 请求从发送请求头到收到响应头的耗时"""
+    observe_stage("llm_provider", seconds)
+    samples = _provider_seconds.get()
+    if samples is not None:
+        samples.append(seconds)
+
+
+def record_tokens(model: str, prompt: int, completion: int, cached: int) -> None:
+    """按当前端点和模型累计 token 用量"""
+    endpoint = _endpoint.get()
+    LLM_TOKENS.labels(endpoint=endpoint, model=model, kind="prompt").inc(prompt)
+    LLM_TOKENS.labels(endpoint=endpoint, model=model, kind="completion").inc(completion)
+    LLM_TOKENS.labels(endpoint=endpoint, model=model, kind="cached").inc(cached)
+
+
+def record_request_cancelled(reason: str) -> None:
+    """记录当前端点一个被取消的请求"""
+    REQUESTS_CANCELLED.labels(endpoint=_endpoint.get(), reason=reason).inc()
+
+
+def record_llm_cancelled(backend: str, reason: str, tokens: int) -> None:
+    """记录当前端点一次被取消的 LLM 调用及其预估节省的 token 数"""
+    endpoint = _endpoint.get()
+    LLM_CALLS_CANCELLED.labels(endpoint=endpoint, backend=backend, reason=reason).inc()
+    LLM_TOKENS_SAVED.labels(endpoint=endpoint, backend=backend, reason=reason).inc(tokens)
+
+
+def _gauge(name: str, documentation: str, value: float) -> Gauge:
+    gauge = Gauge(name, documentation)
+    gauge.set(value)
+    return gauge
+
+
+def _counter(name: str, documentation: str, value: float) -> Counter:
+    counter = Counter(name, documentation)
+    counter.inc(value)
+    return counter
+
+
+def collect_component_metrics() -> Iterator[Metric]:
+    """抓取时读取各组件已有的统计: 准入控制、LLM 路由、结果缓存、图像执行器、预检、日志队列、请求解压和连接池"""
+    from app.core.admission import get_admission_controllers
+    from app.core.cache import get_result_cache
+    from app.core.executor import get_image_executor
+    from app.core.http import get_http_client_stats
+    from app.core.logging import get_log_stats
+    from app.core.llm import get_llm_router_stats
+    from app.core.prechecks import get_prechecker
+    from app.core.resilience import STATE_VALUES
+    from app.middleware.decompression import get_decompression_stats
+    
+    admission = {
+        "active": Gauge("maestro_admission_active", "已获准正在调用 LLM 的请求数", ("provider",)),
+        "waiting": Gauge("maestro_admission_waiting", "排队等待调用 LLM 的请求数", ("provider",)),
+        "admitted": Counter("maestro_admission_admitted_total", "获准调用 LLM 的请求数", ("provider",)),
+        "rejected": Counter("maestro_admission_rejected_total", "排队已满或超时被拒绝的请求数", ("provider",)),
+        "rate_limited": Counter("maestro_admission_rate_limited_total", "因 RPM/TPM 限制被拒绝的请求数", ("provider",)),
+    }
+    for controller in get_admission_controllers():
+        stats = controller.stats()
+        for key, metric in admission.items():
+            metric.labels(provider=stats["provider"]).set(stats[key])
+    yield from admission.values()
+    
+    router = get_llm_router_stats()
+    if router is not None:
+        yield _counter("maestro_llm_hedges_total", "发出的对冲请求数", router["hedges"])
+        yield _counter("maestro_llm_hedge_wins_total", "对冲请求先于首选后端返回的次数", router["hedge_wins"])
+        yield _counter("maestro_llm_failovers_total", "故障转移到下一个后端的次数", router["failovers"])
+        yield _counter(
+            "maestro_llm_circuit_rejections_total", "所有后端均熔断而直接拒绝的调用数", router["circuit_rejections"]
+        )
+        budget = router["retry_budget"]
+        if budget is not None:
+            yield _gauge("maestro_llm_retry_budget_available", "当前窗口内剩余的重试预算", budget["available"])
+        backends = {
+            "in_flight": Gauge("maestro_llm_backend_in_flight", "后端正在进行的调用数", ("backend",)),
+            "calls": Counter("maestro_llm_backend_calls_total", "后端调用次数", ("backend",)),
+            "error_rate": Gauge("maestro_llm_backend_error_rate", "后端错误率 (指数加权)", ("backend",)),
+            "latency_ms": Gauge("maestro_llm_backend_latency_seconds", "后端调用耗时 (指数加权，秒)", ("backend",)),
+        }
+        circuit_state = Gauge(
+            "maestro_llm_circuit_state", "后端熔断器状态: 0 closed / 1 half_open / 2 open", ("backend",)
+        )
+        circuit_opened = Counter("maestro_llm_circuit_opened_total", "后端熔断器打开次数", ("backend",))
+        for stats in router["backends"]:
+            for key, metric in backends.items():
+                value = stats[key]
+                if key == "latency_ms":
+                    value = math.nan if value is None else value / 1000
+                metric.labels(backend=stats["name"]).set(value)
+            circuit_state.labels(backend=stats["name"]).set(STATE_VALUES[stats["circuit"]["state"]])
+            circuit_opened.labels(backend=stats["name"]).set(stats["circuit"]["opened"])
+        yield from backends.values()
+        yield circuit_state
+        yield circuit_opened
+    
+    cache = get_result_cache()
+    if cache is not None:
+        stats = cache.stats()
+        memory = stats.get("memory", stats)
+        yield _counter("maestro_result_cache_hits_total", "结果缓存命中次数", stats["hits"])
+        yield _counter("maestro_result_cache_misses_total", "结果缓存未命中次数", stats["misses"])
+        yield _counter("maestro_result_cache_evictions_total", "结果缓存淘汰次数", stats["evictions"])
+        if "bytes" in memory:
+            yield _gauge("maestro_result_cache_entries", "内存结果缓存条目数", memory["entries"])
+            yield _gauge("maestro_result_cache_bytes", "内存结果缓存持有的字节数", memory["bytes"])
+    
+    yield _gauge("maestro_image_executor_pending", "图像执行器中排队和执行的任务数", get_image_executor().pending)
+    
+    prechecker = get_prechecker()
+    if prechecker is not None:
+        stats = prechecker.stats()
+        yield _counter("maestro_precheck_runs_total", "执行的截图预检次数", stats["runs"])
+        hits = Counter("maestro_precheck_rule_hits_total", "预检规则命中次数", ("rule",))
+        for rule, counter in stats["rules"].items():
+            hits.labels(rule=rule).set(counter["hits"])
+        yield hits
+    
+    logs = get_log_stats()
+    if logs is not None:
+        yield _counter("maestro_log_records_written_total", "后台线程写出的日志条数", logs["written"])
+        yield _counter("maestro_log_records_dropped_total", "日志队列已满被丢弃的日志条数", logs["dropped"])
+        yield _gauge("maestro_log_queue_depth", "日志队列中等待写出的条数", logs["queued"])
+    
+    decompression = get_decompression_stats()
+    yield _counter(
+        "maestro_request_compressed_bytes_total", "压缩请求体的传输字节数", decompression["compressed_bytes"]
+    )
+    yield _counter(
+        "maestro_request_decompressed_bytes_total", "压缩请求体解压后的字节数", decompression["decompressed_bytes"]
+    )
+    
+    connections = get_http_client_stats()
+    yield _counter("maestro_llm_connection_requests_total", "共享 HTTP 客户端发出的请求数", connections["requests"])
+    yield _counter("maestro_llm_connections_opened_total", "新建的 TCP 连接数", connections["new_connections"])
+    yield _counter("maestro_llm_tls_handshakes_total", "TLS 握手次数", connections["tls_handshakes"])
+
+
+REGISTRY.register_collector(collect_component_metrics)
@@ -0,0 +1,208 @@
+"""
+Maestro AI Server - 截图本地预检
+在调用缺陷检测 Agent 之前用像素统计判断明显的情况: 全黑截图直接给出结论，
+内容很少的截图给 LLM 附加提示；纯色空白截图直接给出结论需要显式开启 (纯色启动页、空状态页面会被误判)
+@author LJY
+"""
+
+import time
+from abc import ABC, abstractmethod
+
+import structlog
+
+from app.config import Settings, get_settings
+from app.core import ImageProcessingError
+from app.core.executor import get_image_executor
+from app.schemas import Defect
+from app.utils.image import FrameStats, PreparedImage, compute_frame_stats
+
+logger = structlog.get_logger()
+
+
+class PrecheckOutcome:
+    """
+    单条规则的命中结果
+    
+    - defects: 不为 None 时直接作为检测结论返回，不再调用 LLM
+    - hint: 附加到用户提示词中的提示
+    """
+    
+    def __init__(self, defects: list[Defect] | None = None, hint: str | None = None):
+        self.defects = defects
+        self.hint = hint
+
+
+class PrecheckResult:
+    """预检结果: 命中结论规则时 defects 不为 None，否则 hints 为需要附加给 LLM 的提示"""
+    
+    def __init__(self, defects: list[Defect] | None = None, rule: str | None = None, hints: list[str] | None = None):
+        self.defects = defects
+        self.rule = rule
+        self.hints = hints or []
+
+
+class PrecheckRule(ABC):
+    """预检规则，子类实现 check，未命中时返回 None"""
+    
+    name: str = ""
+    
+    @abstractmethod
+    def check(self, frame: FrameStats, assertion: str | None) -> PrecheckOutcome | None:
+        pass
+
+
+class BlackFrameRule(PrecheckRule):
+    """全黑截图 (应用崩溃或未渲染)，只对无断言的缺陷检测给出结论"""
+    
+    name = "black_frame"
+    
+    def __init__(self, max_luma: int = 16):
+        self.max_luma = max_luma
+    
+    def check(self, frame: FrameStats, assertion: str | None) -> PrecheckOutcome | None:
+        if assertion is not None or frame.luma_max > self.max_luma:
+            return None
+        return PrecheckOutcome(defects=[Defect(
+            category="UI_BUG",
+            reasoning=f"截图为全黑画面 (最大亮度 {frame.luma_max})，应用可能已崩溃或界面未渲染",
+        )])
+
+
+class BlankFrameRule(PrecheckRule):
+    """
+    单一颜色的空白截图 (页面内容未渲染)，只对无断言的缺陷检测给出结论
+    纯色启动页、空状态页面也会命中，默认不启用，未启用时由 LowVarianceRule 附加提示
+    """
+    
+    name = "blank_frame"
+    
+    def __init__(self, max_range: int = 8):
+        self.max_range = max_range
+    
+    def check(self, frame: FrameStats, assertion: str | None) -> PrecheckOutcome | None:
+        if assertion is not None or frame.channel_range > self.max_range:
+            return None
+        return PrecheckOutcome(defects=[Defect(
+            category="UI_BUG",
+            reasoning=f"截图为单一颜色 ({frame.mean_color}) 的空白画面，页面内容未渲染",
+        )])
+
+
+class LowVarianceRule(PrecheckRule):
+    """内容很少 (亮度方差很低) 的截图，提示 LLM 重点确认是否为空白或加载中页面"""
+    
+    name = "low_variance"
+    
+    def __init__(self, max_stddev: float = 6.0):
+        self.max_stddev = max_stddev
+    
+    def check(self, frame: FrameStats, assertion: str | None) -> PrecheckOutcome | None:
+        if frame.luma_stddev > self.max_stddev:
+            return None
+        return PrecheckOutcome(hint=(
+            f"截图亮度标准差只有 {frame.luma_stddev:.1f}，画面几乎为纯色 ({frame.mean_color})，"
+            "请重点确认页面是否空白、内容缺失或停留在加载状态"
+        ))
+
+
+class Prechecker:
+    """
+    预检执行器
+    
+    - 像素统计在图像执行器中计算一次，所有规则共用
+    - 按顺序执行规则，第一个给出结论的规则短路后续规则和 LLM 调用
+    - 每条规则记录执行次数和命中次数
+    """
+    
+    def __init__(
+        self,
+        rules: list[PrecheckRule],
+        sample_size: int = 256,
+        mask_top: float = 0.0,
+        mask_bottom: float = 0.0
+    ):
+        self.rules = rules
+        self.sample_size = sample_size
+        self.mask_top = mask_top
+        self.mask_bottom = mask_bottom
+        self.runs = 0
+        self.short_circuits = 0
+        self.seconds = 0.0
+        self._counters = {rule.name: {"evaluated": 0, "hits": 0} for rule in rules}
+    
+    async def run(self, image: PreparedImage, assertion: str | None) -> PrecheckResult:
+        """执行预检，截图无法解析时跳过预检，交给后续流程报错"""
+        started = time.perf_counter()
+        try:
+            frame = await get_image_executor().run(
+                compute_frame_stats,
+                image.data,
+                self.sample_size,
+                self.mask_top,
+                self.mask_bottom,
+            )
+        except ImageProcessingError as e:
+            logger.debug("precheck_skipped", error=str(e))
+            return PrecheckResult()
+        finally:
+            self.seconds += time.perf_counter() - started
+        
+        self.runs += 1
+        hints = []
+        for rule in self.rules:
+            counter = self._counters[rule.name]
+            counter["evaluated"] += 1
+            outcome = rule.check(frame, assertion)
+            if outcome is None:
+                continue
+            counter["hits"] += 1
+            if outcome.defects is not None:
+                self.short_circuits += 1
+                return PrecheckResult(defects=outcome.defects, rule=rule.name)
+            if outcome.hint:
+                hints.append(outcome.hint)
+        return PrecheckResult(hints=hints)
+    
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "short_circuits": self.short_circuits,
+            "seconds": round(self.seconds, 4),
+            "rules": {name: dict(counter) for name, counter in self._counters.items()},
+        }
+
+
+def create_precheck_rules(settings: Settings) -> list[PrecheckRule]:
+    """按配置创建启用的规则，结论规则在前"""
+    rules: list[PrecheckRule] = []
+    if settings.precheck_black_frame:
+        rules.append(BlackFrameRule(settings.precheck_black_max_luma))
+    if settings.precheck_blank_frame:
+        rules.append(BlankFrameRule(settings.precheck_blank_max_range))
+    if settings.precheck_low_variance:
+        rules.append(LowVarianceRule(settings.precheck_low_variance_max_stddev))
+    return rules
+
+
+# 预检单例
+_prechecker: Prechecker | None = None
+
+
+def get_prechecker(settings: Settings | None = None) -> Prechecker | None:
+    """获取预检执行器单例，未启用或没有启用的规则时返回 None"""
+    global _prechecker
+    if settings is None:
+        settings = get_settings()
+    if not settings.precheck_enabled:
+        return None
+    if _prechecker is None:
+        rules = create_precheck_rules(settings)
+        if not rules:
+            return None
+        _prechecker = Prechecker(
+            rules,
+            sample_size=settings.precheck_sample_size,
+            mask_top=settings.precheck_mask_top,
+            mask_bottom=settings.precheck_mask_bottom,
+        )
+    return _prechecker
@@ -0,0 +1,212 @@
+"""
+Maestro AI Server - LLM 调用弹性策略
+服务级重试预算、指数退避 + 完全抖动的重试等待，以及按后端 (提供商) 的熔断器。
+提供商故障时重试总量受预算限制，熔断的后端直接跳过 (快速失败或转移到其他后端)，
+避免重试放大提供商的过载
+@author LJY
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+import httpx
+import structlog
+
+logger = structlog.get_logger()
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 熔断器状态在指标中的取值
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 可以重试的 HTTP 状态码 (其余 4xx 重试也不会成功)
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    是否为提供商的暂时性故障: 连接失败、超时、429 和 5xx
+    这类错误可以重试并计入熔断器；请求错误、认证失败、结构化输出无效等不重试
+    """
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    try:
+        from openai import APIConnectionError, APIStatusError
+    except ImportError:  # pragma: no cover - openai 随 langchain-openai 安装
+        return False
+    if isinstance(exc, APIConnectionError):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def is_provider_response(exc: BaseException) -> bool:
+    """
+    是否为提供商已经响应的错误: 非暂时性的 HTTP 错误状态、结构化输出解析失败等
+    这类错误说明后端可用，熔断器按成功处理；本地准入拒绝和其他本地错误不说明后端状态
+    """
+    try:
+        from openai import APIStatusError
+    except ImportError:  # pragma: no cover - openai 随 langchain-openai 安装
+        APIStatusError = ()
+    from langchain.agents.structured_output import StructuredOutputError
+    from langchain_core.exceptions import OutputParserException
+    from pydantic import ValidationError
+    
+    if isinstance(exc, APIStatusError):
+        return not is_transient_error(exc)
+    return isinstance(exc, (StructuredOutputError, OutputParserException, ValidationError))
+
+
+class RetryBudget:
+    """
+    服务级重试预算
+    
+    滑动窗口内的重试次数不超过同一窗口内请求数的 ratio 倍 (至少允许 min_retries 次)。
+    提供商故障时重试量最多为正常请求量的 ratio 倍，而不是每个请求都重试 max_retries 次
+    """
+    
+    def __init__(self, ratio: float = 0.1, min_retries: int = 3, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+        self._requests: deque[float] = deque()
+        self._retries: deque[float] = deque()
+    
+    def record_request(self) -> None:
+        """记录一个请求 (不含重试)"""
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+        self.requests += 1
+    
+    def available(self) -> float:
+        """当前窗口内还可以发起的重试次数"""
+        self._trim(time.monotonic())
+        return max(0.0, max(self.min_retries, self.ratio * len(self._requests)) - len(self._retries))
+    
+    def try_acquire(self) -> bool:
+        """申请一次重试，预算用尽时返回 False"""
+        if self.available() < 1:
+            self.denied += 1
+            return False
+        self._retries.append(time.monotonic())
+        self.retries += 1
+        return True
+    
+    def stats(self) -> dict[str, Any]:
+        return {
+            "ratio": self.ratio,
+            "available": round(self.available(), 2),
+            "requests": self.requests,
+            "retries": self.retries,
+            "denied": self.denied,
+        }
+    
+    def _trim(self, now: float) -> None:
+        horizon = now - self.window
+        while self._requests and self._requests[0] < horizon:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < horizon:
+            self._retries.popleft()
+
+
+class CircuitBreaker:
+    """
+    单个后端的熔断器
+    
+    - closed: 正常调用，连续 failure_threshold 次暂时性故障后打开
+    - open: 拒绝调用，recovery_timeout 秒后进入 half_open
+    - half_open: 只放行一个探测调用，成功则关闭，失败则重新打开
+    
+    只有暂时性故障计为失败；提供商有响应的其他错误 (如结构化输出无效) 视为后端可用，
+    本地准入拒绝等没有到达提供商的调用只归还探测名额，不改变状态
+    """
+    
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+    
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+    
+    @property
+    def available(self) -> bool:
+        """是否可以向该后端发起调用 (不占用半开状态的探测名额)"""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._probing)
+    
+    def retry_after(self) -> float:
+        """距离进入半开状态的秒数"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+    
+    def allow(self) -> bool:
+        """申请一次调用，半开状态下只有第一个调用获准作为探测"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+    
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            logger.info("circuit_breaker_closed", backend=self.name)
+        self._state = CLOSED
+        self._probing = False
+        self.consecutive_failures = 0
+    
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+    
+    def release(self) -> None:
+        """调用被取消或没有到达提供商，没有结果: 归还半开状态的探测名额"""
+        self._probing = False
+    
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
+    
+    def _open(self) -> None:
+        if self._state != OPEN:
+            self.opened += 1
+            logger.warning(
+                "circuit_breaker_opened",
+                backend=self.name,
+                consecutive_failures=self.consecutive_failures,
+                recovery_timeout=self.recovery_timeout,
+            )
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
@@ -0,0 +1,333 @@
+"""
+Maestro AI Server - 多后端 LLM 路由
+按 EWMA 延迟、错误率和权重把调用路由到最快的健康后端，可选对冲请求降低尾延迟；
+暂时性故障在预算内指数退避重试，熔断的后端直接跳过
+@author LJY
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+import structlog
+
+from app.core import CircuitOpenError, OverloadedError
+from app.core.metrics import LLM_BACKEND_FAILURES, LLM_RETRIES, LLM_RETRIES_DENIED
+from app.core.resilience import CircuitBreaker, RetryBudget, is_provider_response, is_transient_error
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+    from tenacity import RetryCallState
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# 计算延迟分位数所需的最少样本数
+MIN_LATENCY_SAMPLES = 20
+
+
+class LLMBackend:
+    """
+    LLM 后端及其运行统计
+    
+    - latency: 成功调用耗时的 EWMA (秒)
+    - error_rate: 调用失败率的 EWMA，超过 0.5 视为不健康；按 error_half_life 随时间衰减，
+      不健康的后端只用于故障转移、很少有调用，恢复后靠衰减重新变为健康
+    - breaker: 熔断器，打开期间路由跳过该后端
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        llm: "ChatOpenAI",
+        weight: float = 1.0,
+        alpha: float = 0.2,
+        window: int = 200,
+        breaker: CircuitBreaker | None = None,
+        error_half_life: float = 30.0
+    ):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+        self.alpha = alpha
+        self.breaker = breaker or CircuitBreaker(name)
+        self.error_half_life = error_half_life
+        self.latency: float | None = None
+        self._error_rate = 0.0
+        self._error_updated = time.monotonic()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._samples: deque[float] = deque(maxlen=window)
+    
+    @property
+    def model_name(self) -> str:
+        return self.llm.model_name
+    
+    @property
+    def error_rate(self) -> float:
+        """按上次更新以来经过的时间衰减后的错误率"""
+        elapsed = time.monotonic() - self._error_updated
+        return self._error_rate * 0.5 ** (elapsed / self.error_half_life)
+    
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate < 0.5
+    
+    @property
+    def score(self) -> float:
+        """路由得分，越小越优先: 延迟按在途请求数放大，再按权重缩小"""
+        return (self.latency or 0.0) * (1 + self.in_flight) / self.weight
+    
+    def record_success(self, elapsed: float) -> None:
+        self.calls += 1
+        self.latency = elapsed if self.latency is None else self.latency + self.alpha * (elapsed - self.latency)
+        self._set_error_rate(self.error_rate * (1 - self.alpha))
+        self._samples.append(elapsed)
+    
+    def record_failure(self) -> None:
+        self.calls += 1
+        self.failures += 1
+        error_rate = self.error_rate
+        self._set_error_rate(error_rate + self.alpha * (1 - error_rate))
+    
+    def _set_error_rate(self, value: float) -> None:
+        self._error_rate = value
+        self._error_updated = time.monotonic()
+    
+    def record_usage(self, input_tokens: int, cached_tokens: int, output_tokens: int) -> None:
+        """累计 token 用量，cached_tokens 为命中提供商前缀缓存的输入 token"""
+        self.input_tokens += input_tokens
+        self.cached_tokens += cached_tokens
+        self.output_tokens += output_tokens
+    
+    def percentile(self, q: float) -> float | None:
+        """成功调用耗时的分位数，样本不足时返回 None"""
+        if len(self._samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+    
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model_name,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 1),
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "prompt_cache_hit_ratio": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else None,
+            "circuit": self.breaker.stats(),
+        }
+
+
+class LLMRouter:
+    """
+    多后端 LLM 路由
+    
+    - 健康后端按得分排序，不健康的后端排在最后，仅用于故障转移
+    - 调用失败时依次转移到下一个后端，全部失败时抛出最后一个异常
+    - 启用对冲时，首选后端超过其延迟分位数 (至少 hedge_min_delay) 仍未返回，
+      向下一个后端再发一次，取先成功的结果并取消另一个
+    - 同一后端的暂时性故障最多重试 max_retries 次，等待时间为指数退避 + 完全抖动
+      (0 到 retry_initial_delay * retry_backoff_factor^n 之间均匀随机，不超过 retry_max_delay)；
+      每次重试需从服务级重试预算中申请，后端已熔断时不再重试而是转移到下一个后端
+    - 熔断中的后端不参与路由，所有后端都熔断时直接拒绝 (503 + Retry-After)
+    """
+    
+    def __init__(
+        self,
+        backends: list[LLMBackend],
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_delay: float = 2.0,
+        max_retries: int = 0,
+        retry_initial_delay: float = 1.0,
+        retry_backoff_factor: float = 2.0,
+        retry_max_delay: float = 10.0,
+        retry_budget: RetryBudget | None = None
+    ):
+        if not backends:
+            raise ValueError("至少需要一个 LLM 后端")
+        self.backends = backends
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_retries = max_retries
+        self.retry_initial_delay = retry_initial_delay
+        self.retry_backoff_factor = retry_backoff_factor
+        self.retry_max_delay = retry_max_delay
+        self.retry_budget = retry_budget
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.retries = 0
+        self.circuit_rejections = 0
+    
+    @property
+    def model_name(self) -> str:
+        """参与缓存键的模型标识，多个后端的模型名称去重排序后拼接"""
+        return "+".join(sorted({backend.model_name for backend in self.backends}))
+    
+    def rank(self) -> list[LLMBackend]:
+        """按路由优先级排序的后端"""
+        return sorted(self.backends, key=lambda b: (not b.healthy, b.score, -b.weight))
+    
+    def hedge_delay(self, backend: LLMBackend) -> float:
+        """对冲请求的触发延迟"""
+        return max(self.hedge_min_delay, backend.percentile(self.hedge_percentile) or 0.0)
+    
+    def available(self) -> list[LLMBackend]:
+        """未熔断的后端 (按路由优先级排序)，全部熔断时抛出 CircuitOpenError"""
+        backends = [backend for backend in self.rank() if backend.breaker.available]
+        if not backends:
+            self.circuit_rejections += 1
+            retry_after = min(backend.breaker.retry_after() for backend in self.backends)
+            raise CircuitOpenError("所有 LLM 后端均已熔断", retry_after=retry_after or None)
+        return backends
+    
+    async def call(self, fn: Callable[[LLMBackend], Awaitable[T]]) -> T:
+        """在选中的后端上执行 fn(backend)"""
+        candidates = iter(self.available())
+        if self.retry_budget is not None:
+            self.retry_budget.record_request()
+        pending: dict[asyncio.Task, LLMBackend] = {}
+        hedged = False
+        overloaded = False
+        last_error: BaseException | None = None
+        
+        def launch() -> LLMBackend | None:
+            backend = next(candidates, None)
+            if backend is not None:
+                pending[asyncio.ensure_future(self._attempt(backend, fn))] = backend
+            return backend
+        
+        primary = launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge_enabled and not hedged and len(pending) == 1:
+                    timeout = self.hedge_delay(primary)
+                
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    hedge = launch()
+                    if hedge is not None:
+                        self.hedges += 1
+                        logger.info("llm_request_hedged", primary=primary.name, hedge=hedge.name)
+                    continue
+                
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    if isinstance(last_error, OverloadedError) and not isinstance(last_error, CircuitOpenError):
+                        # 本地准入拒绝: 后端没有故障，不计入失败，也不转移到其他后端加重过载
+                        overloaded = True
+                        continue
+                    LLM_BACKEND_FAILURES.labels(backend=backend.name, error=type(last_error).__name__).inc()
+                    logger.warning("llm_backend_failed", backend=backend.name, error=str(last_error))
+                
+                if not pending and not overloaded and launch() is not None:
+                    self.failovers += 1
+            
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def stats(self) -> dict[str, Any]:
+        """路由统计"""
+        return {
+            "backends": [backend.stats() for backend in self.backends],
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "retries": self.retries,
+            "circuit_rejections": self.circuit_rejections,
+            "retry_budget": self.retry_budget.stats() if self.retry_budget is not None else None,
+        }
+    
+    async def _attempt(self, backend: LLMBackend, fn: Callable[[LLMBackend], Awaitable[T]]) -> T:
+        """在同一后端上调用，暂时性故障按退避策略重试"""
+        if self.max_retries <= 0:
+            return await self._timed(backend, fn)
+        
+        from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential
+        
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=wait_random_exponential(
+                multiplier=self.retry_initial_delay,
+                exp_base=self.retry_backoff_factor,
+                max=self.retry_max_delay,
+            ),
+            retry=lambda retry_state: self._should_retry(backend, retry_state),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await self._timed(backend, fn)
+    
+    def _should_retry(self, backend: LLMBackend, retry_state: "RetryCallState") -> bool:
+        """
+        暂时性故障、后端未熔断且重试预算有余量时重试
+        tenacity 在最后一次尝试之后也会调用该判断，此时不会再重试，不能消耗预算
+        """
+        if not retry_state.outcome.failed or retry_state.attempt_number > self.max_retries:
+            return False
+        error = retry_state.outcome.exception()
+        if not is_transient_error(error) or not backend.breaker.available:
+            return False
+        if self.retry_budget is not None and not self.retry_budget.try_acquire():
+            LLM_RETRIES_DENIED.labels(backend=backend.name).inc()
+            logger.warning("llm_retry_budget_exhausted", backend=backend.name, error=str(error))
+            return False
+        self.retries += 1
+        LLM_RETRIES.labels(backend=backend.name).inc()
+        logger.info("llm_call_retry", backend=backend.name, error=str(error))
+        return True
+    
+    @staticmethod
+    async def _timed(backend: LLMBackend, fn: Callable[[LLMBackend], Awaitable[T]]) -> T:
+        if not backend.breaker.allow():
+            raise CircuitOpenError(f"LLM 后端 {backend.name} 已熔断", retry_after=backend.breaker.retry_after())
+        backend.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await fn(backend)
+        except (asyncio.CancelledError, OverloadedError):
+            # 取消或本地准入拒绝: 调用没有结果，不影响熔断器
+            backend.breaker.release()
+            raise
+        except Exception as e:
+            backend.record_failure()
+            # 只有暂时性故障计入熔断；提供商有响应的其他错误说明后端可用
+            if is_transient_error(e):
+                backend.breaker.record_failure()
+            elif is_provider_response(e):
+                backend.breaker.record_success()
+            else:
+                backend.breaker.release()
+            raise
+        finally:
+            backend.in_flight -= 1
+        backend.record_success(time.perf_counter() - started)
+        backend.breaker.record_success()
+        return result
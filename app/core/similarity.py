@@ -0,0 +1,91 @@
+"""
+Maestro AI Server - 近似截图索引
+按感知哈希的汉明距离查找之前分析过的近似截图，复用其缓存结果
+@author LJY
+"""
+
+from collections import OrderedDict
+
+from app.config import Settings, get_settings
+from app.core.cache import normalize_text
+
+
+def near_duplicate_scope(namespace: str, text: str | None) -> str:
+    """索引分区: 只在相同 Agent/Prompt/模型和相同断言的结果之间复用"""
+    return f"{namespace}\x00{normalize_text(text)}"
+
+
+class NearDuplicateIndex:
+    """
+    近似截图索引
+    
+    - 每个 scope 内保存 (缓存键 -> 感知哈希)，查找时线性比较汉明距离
+    - 全局按 LRU 限制条目数，索引只记录缓存键，结果本身仍在结果缓存中
+    """
+    
+    def __init__(self, threshold: int = 4, max_entries: int = 4096):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._scopes: dict[str, OrderedDict[str, int]] = {}
+        self._order: OrderedDict[tuple[str, str], None] = OrderedDict()
+        self.matches = 0
+    
+    def find(self, scope: str, fingerprint: int) -> str | None:
+        """返回汉明距离不超过阈值且最接近的缓存键"""
+        entries = self._scopes.get(scope)
+        if not entries:
+            return None
+        
+        best_key, best_distance = None, self.threshold + 1
+        for key, other in entries.items():
+            distance = (fingerprint ^ other).bit_count()
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+                if distance == 0:
+                    break
+        
+        if best_key is not None:
+            self._order.move_to_end((scope, best_key))
+            self.matches += 1
+        return best_key
+    
+    def add(self, scope: str, fingerprint: int, key: str) -> None:
+        """登记一个缓存结果的感知哈希"""
+        self._scopes.setdefault(scope, OrderedDict())[key] = fingerprint
+        self._order[(scope, key)] = None
+        self._order.move_to_end((scope, key))
+        
+        while len(self._order) > self.max_entries:
+            old_scope, old_key = next(iter(self._order))
+            self.discard(old_scope, old_key)
+    
+    def discard(self, scope: str, key: str) -> None:
+        """移除条目 (对应的缓存结果已过期或被淘汰)"""
+        self._order.pop((scope, key), None)
+        entries = self._scopes.get(scope)
+        if entries is not None:
+            entries.pop(key, None)
+            if not entries:
+                del self._scopes[scope]
+    
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+# 索引单例
+_near_duplicate_index: NearDuplicateIndex | None = None
+
+
+def get_near_duplicate_index(settings: Settings | None = None) -> NearDuplicateIndex | None:
+    """获取近似截图索引单例，未启用时返回 None"""
+    global _near_duplicate_index
+    if settings is None:
+        settings = get_settings()
+    if not (settings.result_cache_enabled and settings.near_duplicate_enabled):
+        return None
+    if _near_duplicate_index is None:
+        _near_duplicate_index = NearDuplicateIndex(
+            threshold=settings.near_duplicate_threshold,
+            max_entries=settings.result_cache_max_entries,
+        )
+    return _near_duplicate_index
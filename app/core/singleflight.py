@@ -0,0 +1,77 @@
+"""
+Maestro AI Server - 并发请求合并 (single-flight)
+相同内容键的并发请求共享同一次 LLM 调用
+@author LJY
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+
+import structlog
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    并发请求合并
+    
+    - 同一 key 的第一个请求发起调用，其后到达的请求等待同一个任务的结果
+    - 单个等待者被取消不影响共享调用；所有等待者都取消后才取消共享调用，并立即移除
+    - 调用结束 (成功或失败) 后立即移除，之后的请求重新发起调用
+    """
+    
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._calls: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行或加入 key 对应的调用"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            logger.info(
+                "request_coalesced",
+                flight=self.name,
+                waiters=self._waiters[key] + 1,
+            )
+        
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    # 先移除再取消: 之后到达的相同请求发起新的调用，而不是加入正在取消的任务
+                    del self._calls[key]
+                    del self._waiters[key]
+                    task.cancel()
+            raise
+    
+    def stats(self) -> dict[str, Any]:
+        """合并统计"""
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+    
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # 标记异常已读取，等待者全部取消时避免 "exception was never retrieved" 警告
+            task.exception()
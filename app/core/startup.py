@@ -0,0 +1,69 @@
+"""
+Maestro AI Server - 启动预热与耗时报告
+LangChain / OpenAI 等重量级模块在导入 app.main 时不加载，由 lifespan 预热阶段统一导入，
+并记录每个模块的导入耗时和各阶段耗时
+@author LJY
+"""
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import structlog
+
+from app import STARTED_AT
+
+logger = structlog.get_logger()
+
+# 只有 LLM 调用路径需要的重量级模块，/health 不依赖这些模块
+HEAVY_MODULES = (
+    "openai",
+    "langchain_openai",
+    "langchain.agents",
+    "app.agents",
+    "app.services",
+)
+
+
+class StartupReport:
+    """启动耗时报告，耗时单位毫秒"""
+    
+    def __init__(self):
+        self.lifespan_started = time.perf_counter()
+        self.imports: dict[str, float] = {}
+        self.phases: dict[str, float] = {}
+    
+    def import_module(self, name: str) -> None:
+        """导入模块并记录耗时，已导入的模块记为 0"""
+        started = time.perf_counter()
+        if name not in sys.modules:
+            importlib.import_module(name)
+        self.imports[name] = round((time.perf_counter() - started) * 1000, 1)
+    
+    def import_heavy_modules(self) -> None:
+        for name in HEAVY_MODULES:
+            self.import_module(name)
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一个启动阶段的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+    
+    def log(self) -> dict:
+        """输出启动耗时报告: 导入 app 到 lifespan 开始、各阶段、总的就绪耗时"""
+        now = time.perf_counter()
+        report = {
+            "app_import_ms": round((self.lifespan_started - STARTED_AT) * 1000, 1),
+            "imports_ms": self.imports,
+            "phases_ms": self.phases,
+            "lifespan_ms": round((now - self.lifespan_started) * 1000, 1),
+            "time_to_ready_ms": round((now - STARTED_AT) * 1000, 1),
+        }
+        logger.info("startup_timing", **report)
+        return report
@@ -0,0 +1,405 @@
+"""
+Maestro AI Server - 请求链路追踪
+进程内的轻量 span 追踪器，span 结构与 OpenTelemetry 一致 (trace_id / span_id / 父 span / 起止纳秒时间 /
+属性 / 状态)，请求结束时按 OTLP JSON 格式放入有界队列，由后台线程写到本地文件或标准输出。
+按请求采样，未采样的请求只有一次上下文变量读取的开销。
+
+另提供 LangSmith 适配器: 按采样率为单次 Agent 调用挂上 LangSmith 回调，上传前把截图 Base64 替换为摘要
+@author LJY
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterator
+
+import structlog
+
+from app.config import Settings, get_settings
+from app.core.logging import LogSink, get_log_sink
+
+if TYPE_CHECKING:
+    from langchain_core.tracers import LangChainTracer
+
+logger = structlog.get_logger()
+
+SERVICE_NAME = "maestro-ai-server"
+
+# 单个追踪最多保留的 span 数，超出的 span 只计数不保留
+MAX_SPANS_PER_TRACE = 256
+
+# W3C Trace Context: version-traceid-parentid-flags
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """
+    一个 span，kind 和 status 取 OpenTelemetry 的 SPAN_KIND_* / STATUS_CODE_* 取值
+    
+    只在事件循环线程中创建和结束
+    """
+    
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+    
+    def __init__(
+        self,
+        trace: "Trace",
+        name: str,
+        parent_id: str | None = None,
+        kind: str = "INTERNAL",
+        start_ns: int | None = None,
+        attributes: dict[str, Any] | None = None
+    ):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns() if start_ns is None else start_ns
+        self.end_ns: int | None = None
+        self.attributes = attributes or {}
+        self.status = "UNSET"
+        self.message = ""
+    
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+    
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent 请求头，向下游传播当前 span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+    
+    def set_attributes(self, attributes: dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+    
+    def set_error(self, error: BaseException) -> None:
+        self.status = "ERROR"
+        self.message = f"{type(error).__name__}: {error}"
+    
+    def end(self, end_ns: int | None = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns() if end_ns is None else end_ns
+        self.trace.finish(self)
+    
+    def to_otlp(self) -> dict:
+        """OTLP JSON 中的 span 对象"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": f"STATUS_CODE_{self.status}"},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        if self.message:
+            span["status"]["message"] = self.message
+        return span
+
+
+class Trace:
+    """一次请求的追踪，根 span 结束时把已结束的 span 交给导出器"""
+    
+    def __init__(self, exporter: "SpanExporter", trace_id: str | None = None, max_spans: int = MAX_SPANS_PER_TRACE):
+        self.exporter = exporter
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.max_spans = max_spans
+        self.root: Span | None = None
+        self.spans: list[Span] = []
+        self.dropped = 0
+    
+    def finish(self, span: Span) -> None:
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        if span is self.root:
+            if self.dropped:
+                span.set_attribute("maestro.dropped_spans", self.dropped)
+            try:
+                self.exporter.export(self.spans)
+            except OSError as e:
+                logger.warning("trace_export_failed", trace_id=self.trace_id, error=str(e))
+
+
+class SpanExporter(ABC):
+    """span 导出器，export 在事件循环中调用，每个追踪调用一次，不能阻塞"""
+    
+    @abstractmethod
+    def export(self, spans: list[Span]) -> None:
+        pass
+    
+    def shutdown(self) -> None:
+        """释放资源"""
+
+
+def otlp_payload(spans: list[Span]) -> dict:
+    """OTLP JSON (ExportTraceServiceRequest) 格式，可直接交给 OpenTelemetry Collector 的 otlpjsonfile 接收器"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+
+
+class StreamSpanExporter(SpanExporter):
+    """
+    每个追踪写一行 OTLP JSON 到字节流 (默认标准输出)
+    
+    export 只把序列化好的一行放入 LogSink 的有界队列，由后台线程批量写出，队列已满时丢弃。
+    传入 sink 时共用该 sink (json 日志模式下与日志共用 stdout 写线程，两者的输出不会交错)
+    """
+    
+    def __init__(self, stream: BinaryIO | None = None, sink: LogSink | None = None, max_queue: int = 1000):
+        self._owns_sink = sink is None
+        self.sink = sink or LogSink(stream, max_queue=max_queue, report_dropped=False, name="trace-sink")
+    
+    def export(self, spans: list[Span]) -> None:
+        self.sink.write(json.dumps(otlp_payload(spans), ensure_ascii=False).encode("utf-8"))
+    
+    def stats(self) -> dict:
+        return self.sink.stats()
+    
+    def shutdown(self) -> None:
+        """写出队列中剩余的追踪，共用的 sink 由其所有者关闭"""
+        if self._owns_sink:
+            self.sink.close()
+
+
+class FileSpanExporter(StreamSpanExporter):
+    """每个追踪追加一行 OTLP JSON 到文件"""
+    
+    def __init__(self, path: str, max_queue: int = 1000):
+        self.path = path
+        self.file = open(path, "ab")
+        super().__init__(self.file, max_queue=max_queue)
+    
+    def shutdown(self) -> None:
+        super().shutdown()
+        self.file.close()
+
+
+class Tracer:
+    """
+    追踪器
+    
+    - start_trace 为每个请求创建根 span，按 sample_rate 采样；
+      请求带有 W3C traceparent 时沿用其 trace_id 和采样标记
+    - 子 span 通过模块级 span() / record_span() 创建，没有进行中的追踪时不做任何事
+    """
+    
+    def __init__(self, exporter: SpanExporter, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+    
+    def start_trace(self, name: str, traceparent: str | None = None, attributes: dict | None = None) -> Span | None:
+        """创建根 span，未采样时返回 None"""
+        trace_id = parent_id = None
+        match = TRACEPARENT_PATTERN.match(traceparent) if traceparent else None
+        if match is not None:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None
+        elif random.random() >= self.sample_rate:
+            return None
+        
+        trace = Trace(self.exporter, trace_id)
+        trace.root = Span(trace, name, parent_id=parent_id, kind="SERVER", attributes=attributes)
+        return trace.root
+    
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+
+# 当前 span，子任务创建时复制上下文，父子关系随 asyncio 任务传递
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+@contextmanager
+def activate(span: Span) -> Iterator[Span]:
+    """把 span 设为当前 span，退出时结束 span，异常记为错误状态"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """在当前追踪中创建子 span，没有进行中的追踪 (未启用或未采样) 时返回 None"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with activate(Span(parent.trace, name, parent_id=parent.span_id, attributes=attributes)) as child:
+        yield child
+
+
+def record_span(name: str, seconds: float, **attributes: Any) -> None:
+    """补记一个刚刚结束、耗时为 seconds 的子 span (如工作线程/进程中完成的阶段)"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    end_ns = time.time_ns()
+    child = Span(
+        parent.trace,
+        name,
+        parent_id=parent.span_id,
+        start_ns=end_ns - int(seconds * 1e9),
+        attributes=attributes,
+    )
+    child.end(end_ns)
+
+
+def create_span_exporter(settings: Settings) -> SpanExporter | None:
+    """按配置创建导出器，trace_exporter=none 时返回 None"""
+    if settings.trace_exporter == "stdout":
+        return StreamSpanExporter(sink=get_log_sink())
+    if settings.trace_exporter == "file":
+        return FileSpanExporter(settings.trace_file_path)
+    return None
+
+
+# 追踪器单例
+_tracer: Tracer | None = None
+
+
+def get_tracer(settings: Settings | None = None) -> Tracer | None:
+    """获取追踪器单例，未启用本地追踪时返回 None"""
+    global _tracer
+    if _tracer is None:
+        if settings is None:
+            settings = get_settings()
+        exporter = create_span_exporter(settings)
+        if exporter is None:
+            return None
+        _tracer = Tracer(exporter, sample_rate=settings.trace_sample_rate)
+    return _tracer
+
+
+def shutdown_tracer() -> None:
+    """关闭追踪器单例"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.shutdown()
+        _tracer = None
+
+
+# LangSmith 上传前需要替换的图像字段: LangChain 标准图像块的 data 和 OpenAI image_url 的 data URL
+_DATA_URL_PREFIX = "data:image/"
+
+
+def _image_digest(data: str) -> str:
+    return f"<image {len(data)} chars sha256:{hashlib.sha256(data.encode()).hexdigest()[:16]}>"
+
+
+def redact_images(value: Any) -> Any:
+    """递归复制输入/输出，把截图 Base64 替换为长度和哈希摘要"""
+    if isinstance(value, dict):
+        if value.get("type") == "image" and isinstance(value.get("data"), str):
+            return {**value, "data": _image_digest(value["data"])}
+        return {key: redact_images(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_images(item) for item in value]
+    if isinstance(value, str) and value.startswith(_DATA_URL_PREFIX):
+        return _image_digest(value)
+    if hasattr(value, "content") and hasattr(value, "type"):
+        # 尚未序列化的 LangChain 消息对象
+        return {"type": value.type, "content": redact_images(value.content)}
+    return value
+
+
+class LangSmithAdapter:
+    """
+    LangSmith 追踪适配器
+    
+    不再通过 LANGCHAIN_TRACING_V2 全局开启追踪，而是按 sample_rate 为单次 Agent 调用挂上 LangChainTracer
+    回调；上传的输入输出经过 redact_images，截图 Base64 不离开本机。LangSmith 客户端在后台线程批量上传
+    """
+    
+    def __init__(self, api_url: str, api_key: str, project: str, sample_rate: float):
+        from langchain_core.tracers import LangChainTracer
+        from langsmith import Client
+        
+        self.sample_rate = sample_rate
+        self.project = project
+        self.sampled = 0
+        self.skipped = 0
+        self.tracer: "LangChainTracer" = LangChainTracer(
+            project_name=project,
+            client=Client(
+                api_url=api_url,
+                api_key=api_key,
+                hide_inputs=redact_images,
+                hide_outputs=redact_images,
+            ),
+        )
+    
+    def callbacks(self) -> list:
+        """本次调用需要挂上的回调，未采样时为空列表"""
+        if random.random() < self.sample_rate:
+            self.sampled += 1
+            return [self.tracer]
+        self.skipped += 1
+        return []
+    
+    def stats(self) -> dict:
+        return {"project": self.project, "sample_rate": self.sample_rate, "sampled": self.sampled, "skipped": self.skipped}
+
+
+# LangSmith 适配器单例
+_langsmith_adapter: LangSmithAdapter | None = None
+
+
+def get_langsmith_adapter(settings: Settings | None = None) -> LangSmithAdapter | None:
+    """获取 LangSmith 适配器单例，未启用、未配置 API Key 或采样率为 0 时返回 None"""
+    global _langsmith_adapter
+    if _langsmith_adapter is None:
+        if settings is None:
+            settings = get_settings()
+        if not settings.langchain_tracing_v2 or not settings.langchain_api_key or settings.langsmith_sample_rate <= 0:
+            return None
+        _langsmith_adapter = LangSmithAdapter(
+            api_url=settings.langchain_endpoint,
+            api_key=settings.langchain_api_key,
+            project=settings.langchain_project,
+            sample_rate=settings.langsmith_sample_rate,
+        )
+    return _langsmith_adapter
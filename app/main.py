@@ -4,60 +4,115 @@ Maestro AI Server - FastAPI 应用主入口
 @author LJY
 """
 
+import math
 import os
 from contextlib import asynccontextmanager
 
 import structlog
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from app.api.v2 import router as v2_router
 from app.config import get_settings
-from app.core import LLMError, MaestroAIError
-
-# 配置结构化日志 - 直接输出到控制台
-structlog.configure(
-    processors=[
-        structlog.contextvars.merge_contextvars,
-        structlog.stdlib.add_log_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.dev.ConsoleRenderer()  # 开发环境使用彩色输出
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(20),  # INFO level
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),  # 直接打印到 stdout
-    cache_logger_on_first_use=True,
-)
+from app.core import LLMError, MaestroAIError, OverloadedError, RateLimitedError
+from app.core.admission import get_admission_controllers
+from app.core.cache import close_result_cache, get_result_cache
+from app.core.executor import get_image_executor, shutdown_image_executor
+from app.core.http import close_http_client, get_http_client_stats, get_shared_http_client
+from app.core.llm import get_llm_router_stats, reset_llm_router
+from app.core.logging import configure_logging, get_log_stats
+from app.core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY
+from app.core.startup import StartupReport
+from app.core.tracing import get_langsmith_adapter, shutdown_tracer
+from app.services import reset_defect_service, reset_text_service
+
+# 配置结构化日志: 级别取 LOG_LEVEL，LOG_FORMAT=json 时由后台线程批量写出
+configure_logging()
 
 logger = structlog.get_logger()
 
+# LangChain / LangSmith 开启全局追踪的环境变量
+GLOBAL_TRACING_ENV_VARS = ("LANGCHAIN_TRACING_V2", "LANGCHAIN_TRACING", "LANGSMITH_TRACING", "LANGSMITH_TRACING_V2")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    report = StartupReport()
     settings = get_settings()
     
-    # 启动时配置 LangSmith
-    if settings.langchain_tracing_v2:
-        os.environ["LANGCHAIN_TRACING_V2"] = "true"
-        os.environ["LANGCHAIN_ENDPOINT"] = settings.langchain_endpoint
-        os.environ["LANGCHAIN_API_KEY"] = settings.langchain_api_key
-        os.environ["LANGCHAIN_PROJECT"] = settings.langchain_project
-        logger.info("langsmith_tracing_enabled", project=settings.langchain_project)
+    # LangSmith 追踪由适配器按采样率挂到单次 Agent 调用上 (截图脱敏)，
+    # 关闭 LangChain 按环境变量开启的全局追踪，避免每个请求都上传完整截图
+    for name in GLOBAL_TRACING_ENV_VARS:
+        os.environ.pop(name, None)
+    langsmith = get_langsmith_adapter(settings)
+    if langsmith is not None:
+        logger.info("langsmith_tracing_enabled", project=langsmith.project, sample_rate=langsmith.sample_rate)
+    elif settings.langchain_tracing_v2:
+        logger.warning("langsmith_tracing_disabled", reason="未配置 LANGCHAIN_API_KEY 或采样率为 0")
+    
+    # 所有 LLM 客户端共用的连接池，需先于 LLM 路由创建
+    http_client = get_shared_http_client(settings)
+    http_client.start()
+    
+    executor = get_image_executor(settings)
+    
+    cache = get_result_cache(settings)
+    if cache is not None:
+        with report.phase("result_cache"):
+            await cache.warm_up()
+    
+    if settings.eager_startup:
+        warm_up_services(app, report)
     
     logger.info(
         "application_startup",
         llm_provider=settings.llm_provider.value,
         model=settings.current_model,
+        image_executor=executor.kind,
+        image_workers=executor.max_workers,
+        result_cache=settings.result_cache_backend if cache is not None else None,
+        http2=http_client.http2,
+        keep_warm_interval=settings.llm_keep_warm_interval,
     )
+    report.log()
     
     yield
     
-    logger.info("application_shutdown")
+    shutdown_image_executor()
+    shutdown_tracer()
+    await close_result_cache()
+    logger.info("llm_connection_stats", **get_http_client_stats())
+    await close_http_client()
+    # LLM 客户端绑定在已关闭的共享 HTTP 客户端上，再次启动 (同一进程中的第二个 lifespan) 时需重新创建
+    reset_llm_router()
+    reset_defect_service()
+    reset_text_service()
+    logger.info("application_shutdown", logging=get_log_stats())
+
+
+def warm_up_services(app: FastAPI, report: StartupReport) -> None:
+    """
+    启动预热: 导入 LangChain、创建服务和 Agent (编译 Agent 图)、生成输出 Schema 和 OpenAPI 文档
+    预热失败 (如未配置 API Key) 只记录日志，服务仍在第一个请求时按需创建
+    """
+    try:
+        with report.phase("imports"):
+            report.import_heavy_modules()
+        
+        from app.services import get_defect_service, get_text_service
+        
+        with report.phase("services"):
+            defect_service = get_defect_service()
+            text_service = get_text_service()
+        
+        with report.phase("schemas"):
+            for agent in (defect_service.agent, defect_service.batch_agent, text_service.agent):
+                agent.prompt_version
+            app.openapi()
+    except Exception as e:
+        logger.exception("startup_warm_up_failed", error=str(e))
 
 
 app = FastAPI(
@@ -76,10 +131,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求体解压中间件 (位于日志中间件内层，日志记录的是传输的压缩字节数)
+from app.middleware.decompression import DecompressionMiddleware
+app.add_middleware(DecompressionMiddleware)
+
+# 截止时间中间件 (位于解压中间件外层，监听的是原始连接的断开消息)
+if get_settings().request_deadline_enabled:
+    from app.middleware.deadline import DeadlineMiddleware
+    app.add_middleware(DeadlineMiddleware)
+
+# 链路追踪中间件 (位于日志中间件内层，日志可以带上 trace_id)
+if get_settings().trace_exporter != "none":
+    from app.middleware.tracing import TracingMiddleware
+    app.add_middleware(TracingMiddleware)
+
 # 日志中间件
 from app.middleware.logging import LoggingMiddleware
 app.add_middleware(LoggingMiddleware)
 
+# 指标中间件 (最外层，请求耗时包含其余中间件)
+if get_settings().metrics_enabled:
+    from app.middleware.metrics import MetricsMiddleware
+    app.add_middleware(MetricsMiddleware)
+
 
 @app.exception_handler(MaestroAIError)
 async def maestro_ai_exception_handler(
@@ -89,6 +163,20 @@ async def maestro_ai_exception_handler(
     """处理自定义异常"""
     logger.error("maestro_ai_error", error=str(exc))
     
+    if isinstance(exc, OverloadedError):
+        headers = None
+        if exc.retry_after is not None:
+            headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+        return JSONResponse(
+            status_code=(
+                status.HTTP_429_TOO_MANY_REQUESTS
+                if isinstance(exc, RateLimitedError)
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            ),
+            content={"detail": f"服务繁忙，请稍后重试: {exc}"},
+            headers=headers,
+        )
+    
     if isinstance(exc, LLMError):
         return JSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -120,8 +208,39 @@ app.include_router(v2_router)
 
 @app.get("/health", tags=["health"])
 async def health_check():
-    """健康检查端点"""
-    return {"status": "healthy"}
+    """健康检查端点: 附带各 LLM 后端的熔断器状态，有后端熔断时为 degraded (仍返回 200)"""
+    router = get_llm_router_stats()
+    if router is None:
+        return {"status": "healthy"}
+    circuits = {backend["name"]: backend["circuit"] for backend in router["backends"]}
+    degraded = any(circuit["state"] != "closed" for circuit in circuits.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "circuits": circuits,
+        "retry_budget": router["retry_budget"],
+    }
+
+
+@app.get("/health/ready", tags=["health"])
+async def readiness_check():
+    """就绪检查端点: 所有 LLM 后端排队都过深时返回 503，负载均衡据此提前摘流"""
+    controllers = get_admission_controllers()
+    admission = [controller.stats() for controller in controllers]
+    connections = get_http_client_stats()
+    if any(controller.ready for controller in controllers):
+        return {"status": "ready", "admission": admission, "connections": connections}
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "not_ready", "admission": admission, "connections": connections},
+    )
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    """Prometheus 指标端点 (文本格式 0.0.4)"""
+    if not get_settings().metrics_enabled:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Not Found"})
+    return Response(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 @app.get("/", tags=["root"])
@@ -0,0 +1,142 @@
+"""
+Maestro AI Server - 请求截止时间中间件
+纯 ASGI 实现，请求处理在单独的任务中运行; 请求体读完后监听客户端断开，
+截止时间到达或客户端断开时取消该任务，进行中的 LLM 调用和发往提供商的 HTTP 请求随之取消，
+不再占用提供商并发名额、token 和截图内存
+@author LJY
+"""
+
+import asyncio
+import json
+
+import structlog
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+from app.core.deadline import (
+    CANCEL_DEADLINE,
+    CANCEL_DISCONNECT,
+    DEADLINE_HEADER,
+    RequestDeadline,
+    reset_deadline,
+    resolve_timeout,
+    set_deadline,
+)
+from app.core.metrics import record_request_cancelled
+
+logger = structlog.get_logger()
+
+# 客户端已断开时记录的状态码 (沿用 nginx 的 499 Client Closed Request)
+STATUS_CLIENT_CLOSED = 499
+
+
+class DeadlineMiddleware:
+    """
+    请求截止时间中间件
+    
+    - 只处理 path_prefix 下的请求，截止时间由 resolve_timeout 决定 (请求头或端点默认值)
+    - 超过截止时间: 取消请求处理，响应尚未开始时返回 504
+    - 客户端断开: 取消请求处理，响应记为 499 (客户端收不到)
+    - 下游读完请求体后再次调用 receive 时，等待同一个断开消息
+    """
+    
+    def __init__(self, app: ASGIApp, path_prefix: str = "/v2/"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.settings = get_settings()
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        
+        header = None
+        for key, value in scope.get("headers", []):
+            if key == DEADLINE_HEADER:
+                header = value.decode("latin-1")
+                break
+        deadline = RequestDeadline(resolve_timeout(scope["path"], header, self.settings))
+        
+        disconnected = asyncio.Event()
+        watcher: asyncio.Task | None = None
+        response_started = False
+        
+        async def watch_disconnect() -> Message:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return message
+        
+        async def receive_wrapper() -> Message:
+            nonlocal watcher
+            if watcher is not None:
+                return await asyncio.shield(watcher)
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                # 请求体已读完，之后的 receive 只会返回断开消息
+                watcher = asyncio.ensure_future(watch_disconnect())
+            return message
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        # 请求处理任务和其中创建的子任务 (LLM 调用) 继承截止时间，取消时据此记录原因
+        token = set_deadline(deadline)
+        try:
+            task = asyncio.ensure_future(self.app(scope, receive_wrapper, send_wrapper))
+        finally:
+            reset_deadline(token)
+        disconnect = asyncio.ensure_future(disconnected.wait())
+        
+        try:
+            done, _ = await asyncio.wait(
+                {task, disconnect},
+                timeout=deadline.remaining(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if task in done:
+                task.result()
+                return
+            
+            reason = CANCEL_DISCONNECT if disconnected.is_set() else CANCEL_DEADLINE
+            deadline.cancel_reason = reason
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            
+            record_request_cancelled(reason)
+            logger.warning(
+                "request_cancelled",
+                path=scope["path"],
+                reason=reason,
+                timeout=deadline.timeout,
+                response_started=response_started,
+            )
+            if not response_started:
+                if reason == CANCEL_DEADLINE:
+                    await self._respond(send, 504, f"请求处理超过截止时间 ({deadline.timeout:g}s)")
+                else:
+                    await self._respond(send, STATUS_CLIENT_CLOSED, "客户端已断开")
+        finally:
+            for pending in (task, disconnect, watcher):
+                if pending is not None and not pending.done():
+                    pending.cancel()
+    
+    @staticmethod
+    async def _respond(send: Send, status_code: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+        except OSError:
+            # 客户端已断开，服务器拒绝写入
+            pass
@@ -0,0 +1,288 @@
+"""
+Maestro AI Server - 请求体解压中间件
+纯 ASGI 实现，按 Content-Encoding 逐块解压请求体 (gzip / deflate / zstd)，
+下游每次 receive 只解压出一片 (不超过 OUTPUT_CHUNK_SIZE) 交给截图解析器，不在内存中展开整个请求体；
+累计超过上限时在产出下一片之前返回 413
+@author LJY
+"""
+
+import itertools
+import json
+import time
+import zlib
+from typing import Iterator
+
+import structlog
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 未安装时不支持 zstd
+    zstandard = None
+
+logger = structlog.get_logger()
+
+# 单次解压产出的最大字节数，超出的部分留到下一条 receive 消息
+OUTPUT_CHUNK_SIZE = 256 * 1024
+
+# zstd 帧的魔数
+ZSTD_MAGIC = 0xFD2FB528
+
+SUPPORTED_ENCODINGS = {"gzip", "x-gzip", "deflate"} | ({"zstd"} if zstandard is not None else set())
+
+# 压缩数据损坏时解压器抛出的异常
+DECODE_ERRORS = (zlib.error, ValueError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+# 累计解压统计
+_stats = {
+    "requests": 0,
+    "rejected": 0,
+    "compressed_bytes": 0,
+    "decompressed_bytes": 0,
+    "decompress_seconds": 0.0,
+}
+
+
+def get_decompression_stats() -> dict:
+    """累计解压统计"""
+    stats = dict(_stats)
+    if stats["compressed_bytes"]:
+        stats["compression_ratio"] = round(stats["decompressed_bytes"] / stats["compressed_bytes"], 2)
+    return stats
+
+
+class _ZstdBlocks:
+    """
+    按 zstd 帧格式 (RFC 8878) 切分输入，每段以完整的块结束
+    
+    zstd 单个块解压后不超过 128 KiB，按块喂给解压对象时单次输出有界；
+    直接按字节数切片时几个字节的 RLE 块就能展开成 128 KiB，单次输出没有上限
+    """
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._state = "frame"
+        self._checksum = 0
+    
+    @property
+    def complete(self) -> bool:
+        """最后一个块 (及校验和) 已经读完"""
+        return self._state == "trailer"
+    
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """追加输入，产出已经完整的段 (帧头、一个块或校验和)"""
+        self._buffer += data
+        while True:
+            segment = self._next_segment()
+            if segment is None:
+                return
+            size, state = segment
+            self._state = state
+            if size:
+                chunk = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                yield chunk
+    
+    def _next_segment(self) -> tuple[int, str] | None:
+        """下一段的字节数和读完这一段之后的状态，输入不足时返回 None"""
+        buffer = self._buffer
+        if self._state == "checksum":
+            return (self._checksum, "trailer") if len(buffer) >= self._checksum else None
+        if not buffer:
+            return None
+        if self._state == "trailer":
+            # 之后的数据原样交给解压对象，由其报错或忽略
+            return len(buffer), "trailer"
+        if self._state == "frame":
+            if len(buffer) < 5:
+                return None
+            if int.from_bytes(buffer[:4], "little") != ZSTD_MAGIC:
+                # 不是 zstd 帧 (或为可跳过帧)，交给解压对象报错
+                return len(buffer), "trailer"
+            descriptor = buffer[4]
+            single_segment = descriptor >> 5 & 1
+            self._checksum = 4 if descriptor >> 2 & 1 else 0
+            size = (
+                5
+                + (0 if single_segment else 1)
+                + (0, 1, 2, 4)[descriptor & 3]
+                + (single_segment, 2, 4, 8)[descriptor >> 6]
+            )
+            return (size, "block") if len(buffer) >= size else None
+        
+        if len(buffer) < 3:
+            return None
+        header = int.from_bytes(buffer[:3], "little")
+        # RLE 块的内容只有 1 个字节，其余类型为块大小
+        size = 3 + (1 if header >> 1 & 3 == 1 else header >> 3)
+        if len(buffer) < size:
+            return None
+        return size, "checksum" if header & 1 else "block"
+
+
+class _Decoder:
+    """
+    增量解压器，逐片产出解压结果，每片不超过 OUTPUT_CHUNK_SIZE
+    
+    调用方每次只取一片，检查累计大小后再取下一片，压缩炸弹不会在内存中展开
+    """
+    
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._output = 0
+        if encoding == "zstd":
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+            self._blocks = _ZstdBlocks()
+            self._zlib = None
+        else:
+            # gzip 带 gzip 头；deflate 按 RFC 为 zlib 格式，首块失败时回退为原始 deflate
+            wbits = 16 + zlib.MAX_WBITS if encoding in ("gzip", "x-gzip") else zlib.MAX_WBITS
+            self._zlib = zlib.decompressobj(wbits)
+    
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        if self._zlib is None:
+            for segment in self._blocks.feed(data):
+                out = self._zstd.decompress(segment)
+                for i in range(0, len(out), OUTPUT_CHUNK_SIZE):
+                    yield out[i:i + OUTPUT_CHUNK_SIZE]
+            return
+        
+        while data:
+            try:
+                out = self._zlib.decompress(data, OUTPUT_CHUNK_SIZE)
+            except zlib.error:
+                if self.encoding != "deflate" or self._output:
+                    raise
+                self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+                self.encoding = "deflate-raw"
+                continue
+            self._output += len(out)
+            if out:
+                yield out
+            data = self._zlib.unconsumed_tail
+    
+    def finish(self) -> Iterator[bytes]:
+        """输入结束，产出剩余的解压结果并检查压缩流完整"""
+        if self._zlib is None:
+            if not self._blocks.complete:
+                raise zstandard.ZstdError("压缩数据不完整")
+            return
+        
+        out = self._zlib.flush()
+        if not self._zlib.eof:
+            raise zlib.error("压缩数据不完整")
+        if out:
+            yield out
+
+
+class DecompressionMiddleware:
+    """
+    请求体解压中间件
+    
+    - 只处理 path_prefix 下带 Content-Encoding 的请求，下游看到的是解压后的请求体，
+      并移除 Content-Encoding / Content-Length 请求头
+    - 解压后超过 max_size 返回 413，压缩数据损坏返回 400，不支持的编码返回 415
+    - 每个请求记录压缩率和解压耗时
+    """
+    
+    def __init__(self, app: ASGIApp, max_size: int | None = None, path_prefix: str = "/v2/"):
+        self.app = app
+        self.max_size = get_settings().request_max_decompressed_size if max_size is None else max_size
+        self.path_prefix = path_prefix
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = None
+        headers = []
+        for key, value in scope.get("headers", []):
+            if key == b"content-encoding":
+                encoding = value.decode("latin-1").strip().lower()
+            elif key != b"content-length":
+                headers.append((key, value))
+        
+        if encoding is None or encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+        
+        if encoding not in SUPPORTED_ENCODINGS:
+            await self._reject(send, 415, f"不支持的 Content-Encoding: {encoding}")
+            return
+        
+        decoder = _Decoder(encoding)
+        state = {"compressed": 0, "decompressed": 0, "seconds": 0.0, "done": False}
+        # 当前 receive 消息的解压结果，下游每次 receive 只从中取一片
+        pieces: Iterator[bytes] | None = None
+        
+        def next_piece() -> bytes | None:
+            """取出下一片解压结果，当前消息已解压完时返回 None；超过上限时在产出下一片之前拒绝"""
+            started = time.perf_counter()
+            try:
+                for piece in pieces:
+                    state["decompressed"] += len(piece)
+                    if state["decompressed"] > self.max_size:
+                        _stats["rejected"] += 1
+                        raise HTTPException(413, f"解压后的请求体超过上限 ({self.max_size} 字节)")
+                    if piece:
+                        return piece
+                return None
+            except DECODE_ERRORS as e:
+                _stats["rejected"] += 1
+                raise HTTPException(400, f"请求体解压失败: {e}") from e
+            finally:
+                state["seconds"] += time.perf_counter() - started
+        
+        async def receive_wrapper() -> Message:
+            nonlocal pieces
+            while True:
+                if pieces is not None:
+                    piece = next_piece()
+                    if piece is not None:
+                        return {"type": "http.request", "body": piece, "more_body": True}
+                    pieces = None
+                if state["done"]:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                body = message.get("body", b"")
+                state["compressed"] += len(body)
+                final = not message.get("more_body", False)
+                pieces = itertools.chain(decoder.decompress(body), decoder.finish() if final else ())
+                state["done"] = final
+        
+        try:
+            await self.app({**scope, "headers": headers}, receive_wrapper, send)
+        finally:
+            if state["compressed"]:
+                self._record(encoding, state)
+    
+    def _record(self, encoding: str, state: dict) -> None:
+        _stats["requests"] += 1
+        _stats["compressed_bytes"] += state["compressed"]
+        _stats["decompressed_bytes"] += state["decompressed"]
+        _stats["decompress_seconds"] += state["seconds"]
+        logger.info(
+            "request_decompressed",
+            encoding=encoding,
+            compressed_bytes=state["compressed"],
+            decompressed_bytes=state["decompressed"],
+            ratio=round(state["decompressed"] / state["compressed"], 2),
+            decompress_ms=round(state["seconds"] * 1000, 2),
+        )
+    
+    @staticmethod
+    async def _reject(send: Send, status_code: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,120 +1,170 @@
 """
 Maestro AI Server - 日志中间件
-记录请求和响应的详细日志，用于调试
+纯 ASGI 实现，包装 receive/send 记录请求元数据，不缓冲也不重新解析请求体
 @author LJY
 """
 
+import hashlib
 import json
+import random
 import time
 import uuid
-from typing import Callable
+from typing import Any
 
 import structlog
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import Message
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
 
 logger = structlog.get_logger()
 
+# 采样请求中不超过该大小的请求体会被解析并脱敏后记录，更大的只记录大小和哈希
+MAX_LOGGED_BODY_SIZE = 64 * 1024
+
+# 需要屏蔽的 Header
+SENSITIVE_HEADERS = {"authorization", "cookie", "set-cookie", "x-api-key", "proxy-authorization"}
+
+# 需要屏蔽的图像相关 JSON 字段
+IMAGE_FIELDS = {"screen", "image", "file", "imageData", "data"}
+
+
+class _BodyStats:
+    """随 receive 消息累计请求体大小，采样时额外计算哈希并保留小请求体"""
+    
+    def __init__(self, detailed: bool):
+        self.size = 0
+        self._hash = hashlib.sha256() if detailed else None
+        self._captured: bytearray | None = bytearray() if detailed else None
+    
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._hash is not None:
+            self._hash.update(chunk)
+        if self._captured is not None:
+            if self.size > MAX_LOGGED_BODY_SIZE:
+                self._captured = None
+            else:
+                self._captured += chunk
+    
+    @property
+    def sha256(self) -> str | None:
+        return self._hash.hexdigest() if self._hash is not None and self.size else None
+    
+    @property
+    def captured(self) -> bytes | None:
+        return bytes(self._captured) if self._captured else None
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+
+class LoggingMiddleware:
     """
     请求响应日志中间件
-    记录详细的请求和响应信息，自动屏蔽敏感字段和过大的 Base64 数据
+    每个请求记录方法、路径、状态码、耗时和请求体大小;
+    按 sample_rate 采样的请求和出错的请求额外记录脱敏后的 Header 和请求体摘要
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp, sample_rate: float | None = None):
+        self.app = app
+        self.sample_rate = get_settings().log_sample_rate if sample_rate is None else sample_rate
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         request_id = str(uuid.uuid4())
         structlog.contextvars.bind_contextvars(request_id=request_id)
         
-        start_time = time.time()
+        sampled = random.random() < self.sample_rate
+        body = _BodyStats(detailed=sampled)
+        response: dict[str, Any] = {"status_code": 500, "headers": []}
+        start_time = time.perf_counter()
+        
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                body.update(message.get("body", b""))
+            return message
         
-        # 记录请求
-        await self._log_request(request)
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                response["headers"] = message.get("headers", [])
+            await send(message)
         
         try:
-            response = await call_next(request)
-            
-            # 记录响应
-            await self._log_response(response, start_time)
-            
-            return response
+            await self.app(scope, receive_wrapper, send_wrapper)
         except Exception as e:
-            process_time = time.time() - start_time
             logger.error(
                 "request_failed",
+                method=scope["method"],
+                path=scope["path"],
                 error=str(e),
-                duration=process_time,
-                status_code=500
+                duration=time.perf_counter() - start_time,
+                status_code=500,
+                **self._request_details(scope, body),
             )
             raise
-        finally:
-            structlog.contextvars.clear_contextvars()
-
-    async def _log_request(self, request: Request):
-        """记录请求详情"""
-        try:
-            # 获取请求体
-            body_bytes = await request.body()
-            
-            # 重置 Request body stream 以供后续使用
-            async def receive() -> Message:
-                return {"type": "http.request", "body": body_bytes}
-            request._receive = receive
-            
-            body_json = None
-            if body_bytes:
-                try:
-                    body_str = body_bytes.decode("utf-8")
-                    body_json = json.loads(body_str)
-                    self._mask_sensitive_data(body_json)
-                except Exception:
-                    body_json = "<binary/non-json data>"
+        else:
+            status_code = response["status_code"]
+            details = {}
+            if sampled or status_code >= 400:
+                details = self._request_details(scope, body)
+                details["response_headers"] = self._mask_headers(response["headers"])
             
             logger.info(
-                "incoming_request",
-                method=request.method,
-                url=str(request.url),
-                client_host=request.client.host if request.client else None,
-                headers=dict(request.headers), # Header logging might be verbose, keep it or mask carefully
-                body=body_json
+                "request_completed",
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                duration=time.perf_counter() - start_time,
+                body_size=body.size,
+                sampled=sampled,
+                **details,
             )
-            
-        except Exception as e:
-            logger.warn("log_request_error", error=str(e))
-
-    async def _log_response(self, response: Response, start_time: float):
-        """记录响应详情"""
-        process_time = time.time() - start_time
-        
-        # Capture response body
-        # 注意: StreamingResponse 的 body 只能读取一次，这里我们主要记录 header 和状态码
-        # 如果需要记录 body，需要 wrap response，这里为了性能和稳定性暂时只记录非流式响应或关键信息
-        # 对于 JSONResponse，我们可以尝试获取 body，但标准 Response 对象 body 已被消耗
+        finally:
+            structlog.contextvars.clear_contextvars()
+    
+    def _request_details(self, scope: Scope, body: _BodyStats) -> dict:
+        """详细请求信息: 客户端、脱敏 Header、请求体摘要"""
+        client = scope.get("client")
+        return {
+            "query_string": scope.get("query_string", b"").decode("latin-1"),
+            "client_host": client[0] if client else None,
+            "headers": self._mask_headers(scope.get("headers", [])),
+            "body": self._describe_body(body),
+        }
+    
+    def _describe_body(self, body: _BodyStats) -> Any:
+        """小请求体解析并脱敏，其余只给出大小和哈希"""
+        captured = body.captured
+        if captured is not None:
+            try:
+                body_json = json.loads(captured)
+                self._mask_sensitive_data(body_json)
+                return body_json
+            except Exception:
+                pass
         
-        # 简单记录状态和耗时
-        logger.info(
-            "request_completed",
-            status_code=response.status_code,
-            duration=process_time,
-            headers=dict(response.headers)
-        )
-
-    def _mask_headers(self, headers: dict) -> dict:
+        if not body.size:
+            return None
+        if body.sha256 is None:
+            return f"<body_len_{body.size}>"
+        return f"<body_len_{body.size}_sha256_{body.sha256[:16]}>"
+    
+    def _mask_headers(self, headers: list[tuple[bytes, bytes]]) -> dict:
         """屏蔽敏感 Header"""
-        masked = headers.copy()
-        if "authorization" in masked:
-            masked["authorization"] = "***"
-        if "Authorization" in masked:
-            masked["Authorization"] = "***"
+        masked = {}
+        for key, value in headers:
+            name = key.decode("latin-1").lower()
+            masked[name] = "***" if name in SENSITIVE_HEADERS else value.decode("latin-1")
         return masked
-
-    def _mask_sensitive_data(self, data: any):
+    
+    def _mask_sensitive_data(self, data: Any):
         """递归屏蔽 JSON 中的敏感/大字段"""
         if isinstance(data, dict):
             for key, value in list(data.items()):
                 # 屏蔽图像相关字段
-                if key in ["screen", "image", "file", "imageData", "data"]:
+                if key in IMAGE_FIELDS:
                     if isinstance(value, str) and len(value) > 100:
                         data[key] = f"<base64_string_len_{len(value)}>"
                     elif isinstance(value, list) and len(value) > 100:
@@ -125,7 +175,6 @@ class LoggingMiddleware(BaseHTTPMiddleware):
                 elif isinstance(value, (dict, list)):
                     self._mask_sensitive_data(value)
         elif isinstance(data, list):
-            for i, item in enumerate(data):
+            for item in data:
                 if isinstance(item, (dict, list)):
                     self._mask_sensitive_data(item)
-
@@ -0,0 +1,67 @@
+"""
+Maestro AI Server - 指标中间件
+纯 ASGI 实现，记录每个 HTTP 请求的耗时、状态码和在途请求数，并把当前端点放入上下文，
+请求处理中记录的阶段耗时和 token 用量据此按端点区分
+@author LJY
+"""
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    reset_endpoint,
+    set_endpoint,
+)
+
+# 不属于任何路由的路径统一记为该端点，避免扫描请求撑爆标签基数
+UNMATCHED_ENDPOINT = "other"
+
+
+class MetricsMiddleware:
+    """HTTP 请求指标中间件，端点标签取应用中注册的路由路径 (不含路径参数的精确匹配)"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._paths: set[str] | None = None
+    
+    def _endpoint(self, scope: Scope) -> str:
+        if self._paths is None:
+            # 子路由 (include_router) 的完整路径只出现在 OpenAPI 文档中
+            application = scope.get("app")
+            paths = {getattr(route, "path", None) for route in getattr(application, "routes", [])}
+            if hasattr(application, "openapi"):
+                paths.update(application.openapi()["paths"])
+            self._paths = paths
+        path = scope["path"]
+        return path if path in self._paths else UNMATCHED_ENDPOINT
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        endpoint = self._endpoint(scope)
+        token = set_endpoint(endpoint)
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_DURATION.labels(method=scope["method"], endpoint=endpoint).observe(
+                time.perf_counter() - started
+            )
+            HTTP_REQUESTS.labels(method=scope["method"], endpoint=endpoint, status=status_code).inc()
+            reset_endpoint(token)
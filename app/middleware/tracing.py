@@ -0,0 +1,56 @@
+"""
+Maestro AI Server - 链路追踪中间件
+纯 ASGI 实现，为采样到的请求创建根 span，请求处理中的各阶段作为子 span 记录，
+响应结束后整条追踪交给导出器
+@author LJY
+"""
+
+import structlog
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.tracing import Tracer, activate, get_tracer
+
+
+class TracingMiddleware:
+    """请求追踪中间件，未采样的请求直接透传"""
+    
+    def __init__(self, app: ASGIApp, tracer: Tracer | None = None):
+        self.app = app
+        self.tracer = tracer or get_tracer()
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.tracer is None:
+            await self.app(scope, receive, send)
+            return
+        
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        
+        root = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=traceparent,
+            attributes={
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+                "request_id": structlog.contextvars.get_contextvars().get("request_id", ""),
+            },
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+        
+        # 日志带上 trace_id，便于从日志跳转到追踪
+        structlog.contextvars.bind_contextvars(trace_id=root.trace_id)
+        
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = "ERROR"
+            await send(message)
+        
+        with activate(root):
+            await self.app(scope, receive, send_wrapper)
@@ -3,13 +3,25 @@ Maestro AI Server - Schema 模块
 @author LJY
 """
 
-from app.schemas.defects import Defect, FindDefectsRequest, FindDefectsResponse
+from app.schemas.defects import (
+    AssertionResult,
+    Defect,
+    FindDefectsBatchRequest,
+    FindDefectsBatchResponse,
+    FindDefectsRequest,
+    FindDefectsResponse,
+)
 from app.schemas.extract import ExtractTextRequest, ExtractTextResponse
+from app.schemas.screen import ScreenBytes
 
 __all__ = [
+    "AssertionResult",
     "Defect",
+    "FindDefectsBatchRequest",
+    "FindDefectsBatchResponse",
     "FindDefectsRequest",
     "FindDefectsResponse",
     "ExtractTextRequest",
     "ExtractTextResponse",
+    "ScreenBytes",
 ]
@@ -5,6 +5,8 @@ Maestro AI Server - 缺陷检测相关 Schema 定义
 
 from pydantic import BaseModel, Field
 
+from app.schemas.screen import ScreenBytes
+
 
 class Defect(BaseModel):
     """缺陷信息"""
@@ -14,7 +16,7 @@ class Defect(BaseModel):
 
 class FindDefectsRequest(BaseModel):
     """缺陷检测请求"""
-    screen: list[int] = Field(description="屏幕截图 (字节数组)")
+    screen: ScreenBytes = Field(description="屏幕截图 (有符号字节数组或 Base64 字符串)")
     assertion: str | None = Field(
         default=None,
         description="可选的断言条件，用于 assertWithAI 命令"
@@ -27,3 +29,29 @@ class FindDefectsResponse(BaseModel):
         default_factory=list,
         description="检测到的缺陷列表"
     )
+
+
+class FindDefectsBatchRequest(BaseModel):
+    """批量断言缺陷检测请求"""
+    screen: ScreenBytes = Field(description="屏幕截图 (有符号字节数组或 Base64 字符串)")
+    assertions: list[str] = Field(
+        min_length=1,
+        description="断言条件列表，在同一截图上逐条验证"
+    )
+
+
+class AssertionResult(BaseModel):
+    """单条断言的检测结果"""
+    assertion: str = Field(description="断言条件")
+    defects: list[Defect] = Field(
+        default_factory=list,
+        description="该断言对应的缺陷列表，与 /v2/find-defects 的返回一致"
+    )
+
+
+class FindDefectsBatchResponse(BaseModel):
+    """批量断言缺陷检测响应"""
+    results: list[AssertionResult] = Field(
+        default_factory=list,
+        description="与请求中 assertions 顺序一致的检测结果"
+    )
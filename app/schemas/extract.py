@@ -5,10 +5,12 @@ Maestro AI Server - 文本提取相关 Schema 定义
 
 from pydantic import BaseModel, Field
 
+from app.schemas.screen import ScreenBytes
+
 
 class ExtractTextRequest(BaseModel):
     """文本提取请求"""
-    screen: list[int] = Field(description="屏幕截图 (字节数组)")
+    screen: ScreenBytes = Field(description="屏幕截图 (有符号字节数组或 Base64 字符串)")
     query: str = Field(description="查询条件，描述需要提取的文本")
 
 
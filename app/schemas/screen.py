@@ -0,0 +1,41 @@
+"""
+Maestro AI Server - 屏幕截图字段类型
+@author LJY
+"""
+
+from typing import Annotated, Any
+
+from pydantic import BeforeValidator, WithJsonSchema
+
+from app.core import ImageProcessingError
+from app.utils.image import decode_base64_image, decode_byte_array_image
+
+
+def _coerce_screen(value: Any) -> bytes:
+    """
+    将请求中的 screen 字段直接转换为 bytes
+    跳过 list[int] 的逐元素校验和复制，由 decode_byte_array_image 一次性完成转换；
+    字符串按 Base64 (可带 data:image/...;base64, 前缀) 解码
+    """
+    try:
+        if isinstance(value, (bytes, bytearray, list)):
+            return decode_byte_array_image(value)
+        if isinstance(value, str):
+            return decode_base64_image(value)
+    except ImageProcessingError as e:
+        raise ValueError(str(e)) from e
+    raise ValueError("screen 必须是字节数组或 Base64 字符串")
+
+
+# 屏幕截图 (Maestro CLI 发送的有符号字节数组，或 Base64 字符串)，校验后即为原始图像字节
+ScreenBytes = Annotated[
+    bytes,
+    BeforeValidator(_coerce_screen),
+    WithJsonSchema({
+        "anyOf": [
+            {"type": "array", "items": {"type": "integer", "minimum": -128, "maximum": 255}},
+            {"type": "string", "contentEncoding": "base64"},
+        ],
+        "description": "屏幕截图 (有符号字节数组或 Base64 字符串)",
+    }),
+]
@@ -3,12 +3,23 @@ Maestro AI Server - 缺陷检测服务
 @author LJY
 """
 
+import asyncio
+from typing import Any
+
 import structlog
 
-from app.agents import DefectDetectionAgent
-from app.core.llm import create_llm_client
+from app.agents import BatchDefectDetectionAgent, DefectDetectionAgent
+from app.config import get_settings
+from app.core import ValidationError
+from app.core.cache import ResultCache, get_result_cache, make_cache_key, normalize_text
+from app.core.executor import get_image_executor
+from app.core.llm import get_llm_router
+from app.core.metrics import hold_screen_bytes, time_stage
+from app.core.prechecks import get_prechecker
+from app.core.similarity import get_near_duplicate_index, near_duplicate_scope
+from app.core.singleflight import SingleFlight
 from app.schemas import Defect
-from app.utils import decode_byte_array_image
+from app.utils.image import PreparedImage, compute_content_hash, compute_perceptual_hash
 
 logger = structlog.get_logger()
 
@@ -17,34 +28,72 @@ class DefectService:
     """缺陷检测服务"""
     
     def __init__(self):
-        llm = create_llm_client()
-        self.agent = DefectDetectionAgent(llm)
+        router = get_llm_router()
+        self.agent = DefectDetectionAgent(router)
+        self.batch_agent = BatchDefectDetectionAgent(router)
+        self.settings = get_settings()
+        self.cache = get_result_cache(self.settings)
+        self.near_duplicates = get_near_duplicate_index(self.settings)
+        self.prechecker = get_prechecker(self.settings)
+        self.inflight = SingleFlight("find_defects")
     
     async def find_defects(
         self,
-        screen: list[int],
-        assertion: str | None = None
+        screen: bytes,
+        assertion: str | None = None,
+        use_cache: bool = True
     ) -> list[Defect]:
         """
         检测屏幕截图中的缺陷
         
         Args:
-            screen: 字节数组格式的屏幕截图 (Maestro CLI 发送的有符号字节数组)
+            screen: 屏幕截图原始字节 (已由请求 schema 从有符号字节数组解码)
             assertion: 可选的断言条件
+            use_cache: 是否使用结果缓存
         
         Returns:
             检测到的缺陷列表
         """
-        # 将有符号字节数组转换为 bytes
-        image_data = decode_byte_array_image(screen)
+        with hold_screen_bytes(len(screen)):
+            with time_stage("content_hash"):
+                content_hash = await get_image_executor().run(compute_content_hash, screen)
+            image = PreparedImage(screen, content_hash=content_hash)
+            return await self._find_defects(image, assertion, use_cache)
+    
+    async def _find_defects(
+        self,
+        image: PreparedImage,
+        assertion: str | None,
+        use_cache: bool
+    ) -> list[Defect]:
+        """单条断言检测: 缓存 → 近似截图 → 本地预检 → 合并并发请求后调用 Agent"""
+        cache = self.cache if use_cache else None
+        cache_key = make_cache_key(self.agent.cache_namespace, image.content_hash, assertion)
+        fingerprint = None
+        if cache is not None:
+            with time_stage("cache_lookup"):
+                cached = await cache.get(cache_key)
+            if cached is None and self.near_duplicates is not None:
+                with time_stage("near_duplicate_lookup"):
+                    fingerprint, cached = await self._find_near_duplicate(image.data, assertion, cache)
+            if cached is not None:
+                logger.info("find_defects_cache_hit", defect_count=len(cached))
+                return [Defect.model_validate(d) for d in cached]
         
-        logger.info(
-            "find_defects_start",
-            has_assertion=assertion is not None,
-            image_size=len(image_data)
-        )
+        hints: list[str] = []
+        if self.prechecker is not None:
+            with time_stage("precheck"):
+                precheck = await self.prechecker.run(image, assertion)
+            if precheck.defects is not None:
+                logger.info("find_defects_precheck_hit", rule=precheck.rule, defect_count=len(precheck.defects))
+                return precheck.defects
+            hints = precheck.hints
         
-        defects = await self.agent.detect(image_data, assertion)
+        # 相同截图和断言的并发请求共享同一次 LLM 调用
+        defects = await self.inflight.do(
+            cache_key,
+            lambda: self._detect(image, assertion, cache, cache_key, fingerprint, hints)
+        )
         
         logger.info(
             "find_defects_complete",
@@ -52,6 +101,175 @@ class DefectService:
         )
         
         return defects
+    
+    async def find_defects_batch(
+        self,
+        screen: bytes,
+        assertions: list[str],
+        use_cache: bool = True
+    ) -> list[list[Defect]]:
+        """
+        在同一截图上批量验证断言
+        
+        未命中缓存的断言按 batch_chunk_size 分组，每组一次 LLM 调用；
+        批量结构化输出无效时该组回退为并发的单条断言调用
+        
+        Args:
+            screen: 屏幕截图原始字节
+            assertions: 断言条件列表
+            use_cache: 是否使用结果缓存
+        
+        Returns:
+            与 assertions 一一对应的缺陷列表
+        """
+        with hold_screen_bytes(len(screen)):
+            with time_stage("content_hash"):
+                content_hash = await get_image_executor().run(compute_content_hash, screen)
+            image = PreparedImage(screen, content_hash=content_hash)
+            return await self._find_defects_batch(image, assertions, use_cache)
+    
+    async def _find_defects_batch(
+        self,
+        image: PreparedImage,
+        assertions: list[str],
+        use_cache: bool
+    ) -> list[list[Defect]]:
+        """批量断言检测: 逐条查缓存，未命中的断言分组调用 Agent"""
+        cache = self.cache if use_cache else None
+        namespace = self.batch_agent.cache_namespace
+        
+        # 归一化后相同的断言只验证一次
+        unique: dict[str, str] = {}
+        for assertion in assertions:
+            unique.setdefault(normalize_text(assertion), assertion)
+        
+        results: dict[str, list[Defect]] = {}
+        if cache is not None:
+            with time_stage("cache_lookup"):
+                for key, assertion in unique.items():
+                    cached = await cache.get(make_cache_key(namespace, image.content_hash, assertion))
+                    if cached is not None:
+                        results[key] = [Defect.model_validate(d) for d in cached]
+        
+        missing = [key for key in unique if key not in results]
+        size = self.settings.batch_chunk_size
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+        
+        logger.info(
+            "find_defects_batch_start",
+            assertions=len(assertions),
+            unique=len(unique),
+            cached=len(results),
+            llm_calls=len(chunks),
+        )
+        
+        if chunks:
+            image = await self.agent.prepare_image(image)
+            verdicts = await asyncio.gather(*(
+                self._detect_batch(image, [unique[key] for key in chunk], cache, use_cache)
+                for chunk in chunks
+            ))
+            for chunk, defects in zip(chunks, verdicts):
+                results.update(zip(chunk, defects))
+        
+        return [results[normalize_text(assertion)] for assertion in assertions]
+    
+    async def _detect_batch(
+        self,
+        image: PreparedImage,
+        assertions: list[str],
+        cache: ResultCache | None,
+        use_cache: bool
+    ) -> list[list[Defect]]:
+        """一次 LLM 调用验证一组断言，输出无效时回退为并发的单条调用"""
+        namespace = self.batch_agent.cache_namespace
+        flight_key = make_cache_key(namespace, image.content_hash, "\x00".join(sorted(assertions)))
+        
+        async def detect() -> list[list[Defect]]:
+            defects = await self.batch_agent.detect_batch(image, assertions)
+            if cache is not None:
+                for assertion, items in zip(assertions, defects):
+                    await cache.set(
+                        make_cache_key(namespace, image.content_hash, assertion),
+                        [d.model_dump() for d in items],
+                    )
+            return defects
+        
+        try:
+            return await self.inflight.do(flight_key, detect)
+        except ValidationError as e:
+            logger.warning("find_defects_batch_fallback", assertions=len(assertions), error=str(e))
+            return list(await asyncio.gather(*(
+                self._find_defects(image, assertion, use_cache)
+                for assertion in assertions
+            )))
+    
+    async def _detect(
+        self,
+        image: PreparedImage,
+        assertion: str | None,
+        cache: ResultCache | None,
+        cache_key: str,
+        fingerprint: int | None,
+        hints: list[str] | None = None
+    ) -> list[Defect]:
+        """调用 Agent 检测缺陷并写入缓存"""
+        # 预处理一次，Agent 内部的调用和重试复用同一份结果
+        image = await self.agent.prepare_image(image)
+        
+        logger.info(
+            "find_defects_start",
+            has_assertion=assertion is not None,
+            image_size=len(image.data),
+            image_dimensions=image.size,
+            precheck_hints=len(hints or ()),
+        )
+        
+        defects = await self.agent.detect(image, assertion, hints=hints)
+        
+        if cache is not None:
+            await cache.set(cache_key, [d.model_dump() for d in defects])
+            if fingerprint is not None:
+                self.near_duplicates.add(
+                    near_duplicate_scope(self.agent.cache_namespace, assertion),
+                    fingerprint,
+                    cache_key,
+                )
+        
+        return defects
+    
+    async def _find_near_duplicate(
+        self,
+        screen: bytes,
+        assertion: str | None,
+        cache: ResultCache
+    ) -> tuple[int, Any | None]:
+        """
+        按感知哈希查找近似截图的缓存结果
+        
+        Returns:
+            (当前截图的感知哈希, 近似截图的缓存结果或 None)
+        """
+        fingerprint = await get_image_executor().run(
+            compute_perceptual_hash,
+            screen,
+            self.settings.near_duplicate_hash_size,
+            self.settings.near_duplicate_mask_top,
+            self.settings.near_duplicate_mask_bottom,
+        )
+        
+        scope = near_duplicate_scope(self.agent.cache_namespace, assertion)
+        near_key = self.near_duplicates.find(scope, fingerprint)
+        if near_key is None:
+            return fingerprint, None
+        
+        cached = await cache.get(near_key)
+        if cached is None:
+            # 结果已过期或被淘汰
+            self.near_duplicates.discard(scope, near_key)
+        else:
+            logger.info("find_defects_near_duplicate_hit")
+        return fingerprint, cached
 
 
 # 服务单例
@@ -64,3 +282,9 @@ def get_defect_service() -> DefectService:
     if _defect_service is None:
         _defect_service = DefectService()
     return _defect_service
+
+
+def reset_defect_service() -> None:
+    """丢弃缺陷检测服务单例 (随 LLM 路由一起在关闭时重置)"""
+    global _defect_service
+    _defect_service = None
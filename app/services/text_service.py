@@ -6,8 +6,12 @@ Maestro AI Server - 文本提取服务
 import structlog
 
 from app.agents import TextExtractionAgent
-from app.core.llm import create_llm_client
-from app.utils import decode_byte_array_image
+from app.core.cache import ResultCache, get_result_cache, make_cache_key
+from app.core.executor import get_image_executor
+from app.core.llm import get_llm_router
+from app.core.metrics import hold_screen_bytes, time_stage
+from app.core.singleflight import SingleFlight
+from app.utils.image import PreparedImage, compute_content_hash
 
 logger = structlog.get_logger()
 
@@ -16,37 +20,76 @@ class TextService:
     """文本提取服务"""
     
     def __init__(self):
-        llm = create_llm_client()
-        self.agent = TextExtractionAgent(llm)
+        self.agent = TextExtractionAgent(get_llm_router())
+        self.cache = get_result_cache()
+        self.inflight = SingleFlight("extract_text")
     
-    async def extract_text(self, screen: list[int], query: str) -> str:
+    async def extract_text(self, screen: bytes, query: str, use_cache: bool = True) -> str:
         """
         从屏幕截图中提取文本
         
         Args:
-            screen: 字节数组格式的屏幕截图
+            screen: 屏幕截图原始字节 (已由请求 schema 从有符号字节数组解码)
             query: 查询条件
+            use_cache: 是否使用结果缓存
         
         Returns:
             提取的文本
         """
-        # 将有符号字节数组转换为 bytes
-        image_data = decode_byte_array_image(screen)
+        with hold_screen_bytes(len(screen)):
+            with time_stage("content_hash"):
+                content_hash = await get_image_executor().run(compute_content_hash, screen)
+            image = PreparedImage(screen, content_hash=content_hash)
+            return await self._extract_text(image, query, use_cache)
+    
+    async def _extract_text(self, image: PreparedImage, query: str, use_cache: bool) -> str:
+        """缓存 → 合并并发请求后调用 Agent"""
+        cache = self.cache if use_cache else None
+        cache_key = make_cache_key(self.agent.cache_namespace, image.content_hash, query)
+        if cache is not None:
+            with time_stage("cache_lookup"):
+                cached = await cache.get(cache_key)
+            if cached is not None:
+                logger.info("extract_text_cache_hit", text_length=len(cached))
+                return cached
         
-        logger.info(
-            "extract_text_start",
-            query=query,
-            image_size=len(image_data)
+        # 相同截图和查询的并发请求共享同一次 LLM 调用
+        text = await self.inflight.do(
+            cache_key,
+            lambda: self._extract(image, query, cache, cache_key)
         )
         
-        text = await self.agent.extract(image_data, query)
-        
         logger.info(
             "extract_text_complete",
             text_length=len(text)
         )
         
         return text
+    
+    async def _extract(
+        self,
+        image: PreparedImage,
+        query: str,
+        cache: ResultCache | None,
+        cache_key: str
+    ) -> str:
+        """调用 Agent 提取文本并写入缓存"""
+        # 预处理一次，Agent 内部的调用和重试复用同一份结果
+        image = await self.agent.prepare_image(image)
+        
+        logger.info(
+            "extract_text_start",
+            query=query,
+            image_size=len(image.data),
+            image_dimensions=image.size,
+        )
+        
+        text = await self.agent.extract(image, query)
+        
+        if cache is not None:
+            await cache.set(cache_key, text)
+        
+        return text
 
 
 # 服务单例
@@ -59,3 +102,9 @@ def get_text_service() -> TextService:
     if _text_service is None:
         _text_service = TextService()
     return _text_service
+
+
+def reset_text_service() -> None:
+    """丢弃文本提取服务单例 (随 LLM 路由一起在关闭时重置)"""
+    global _text_service
+    _text_service = None
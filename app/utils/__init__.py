@@ -4,19 +4,31 @@ Maestro AI Server - 工具模块
 """
 
 from app.utils.image import (
+    FrameStats,
+    PreparedImage,
+    compute_content_hash,
+    compute_frame_stats,
+    compute_perceptual_hash,
     decode_base64_image,
     decode_byte_array_image,
     encode_image_to_base64,
     get_image_mime_type,
+    prepare_image,
     resize_image_if_needed,
     validate_image,
 )
 
 __all__ = [
+    "FrameStats",
+    "PreparedImage",
+    "compute_content_hash",
+    "compute_frame_stats",
+    "compute_perceptual_hash",
     "decode_base64_image",
     "decode_byte_array_image",
     "encode_image_to_base64",
     "get_image_mime_type",
+    "prepare_image",
     "resize_image_if_needed",
     "validate_image",
 ]
@@ -4,12 +4,26 @@ Maestro AI Server - 图像处理工具
 """
 
 import base64
+import hashlib
+import time
+from array import array
+from functools import cached_property
 from io import BytesIO
 
-from PIL import Image
+from PIL import Image, ImageStat
 
 from app.core import ImageProcessingError
 
+# 发送给 LLM 的图像最大尺寸
+DEFAULT_MAX_SIZE = (2048, 2048)
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
 
 def validate_image(image_data: bytes) -> bool:
     """验证图像数据是否有效"""
@@ -36,14 +50,31 @@ def decode_base64_image(base64_string: str | bytes) -> bytes:
         raise ImageProcessingError(f"Base64 解码失败: {e}")
 
 
-def decode_byte_array_image(byte_array: list[int]) -> bytes:
+def decode_byte_array_image(byte_array: list[int] | bytes | bytearray) -> bytes:
     """
     将 Maestro CLI 发送的有符号字节数组转换为 bytes
     Kotlin/JVM 的 byte 是有符号的 (-128 到 127), 需要转换为无符号 (0 到 255)
+    
+    使用 array('b') 在 C 层完成有符号到无符号的按位重解释，
+    不再为每个元素执行 Python 层的 & 0xFF 运算
     """
-    # 将有符号字节转换为无符号字节
-    unsigned_bytes = [(b & 0xFF) for b in byte_array]
-    return bytes(unsigned_bytes)
+    if isinstance(byte_array, (bytes, bytearray)):
+        return bytes(byte_array)
+    
+    buffer = array("b")
+    try:
+        buffer.fromlist(byte_array)
+        return buffer.tobytes()
+    except OverflowError:
+        # 兼容已是无符号 (0 到 255) 的数组，保持原有 & 0xFF 语义
+        pass
+    except TypeError as e:
+        raise ImageProcessingError(f"字节数组解码失败: {e}")
+    
+    try:
+        return bytes([b & 0xFF for b in byte_array])
+    except TypeError as e:
+        raise ImageProcessingError(f"字节数组解码失败: {e}")
 
 
 def encode_image_to_base64(image_data: bytes) -> str:
@@ -55,20 +86,23 @@ def get_image_mime_type(image_data: bytes) -> str:
     """获取图像 MIME 类型"""
     try:
         img = Image.open(BytesIO(image_data))
-        format_map = {
-            "PNG": "image/png",
-            "JPEG": "image/jpeg",
-            "GIF": "image/gif",
-            "WEBP": "image/webp",
-        }
-        return format_map.get(img.format, "image/png")
+        return MIME_TYPES.get(img.format, "image/png")
     except Exception:
         return "image/png"  # 默认 PNG
 
 
+def _thumbnail(img: Image.Image, max_size: tuple[int, int]) -> bytes:
+    """保持宽高比缩放并按原格式重新编码"""
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    
+    output = BytesIO()
+    img.save(output, format=img.format or "PNG")
+    return output.getvalue()
+
+
 def resize_image_if_needed(
     image_data: bytes,
-    max_size: tuple[int, int] = (2048, 2048)
+    max_size: tuple[int, int] = DEFAULT_MAX_SIZE
 ) -> bytes:
     """
     如果图像过大则缩放
@@ -80,11 +114,217 @@ def resize_image_if_needed(
         if img.width <= max_size[0] and img.height <= max_size[1]:
             return image_data
         
-        # 保持宽高比缩放
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        output = BytesIO()
-        img.save(output, format=img.format or "PNG")
-        return output.getvalue()
+        return _thumbnail(img, max_size)
     except Exception as e:
         raise ImageProcessingError(f"图像缩放失败: {e}")
+
+
+def compute_content_hash(image_data: bytes) -> str:
+    """计算图像字节的 SHA-256，用于结果缓存寻址"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def compute_perceptual_hash(
+    image_data: bytes,
+    hash_size: int = 16,
+    mask_top: float = 0.0,
+    mask_bottom: float = 0.0
+) -> int:
+    """
+    计算图像的感知哈希 (dHash)，返回 hash_size * hash_size 位整数
+    缩小为 (hash_size + 1) x hash_size 的灰度图后比较相邻像素亮度；
+    mask_top / mask_bottom 为按高度比例裁掉的顶部/底部区域 (状态栏时钟、电量等会变化的区域)
+    """
+    try:
+        img = Image.open(BytesIO(image_data))
+        # JPEG 可在解码阶段直接降采样
+        img.draft("RGB", ((hash_size + 1) * 8, hash_size * 8))
+        if img.mode not in ("L", "RGB", "RGBA"):
+            img = img.convert("RGB")
+        
+        width, height = img.size
+        top = int(height * mask_top)
+        bottom = height - int(height * mask_bottom)
+        if bottom > top:
+            img = img.crop((0, top, width, bottom))
+        
+        small = img.resize((hash_size + 1, hash_size), Image.Resampling.BOX).convert("L")
+        pixels = small.tobytes()
+    except Exception as e:
+        raise ImageProcessingError(f"感知哈希计算失败: {e}")
+    
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return bits
+
+
+class FrameStats:
+    """
+    截图像素统计，由 compute_frame_stats 在缩小后的副本上计算
+    
+    - channel_range: RGB 各通道 (最大值 - 最小值) 中的最大者，0 表示单一颜色
+    - mean: RGB 各通道均值
+    - luma_mean / luma_stddev / luma_max: 灰度均值、标准差和最大值
+    """
+    
+    def __init__(
+        self,
+        size: tuple[int, int],
+        channel_range: int,
+        mean: tuple[float, float, float],
+        luma_mean: float,
+        luma_stddev: float,
+        luma_max: int
+    ):
+        self.size = size
+        self.channel_range = channel_range
+        self.mean = mean
+        self.luma_mean = luma_mean
+        self.luma_stddev = luma_stddev
+        self.luma_max = luma_max
+    
+    @property
+    def mean_color(self) -> str:
+        """均值颜色，#rrggbb"""
+        return "#" + "".join(f"{round(c):02x}" for c in self.mean)
+
+
+def compute_frame_stats(
+    image_data: bytes,
+    sample_size: int = 256,
+    mask_top: float = 0.0,
+    mask_bottom: float = 0.0
+) -> FrameStats:
+    """
+    计算截图的像素统计，用于纯色/黑屏等本地预检
+    先裁掉顶部/底部 (状态栏、导航栏) 再按 BOX 缩小到 sample_size 以内，
+    统计由 Pillow 的 ImageStat 在 C 层完成；BOX 缩小保留小面积文字造成的亮度差异
+    """
+    try:
+        img = Image.open(BytesIO(image_data))
+        size = img.size
+        img.draft("RGB", (sample_size, sample_size))
+        img = img.convert("RGB")
+        
+        width, height = img.size
+        top = int(height * mask_top)
+        bottom = height - int(height * mask_bottom)
+        if bottom > top:
+            img = img.crop((0, top, width, bottom))
+        img.thumbnail((sample_size, sample_size), Image.Resampling.BOX)
+        
+        rgb = ImageStat.Stat(img)
+        luma = ImageStat.Stat(img.convert("L"))
+    except Exception as e:
+        raise ImageProcessingError(f"像素统计计算失败: {e}")
+    
+    return FrameStats(
+        size=size,
+        channel_range=max(high - low for low, high in rgb.extrema),
+        mean=tuple(rgb.mean),
+        luma_mean=luma.mean[0],
+        luma_stddev=luma.stddev[0],
+        luma_max=luma.extrema[0][1],
+    )
+
+
+class PreparedImage:
+    """
+    预处理图像
+    只解析一次图像头部，仅在需要缩放时才解码像素；
+    格式、尺寸、内容哈希、缩放后字节和 Base64 均按需计算并缓存，
+    同一张截图的重试和多次调用复用同一份结果；
+    timings 记录缩放和 Base64 编码的耗时 (秒)，随对象一起从工作进程返回，供指标统计
+    """
+    
+    def __init__(
+        self,
+        data: bytes,
+        max_size: tuple[int, int] = DEFAULT_MAX_SIZE,
+        content_hash: str | None = None
+    ):
+        self.data = data
+        self.max_size = max_size
+        self.timings: dict[str, float] = {}
+        if content_hash is not None:
+            # 已在别处计算过哈希时直接填充缓存
+            self.content_hash = content_hash
+    
+    @cached_property
+    def _header(self) -> tuple[str | None, tuple[int, int]]:
+        """图像格式和尺寸 (Image.open 只读取头部，不解码像素)"""
+        try:
+            img = Image.open(BytesIO(self.data))
+            return img.format, img.size
+        except Exception as e:
+            raise ImageProcessingError(f"无法识别的图像数据: {e}")
+    
+    @property
+    def format(self) -> str | None:
+        """图像格式，如 PNG / JPEG"""
+        return self._header[0]
+    
+    @property
+    def size(self) -> tuple[int, int]:
+        """原始图像尺寸 (宽, 高)"""
+        return self._header[1]
+    
+    @property
+    def mime_type(self) -> str:
+        """图像 MIME 类型 (缩放后保持原格式)"""
+        return MIME_TYPES.get(self.format, "image/png")
+    
+    @property
+    def needs_resize(self) -> bool:
+        """是否超出最大尺寸"""
+        width, height = self.size
+        return width > self.max_size[0] or height > self.max_size[1]
+    
+    @cached_property
+    def content_hash(self) -> str:
+        """原始图像字节的 SHA-256"""
+        return compute_content_hash(self.data)
+    
+    @cached_property
+    def payload(self) -> bytes:
+        """发送给 LLM 的图像字节 (必要时缩放)"""
+        if not self.needs_resize:
+            return self.data
+        started = time.perf_counter()
+        try:
+            return _thumbnail(Image.open(BytesIO(self.data)), self.max_size)
+        except Exception as e:
+            raise ImageProcessingError(f"图像缩放失败: {e}")
+        finally:
+            self.timings["resize"] = time.perf_counter() - started
+    
+    @cached_property
+    def base64(self) -> str:
+        """payload 的 Base64 编码"""
+        payload = self.payload
+        started = time.perf_counter()
+        encoded = encode_image_to_base64(payload)
+        self.timings["base64"] = time.perf_counter() - started
+        return encoded
+    
+    @property
+    def is_prepared(self) -> bool:
+        """LLM 所需的派生结果是否都已计算"""
+        return "base64" in self.__dict__ and "content_hash" in self.__dict__
+    
+    def prepare(self) -> "PreparedImage":
+        """计算 LLM 调用所需的全部派生结果，供执行器在工作线程/进程中调用"""
+        self.content_hash
+        self.base64
+        return self
+
+
+def prepare_image(
+    image_data: bytes,
+    max_size: tuple[int, int] = DEFAULT_MAX_SIZE
+) -> PreparedImage:
+    """创建并完成预处理的 PreparedImage，作为单个任务提交到图像处理执行器"""
+    return PreparedImage(image_data, max_size).prepare()
@@ -0,0 +1,196 @@
+"""
+Maestro AI Server - 请求体增量解析器
+随 ASGI receive 消息逐块解析 {"screen": [...], ...}，screen 数组直接写入字节缓冲区
+@author LJY
+"""
+
+import json
+from typing import Any
+
+from app.core import ImageProcessingError
+from app.utils.image import decode_byte_array_image
+
+_WHITESPACE = b" \t\r\n"
+
+# 数组中单个数字 token 的最大长度，防止恶意请求让跨块缓存无限增长
+_MAX_NUMBER_TOKEN = 32
+
+# 每次交给 json 解码的数组文本字节数，限制同时存在的 Python int 列表大小
+_ARRAY_BATCH = 16 * 1024
+
+
+def _find_string_end(chunk: bytes, pos: int) -> int:
+    """下一个引号或反斜杠的位置，没有时返回块末尾"""
+    quote = chunk.find(b'"', pos)
+    backslash = chunk.find(b"\\", pos, quote if quote >= 0 else len(chunk))
+    if backslash >= 0:
+        return backslash
+    return quote if quote >= 0 else len(chunk)
+
+
+class ScreenBodyParser:
+    """
+    screen 请求体增量解析器
+    
+    - screen 字段的字节数组按块解码进 bytearray，不保留完整的 JSON 文本
+    - 其余小字段 (assertion / query 等) 原样保留，screen 位置以 null 占位，结束时一次性 json 解析
+    
+    用法:
+        parser = ScreenBodyParser()
+        async for chunk in request.stream():
+            parser.feed(chunk)
+        fields = parser.close()
+    """
+    
+    def __init__(self, field: str = "screen"):
+        self._field = field.encode()
+        self._screen = bytearray()
+        self._has_screen = False
+        self._rest = bytearray()
+        
+        # 外层 JSON 扫描状态
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key: bytearray | None = None
+        self._last_key = b""
+        self._await_value = False
+        
+        # screen 数组解析状态
+        self._in_array = False
+        self._carry = b""
+        # 已解码的部分以逗号结束，数组结束前还必须有一个元素
+        self._after_comma = False
+    
+    def feed(self, chunk: bytes) -> None:
+        """喂入一块请求体"""
+        pos = 0
+        size = len(chunk)
+        while pos < size:
+            if self._in_array:
+                pos = self._feed_array(chunk, pos)
+            else:
+                pos = self._feed_outer(chunk, pos)
+    
+    def close(self) -> dict[str, Any]:
+        """结束解析，返回字段字典，screen 为原始图像字节"""
+        if self._in_array or self._in_string or self._depth != 0:
+            raise ValueError("请求体 JSON 不完整")
+        
+        try:
+            fields = json.loads(self._rest) if self._rest.strip() else None
+        except ValueError as e:
+            raise ValueError(f"请求体 JSON 解析失败: {e}") from e
+        
+        if not isinstance(fields, dict):
+            raise ValueError("请求体必须是 JSON 对象")
+        
+        if self._has_screen:
+            fields[self._field.decode()] = bytes(self._screen)
+            self._screen = bytearray()
+        return fields
+    
+    def _feed_outer(self, chunk: bytes, pos: int) -> int:
+        """逐字节扫描 screen 以外的 JSON，遇到顶层 screen 数组时切换到数组模式"""
+        size = len(chunk)
+        while pos < size:
+            c = chunk[pos]
+            
+            if self._in_string:
+                if not self._escape and self._key is None and c != 0x22 and c != 0x5C:
+                    # 字符串值 (如 Base64 的 screen) 整段复制到下一个引号或反斜杠
+                    end = _find_string_end(chunk, pos)
+                    self._rest += chunk[pos:end]
+                    pos = end
+                    continue
+                self._rest.append(c)
+                if self._escape:
+                    self._escape = False
+                elif c == 0x5C:  # \
+                    self._escape = True
+                elif c == 0x22:  # "
+                    self._in_string = False
+                    if self._key is not None:
+                        self._last_key = bytes(self._key)
+                        self._key = None
+                elif self._key is not None:
+                    self._key.append(c)
+                pos += 1
+                continue
+            
+            if self._await_value:
+                if c in _WHITESPACE:
+                    pos += 1
+                    continue
+                self._await_value = False
+                if c == 0x5B and self._last_key == self._field:  # [
+                    self._rest += b"null"
+                    self._has_screen = True
+                    self._in_array = True
+                    return pos + 1
+            
+            self._rest.append(c)
+            if c == 0x22:
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key = bytearray()
+                    self._expect_key = False
+            elif c in b"{[":
+                self._depth += 1
+                self._expect_key = c == 0x7B and self._depth == 1
+            elif c in b"}]":
+                self._depth -= 1
+            elif c == 0x2C and self._depth == 1:  # ,
+                self._expect_key = True
+            elif c == 0x3A and self._depth == 1:  # :
+                self._await_value = True
+            pos += 1
+        return pos
+    
+    def _decode_numbers(self, data: bytes) -> None:
+        """
+        按逗号切成不超过约 _ARRAY_BATCH 字节的批次解码，每批的 int 列表用完即释放
+        
+        数字仍由 json 在 C 层解析: 纯 Python 逐 token 查表 (split + dict) 实测比 json.loads 慢约 30%、内存高约 70%
+        """
+        pos = 0
+        size = len(data)
+        # 末尾的逗号留在最后一批，由 json 报错，不能被切分吞掉
+        limit = len(data.rstrip(_WHITESPACE)) - 1
+        while pos < size:
+            end = data.find(b",", pos + _ARRAY_BATCH, limit)
+            if end < 0:
+                end = size
+            try:
+                self._screen += decode_byte_array_image(json.loads(b"[" + data[pos:end] + b"]"))
+            except (ValueError, ImageProcessingError) as e:
+                raise ValueError(f"screen 数组解析失败: {e}") from e
+            pos = end + 1
+    
+    def _feed_array(self, chunk: bytes, pos: int) -> int:
+        """解析 screen 数组的一段，数字 token 可能跨块，未完成的部分留到下一块"""
+        end = chunk.find(b"]", pos)
+        data = self._carry + (chunk[pos:] if end < 0 else chunk[pos:end])
+        
+        if end < 0:
+            cut = data.rfind(b",")
+            if cut < 0:
+                if len(data) > _MAX_NUMBER_TOKEN:
+                    raise ValueError("screen 数组包含非法元素")
+                self._carry = data
+                return len(chunk)
+            self._carry = data[cut + 1:]
+            data = data[:cut]
+            self._after_comma = True
+        else:
+            if self._after_comma and not data.strip(_WHITESPACE):
+                raise ValueError("screen 数组解析失败: 末尾多余的逗号")
+            self._carry = b""
+            self._after_comma = False
+            self._in_array = False
+        
+        if data.strip(_WHITESPACE):
+            self._decode_numbers(data)
+        
+        return len(chunk) if end < 0 else end + 1
@@ -0,0 +1,4 @@
+"""
+Maestro AI Server - 性能基准
+@author LJY
+"""
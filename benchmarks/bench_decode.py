@@ -0,0 +1,87 @@
+"""
+Maestro AI Server - screen 字节数组解码基准
+对比旧的 list[int] 校验 + 列表推导式解码、ScreenBytes 快速路径与流式解析
+
+运行: uv run python -m benchmarks.bench_decode
+@author LJY
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable
+
+from pydantic import BaseModel
+
+from app.schemas import ScreenBytes
+from app.utils.screen_parser import ScreenBodyParser
+
+# 与 uvicorn 单个 http.request 消息的典型大小一致
+CHUNK_SIZE = 64 * 1024
+
+
+class _LegacyRequest(BaseModel):
+    screen: list[int]
+
+
+class _FastRequest(BaseModel):
+    screen: ScreenBytes
+
+
+def _legacy(body: bytes) -> bytes:
+    request = _LegacyRequest.model_validate(json.loads(body))
+    return bytes([(b & 0xFF) for b in request.screen])
+
+
+def _fast(body: bytes) -> bytes:
+    return _FastRequest.model_validate(json.loads(body)).screen
+
+
+def _stream(body: bytes) -> bytes:
+    parser = ScreenBodyParser()
+    for i in range(0, len(body), CHUNK_SIZE):
+        parser.feed(body[i:i + CHUNK_SIZE])
+    return parser.close()["screen"]
+
+
+def _measure(fn: Callable[[bytes], bytes], payload: bytes, rounds: int) -> tuple[float, int]:
+    """返回 (单次平均耗时 ms, 峰值内存分配字节)"""
+    fn(payload)  # 预热
+    
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(payload)
+    elapsed = (time.perf_counter() - start) / rounds * 1000
+    
+    tracemalloc.start()
+    fn(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="256,1024,3072", help="截图大小 (KB)，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    
+    results = []
+    for size_kb in (int(s) for s in args.sizes.split(",")):
+        raw = os.urandom(size_kb * 1024)
+        # 与 Maestro CLI 一致: JSON 中的有符号字节数组
+        payload = json.dumps({"screen": [b - 256 if b > 127 else b for b in raw]}).encode()
+        
+        for name, fn in (("legacy", _legacy), ("fast", _fast), ("stream", _stream)):
+            assert fn(payload) == raw
+            ms, peak = _measure(fn, payload, args.rounds)
+            results.append({"size_kb": size_kb, "impl": name, "ms": round(ms, 2), "peak_bytes": peak})
+            print(f"{size_kb:>6} KB  {name:<7} {ms:>9.2f} ms  peak {peak / 1024 / 1024:>8.2f} MB")
+    
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Maestro AI Server - 截图上传编码基准
+对比有符号字节数组 JSON (Maestro CLI)、Base64 JSON、application/octet-stream 和 multipart
+四种上传方式的请求体大小与服务端解析耗时 (走与端点相同的 screen_body 依赖)
+
+运行: uv run python -m benchmarks.bench_encoding
+@author LJY
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+from typing import Callable
+
+from starlette.requests import Request
+
+from app.api.deps import screen_body
+from app.schemas import FindDefectsRequest
+
+# 与 uvicorn 单个 http.request 消息的典型大小一致
+CHUNK_SIZE = 64 * 1024
+
+ASSERTION = "页面显示登录按钮"
+BOUNDARY = "maestro-bench-boundary"
+
+
+def _int_array(raw: bytes) -> tuple[bytes, str, str]:
+    body = json.dumps({"screen": [b - 256 if b > 127 else b for b in raw], "assertion": ASSERTION}).encode()
+    return body, "application/json", ""
+
+
+def _base64(raw: bytes) -> tuple[bytes, str, str]:
+    body = json.dumps({"screen": base64.b64encode(raw).decode(), "assertion": ASSERTION}).encode()
+    return body, "application/json", ""
+
+
+def _octet_stream(raw: bytes) -> tuple[bytes, str, str]:
+    return raw, "application/octet-stream", "assertion=" + ASSERTION
+
+
+def _multipart(raw: bytes) -> tuple[bytes, str, str]:
+    body = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="assertion"\r\n\r\n{ASSERTION}\r\n'
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="screen"; filename="screen.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + raw + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={BOUNDARY}", ""
+
+
+ENCODINGS: dict[str, Callable[[bytes], tuple[bytes, str, str]]] = {
+    "int-array": _int_array,
+    "base64": _base64,
+    "octet-stream": _octet_stream,
+    "multipart": _multipart,
+}
+
+
+def _request(body: bytes, content_type: str, query: str) -> Request:
+    """构造与 uvicorn 一致的分块 ASGI 请求"""
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)] or [b""]
+    messages = iter(chunks)
+
+    async def receive() -> dict:
+        chunk = next(messages, None)
+        if chunk is None:
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": chunk, "more_body": chunk is not chunks[-1]}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v2/find-defects",
+        "query_string": query.encode(),
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def _measure(body: bytes, content_type: str, query: str, rounds: int) -> tuple[float, bytes]:
+    """返回 (单次平均解析耗时 ms, 解析出的截图)"""
+    parse = screen_body(FindDefectsRequest)
+    request = await parse(_request(body, content_type, query))  # 预热
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await parse(_request(body, content_type, query))
+    return (time.perf_counter() - start) / rounds * 1000, request.screen
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="256,1024,3072", help="截图大小 (KB)，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for size_kb in (int(s) for s in args.sizes.split(",")):
+        raw = os.urandom(size_kb * 1024)
+        for name, encode in ENCODINGS.items():
+            body, content_type, query = encode(raw)
+            ms, screen = asyncio.run(_measure(body, content_type, query, args.rounds))
+            assert screen == raw
+            results.append({
+                "size_kb": size_kb,
+                "encoding": name,
+                "body_bytes": len(body),
+                "inflation": round(len(body) / len(raw), 2),
+                "ms": round(ms, 2),
+            })
+            print(
+                f"{size_kb:>6} KB  {name:<13} body {len(body) / 1024:>9.0f} KB "
+                f"(x{len(body) / len(raw):.2f})  {ms:>8.2f} ms"
+            )
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Maestro AI Server - 图像预处理热路径微基准
+逐阶段测量 app/utils/image.py 中随截图大小增长的 CPU 开销 (字节数组解码、格式识别、哈希、
+缩放重编码、Base64、完整预处理、像素统计、感知哈希)，可对比不同的缩放滤波器和编码器，
+并与保存的基线对比，发现变慢的改动
+
+运行: uv run python -m benchmarks.bench_image
+真实截图: uv run python -m benchmarks.bench_image --images screenshots/
+滤波器/编码器对比: uv run python -m benchmarks.bench_image --alternatives
+保存基线: uv run python -m benchmarks.bench_image --save-baseline
+检查回归: uv run python -m benchmarks.bench_image --check --tolerance 1.3
+@author LJY
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable
+
+import PIL
+from PIL import Image
+
+from app.utils.image import (
+    DEFAULT_MAX_SIZE,
+    PreparedImage,
+    compute_content_hash,
+    compute_frame_stats,
+    compute_perceptual_hash,
+    decode_byte_array_image,
+    encode_image_to_base64,
+    get_image_mime_type,
+    prepare_image,
+    resize_image_if_needed,
+)
+from benchmarks.corpus import SCREEN_SIZES, generate_screenshot
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "bench_image.json"
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+# 低于该耗时 (毫秒) 的阶段不参与回归判断，避免计时噪声误报
+NOISE_FLOOR_MS = 1.0
+
+
+def _signed(data: bytes) -> list[int]:
+    return [b - 256 if b > 127 else b for b in data]
+
+
+# 服务端每个请求依次经过的阶段，参数为 (截图字节, 有符号字节数组)
+STAGES: dict[str, Callable[[bytes, list[int]], Any]] = {
+    "decode_byte_array": lambda data, signed: decode_byte_array_image(signed),
+    "mime_type": lambda data, signed: get_image_mime_type(data),
+    "header": lambda data, signed: PreparedImage(data).size,
+    "content_hash": lambda data, signed: compute_content_hash(data),
+    "resize": lambda data, signed: resize_image_if_needed(data),
+    "base64": lambda data, signed: encode_image_to_base64(data),
+    "prepare": lambda data, signed: prepare_image(data),
+    "frame_stats": lambda data, signed: compute_frame_stats(data, 256, 0.05, 0.05),
+    "perceptual_hash": lambda data, signed: compute_perceptual_hash(data),
+}
+
+# 缩放滤波器候选 (lanczos+reduce: thumbnail 先用 reduce() 整数倍缩小到目标的 2 倍以内再 LANCZOS)
+RESAMPLE_FILTERS = {
+    "lanczos": {"resample": Image.Resampling.LANCZOS},
+    "bicubic": {"resample": Image.Resampling.BICUBIC},
+    "bilinear": {"resample": Image.Resampling.BILINEAR},
+    "box": {"resample": Image.Resampling.BOX},
+    "lanczos+reduce": {"resample": Image.Resampling.LANCZOS, "reducing_gap": 2.0},
+}
+
+# 编码器候选，输出大小决定上传给 LLM 的字节数
+ENCODERS = {
+    "png": {"format": "PNG"},
+    "png-fast": {"format": "PNG", "compress_level": 1},
+    "jpeg-q85": {"format": "JPEG", "quality": 85},
+    "webp-q80": {"format": "WEBP", "quality": 80},
+}
+
+
+def measure(fn: Callable[[], Any], rounds: int) -> dict:
+    """
+    返回耗时中位数/最小值 (毫秒)、tracemalloc 峰值 (Python 堆) 和新建的 Pillow 图像缓冲区数
+    
+    Pillow 的像素缓冲区不经过 Python 分配器，不计入 peak_bytes，用 image_buffers 反映额外的像素副本
+    """
+    fn()  # 预热
+    durations = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - started) * 1000)
+    
+    before = Image.core.get_stats()["new_count"]
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        "ms": round(statistics.median(durations), 3),
+        "min_ms": round(min(durations), 3),
+        "peak_bytes": peak,
+        "image_buffers": Image.core.get_stats()["new_count"] - before,
+    }
+
+
+def load_corpus(sizes: list[str], image_dir: str | None) -> dict[str, bytes]:
+    """合成截图 (按分辨率) 加上目录中的真实截图"""
+    corpus = {name: generate_screenshot(SCREEN_SIZES[name]) for name in sizes}
+    if image_dir:
+        for path in sorted(Path(image_dir).iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                corpus[path.name] = path.read_bytes()
+    return corpus
+
+
+def run_stages(corpus: dict[str, bytes], rounds: int) -> dict[str, dict[str, dict]]:
+    results = {}
+    for name, data in corpus.items():
+        signed = _signed(data)
+        size = Image.open(BytesIO(data)).size
+        print(f"{name}  {size[0]}x{size[1]}  {len(data) / 1024:.0f} KB", file=sys.stderr)
+        results[name] = {}
+        for stage, fn in STAGES.items():
+            result = measure(lambda: fn(data, signed), rounds)
+            results[name][stage] = result
+            print(
+                f"  {stage:<18} {result['ms']:>9.2f} ms  "
+                f"peak {result['peak_bytes'] / 1024 / 1024:>7.2f} MB  buffers {result['image_buffers']}",
+                file=sys.stderr,
+            )
+    return results
+
+
+def run_alternatives(corpus: dict[str, bytes], rounds: int) -> dict[str, dict[str, dict]]:
+    """对比缩放滤波器的耗时，以及编码器 (编码当前 LANCZOS 缩放结果) 的耗时和输出大小"""
+    results = {}
+    for name, data in corpus.items():
+        source = Image.open(BytesIO(data))
+        source.load()
+        print(f"{name}  {source.width}x{source.height}", file=sys.stderr)
+        results[name] = {}
+        
+        for filter_name, options in RESAMPLE_FILTERS.items():
+            def resize(options=options) -> Image.Image:
+                img = source.copy()
+                img.thumbnail(DEFAULT_MAX_SIZE, **options)
+                return img
+            result = measure(resize, rounds)
+            results[name][f"resample:{filter_name}"] = result
+            print(f"  resample:{filter_name:<16} {result['ms']:>9.2f} ms", file=sys.stderr)
+        
+        resized = source.copy()
+        resized.thumbnail(DEFAULT_MAX_SIZE, Image.Resampling.LANCZOS)
+        for encoder_name, options in ENCODERS.items():
+            def encode(options=options) -> bytes:
+                output = BytesIO()
+                resized.save(output, **options)
+                return output.getvalue()
+            result = measure(encode, rounds)
+            result["output_bytes"] = len(encode())
+            results[name][f"encode:{encoder_name}"] = result
+            print(
+                f"  encode:{encoder_name:<18} {result['ms']:>9.2f} ms  {result['output_bytes'] / 1024:>8.0f} KB",
+                file=sys.stderr,
+            )
+    return results
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """返回比基线慢 tolerance 倍以上的阶段 (比较最小耗时，受机器负载干扰最小)"""
+    regressions = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get("results", {}).get(name, {}).get(stage)
+            if base is None or max(base["min_ms"], result["min_ms"]) < NOISE_FLOOR_MS:
+                continue
+            if result["min_ms"] > base["min_ms"] * tolerance:
+                regressions.append(f"{name} {stage}: {base['min_ms']:.2f} -> {result['min_ms']:.2f} ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SCREEN_SIZES), help=f"合成截图分辨率: {','.join(SCREEN_SIZES)}")
+    parser.add_argument("--images", help="真实截图目录")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--alternatives", action="store_true", help="对比缩放滤波器和编码器，而不是测量各阶段")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--check", action="store_true", help="与基线对比，有阶段变慢时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=1.3, help="允许的耗时倍数")
+    parser.add_argument("--output", help="结果 JSON 写入该文件")
+    args = parser.parse_args()
+    
+    corpus = load_corpus([s for s in args.sizes.split(",") if s], args.images)
+    if args.alternatives:
+        results = run_alternatives(corpus, args.rounds)
+    else:
+        results = run_stages(corpus, args.rounds)
+    
+    report = {"environment": _environment(), "rounds": args.rounds, "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"基线已保存到 {args.baseline}", file=sys.stderr)
+    print(json.dumps(report))
+    
+    if args.check:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("environment") != report["environment"]:
+            print("警告: 基线记录于不同的环境，结果仅供参考", file=sys.stderr)
+        regressions = check(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"变慢: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Maestro AI Server - 端到端压测
+启动 OpenAI 兼容的 LLM 桩服务 (benchmarks.llm_stub) 和指向它的服务进程，
+用合成截图语料按逐级增加的并发驱动 /v2/find-defects 和 /v2/extract-text，
+报告吞吐、p50/p95/p99 延迟、服务端事件循环延迟和峰值 RSS，结果输出为 JSON 便于跨提交对比
+
+运行: uv run python -m benchmarks.bench_load --concurrency 1,4,16,64 --duration 20 --output load.json
+对比: uv run python -m benchmarks.bench_load --compare old.json new.json
+@author LJY
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from benchmarks.corpus import SCREEN_SIZES, generate_corpus, unique_variant
+from benchmarks.llm_stub import add_stub_arguments
+
+# 服务端统计端点，仅在压测包装的应用中存在
+STATS_PATH = "/__bench__/stats"
+
+ENDPOINTS = {
+    "find-defects": ("/v2/find-defects", {}),
+    "extract-text": ("/v2/extract-text", {"query": "提取页面标题"}),
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近秩法分位数，q 取 0 ~ 100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# ============ 服务端: 事件循环延迟和内存统计 ============
+
+class LoopLagMonitor:
+    """每隔 interval 睡眠一次，实际唤醒时间超出 interval 的部分即为事件循环延迟"""
+    
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+    
+    def snapshot(self, reset: bool = False) -> dict:
+        samples = self.samples
+        if reset:
+            self.samples = []
+        return {
+            "loop_lag_p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "loop_lag_p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "loop_lag_max_ms": round(max(samples, default=0.0) * 1000, 2),
+        }
+
+
+def _peak_rss_mb() -> float:
+    """进程峰值 RSS (Linux 上 ru_maxrss 单位为 KB，macOS 上为字节)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class BenchInstrumentation:
+    """包装服务 ASGI 应用，启动事件循环延迟监控并提供 STATS_PATH 统计端点"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.monitor = LoopLagMonitor()
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "lifespan"):
+            self.monitor.start()
+        if scope["type"] == "http" and scope["path"] == STATS_PATH:
+            from app.core.http import get_http_client_stats
+            
+            reset = b"reset=1" in scope.get("query_string", b"")
+            stats = {
+                **self.monitor.snapshot(reset),
+                "peak_rss_mb": _peak_rss_mb(),
+                "connections": get_http_client_stats(),
+            }
+            await JSONResponse(stats)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def create_instrumented_app() -> ASGIApp:
+    """uvicorn --factory 入口"""
+    from app.main import app
+    
+    return BenchInstrumentation(app)
+
+
+# ============ 客户端: 请求构造和压测驱动 ============
+
+def _signed(data: bytes) -> str:
+    return ",".join(str(b - 256 if b > 127 else b) for b in data)
+
+
+class RequestFactory:
+    """
+    按上传格式构造请求，每个请求的截图字节都不同 (见 corpus.unique_variant)
+    
+    int-array 格式预先编码截图主体，每个请求只追加序号字节，避免压测客户端成为瓶颈
+    """
+    
+    def __init__(self, corpus: dict[str, list[bytes]], encoding: str, endpoints: list[str]):
+        self.screens = [screen for screens in corpus.values() for screen in screens]
+        self.encoding = encoding
+        self.endpoints = endpoints
+        self._encoded = [_signed(screen) for screen in self.screens] if encoding == "int-array" else None
+        self._nonce = 0
+        self._rng = random.Random(0)
+    
+    def next(self) -> tuple[str, str, dict]:
+        """返回 (端点名称, URL 路径, httpx 请求参数)"""
+        self._nonce += 1
+        name = self._rng.choice(self.endpoints)
+        path, fields = ENDPOINTS[name]
+        index = self._rng.randrange(len(self.screens))
+        headers = {"Authorization": "Bearer bench"}
+        
+        if self.encoding == "octet-stream":
+            content = unique_variant(self.screens[index], self._nonce)
+            headers["Content-Type"] = "application/octet-stream"
+            return name, path, {"content": content, "headers": headers, "params": fields}
+        
+        headers["Content-Type"] = "application/json"
+        if self.encoding == "base64":
+            screen = base64.b64encode(unique_variant(self.screens[index], self._nonce)).decode()
+            return name, path, {"content": json.dumps({**fields, "screen": screen}).encode(), "headers": headers}
+        
+        nonce = _signed(self._nonce.to_bytes(8, "big"))
+        head = json.dumps(fields)[:-1] + (", " if fields else "") + '"screen": ['
+        content = f"{head}{self._encoded[index]},{nonce}]}}".encode()
+        return name, path, {"content": content, "headers": headers}
+
+
+async def run_level(client: httpx.AsyncClient, factory: RequestFactory, concurrency: int, duration: float) -> dict:
+    """以固定并发 (闭环) 持续发送请求 duration 秒"""
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    per_endpoint: dict[str, list[float]] = {}
+    deadline = time.perf_counter() + duration
+    
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            name, path, kwargs = factory.next()
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            statuses[status] += 1
+            if status == "200":
+                latencies.append(elapsed)
+                per_endpoint.setdefault(name, []).append(elapsed)
+    
+    await client.get(STATS_PATH, params={"reset": 1})
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    server = (await client.get(STATS_PATH, params={"reset": 1})).json()
+    
+    total = sum(statuses.values())
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - statuses.get("200", 0),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1),
+        "endpoints_p95_ms": {
+            name: round(percentile(values, 95) * 1000, 1) for name, values in sorted(per_endpoint.items())
+        },
+        **server,
+    }
+
+
+# ============ 进程管理 ============
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出: {' '.join(process.args)}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"等待 {url} 就绪超时")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_processes(args: argparse.Namespace) -> tuple[list[subprocess.Popen], str]:
+    stub_port, app_port = _free_port(), _free_port()
+    log = open(args.server_log, "ab") if args.server_log else subprocess.DEVNULL
+    
+    stub = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.llm_stub",
+        "--port", str(stub_port),
+        "--latency-ms", str(args.latency_ms),
+        "--latency-dist", args.latency_dist,
+        "--latency-spread", str(args.latency_spread),
+        "--error-rate", str(args.error_rate),
+        "--error-status", str(args.error_status),
+    ], stdout=log, stderr=log)
+    
+    env = {
+        **os.environ,
+        "LLM_PROVIDER": "openai",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_MODEL": "stub-vision",
+        "LLM_BACKENDS": "[]",
+        "LANGCHAIN_TRACING_V2": "false",
+        "RESULT_CACHE_ENABLED": "false",
+    }
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "--factory", "benchmarks.bench_load:create_instrumented_app",
+        "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning",
+    ], env=env, stdout=log, stderr=log)
+    
+    processes = [stub, server]
+    try:
+        _wait_ready(f"http://127.0.0.1:{stub_port}/v1/models", stub)
+        _wait_ready(f"http://127.0.0.1:{app_port}/health", server)
+    except Exception:
+        _stop_processes(processes)
+        raise
+    return processes, f"http://127.0.0.1:{app_port}"
+
+
+def _stop_processes(processes: list[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def _drive(base_url: str, args: argparse.Namespace) -> list[dict]:
+    print("生成截图语料 ...", file=sys.stderr)
+    corpus = generate_corpus(args.sizes.split(","), args.variants)
+    for name, screens in corpus.items():
+        size_kb = sum(len(s) for s in screens) / len(screens) / 1024
+        print(f"  {name} {SCREEN_SIZES[name][0]}x{SCREEN_SIZES[name][1]} 平均 {size_kb:.0f} KB", file=sys.stderr)
+    factory = RequestFactory(corpus, args.encoding, args.endpoints.split(","))
+    
+    levels = [int(c) for c in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        # 预热: 首次请求的连接建立、Agent 懒加载等不计入结果
+        await run_level(client, factory, 1, args.warmup)
+        
+        results = []
+        for concurrency in levels:
+            result = await run_level(client, factory, concurrency, args.duration)
+            results.append(result)
+            print(
+                f"c={concurrency:<4} {result['throughput_rps']:>8.2f} rps  "
+                f"p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms  "
+                f"errors {result['errors']:<5} loop lag p99 {result['loop_lag_p99_ms']:>6.1f} ms  "
+                f"rss {result['peak_rss_mb']:.0f} MB",
+                file=sys.stderr,
+            )
+        return results
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """按并发级别对比两次结果的吞吐和 p95/p99"""
+    with open(old_path) as f:
+        old = {level["concurrency"]: level for level in json.load(f)["levels"]}
+    with open(new_path) as f:
+        new = json.load(f)["levels"]
+    
+    def delta(before: float, after: float) -> str:
+        return f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+    
+    for level in new:
+        base = old.get(level["concurrency"])
+        if base is None:
+            continue
+        print(
+            f"c={level['concurrency']:<4} "
+            f"rps {base['throughput_rps']:.2f} -> {level['throughput_rps']:.2f} ({delta(base['throughput_rps'], level['throughput_rps'])})  "
+            f"p95 {base['p95_ms']:.1f} -> {level['p95_ms']:.1f} ms ({delta(base['p95_ms'], level['p95_ms'])})  "
+            f"p99 {base['p99_ms']:.1f} -> {level['p99_ms']:.1f} ms ({delta(base['p99_ms'], level['p99_ms'])})"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16,64", help="并发级别，逗号分隔")
+    parser.add_argument("--duration", type=float, default=20.0, help="每个并发级别的持续时间(秒)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="预热时间(秒)")
+    parser.add_argument("--endpoints", default="find-defects,extract-text", help="压测的端点，请求在其中随机选择")
+    parser.add_argument("--encoding", choices=["int-array", "base64", "octet-stream"], default="int-array")
+    parser.add_argument("--sizes", default="720p,1080p,1440p", help=f"截图分辨率: {','.join(SCREEN_SIZES)}")
+    parser.add_argument("--variants", type=int, default=4, help="每种分辨率的截图数量")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时(秒)")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="服务进程的额外环境变量")
+    parser.add_argument("--server-log", help="服务和桩进程的输出写入该文件 (默认丢弃)")
+    parser.add_argument("--output", help="结果 JSON 写入该文件")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两次结果后退出")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.compare:
+        compare(*args.compare)
+        return
+    
+    processes, base_url = _start_processes(args)
+    try:
+        levels = asyncio.run(_drive(base_url, args))
+    finally:
+        _stop_processes(processes)
+    
+    result = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "duration", "endpoints", "encoding", "sizes", "variants", "app_env",
+                "latency_ms", "latency_dist", "latency_spread", "error_rate", "error_status",
+            )
+        },
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Maestro AI Server - 日志中间件开销基准
+对同一个回显端点分别测量无中间件与挂载 LoggingMiddleware 时的单请求耗时
+
+运行: uv run python -m benchmarks.bench_logging_middleware
+@author LJY
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import structlog
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+
+from app.middleware.logging import LoggingMiddleware
+
+
+def _create_app(with_middleware: bool) -> FastAPI:
+    app = FastAPI()
+    if with_middleware:
+        app.add_middleware(LoggingMiddleware)
+    
+    @app.post("/echo")
+    async def echo(request: Request) -> dict:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return {"size": size}
+    
+    return app
+
+
+async def _run(app: FastAPI, body: bytes, rounds: int) -> list[float]:
+    durations = []
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+        await client.post("/echo", content=body, headers=headers)  # 预热
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = await client.post("/echo", content=body, headers=headers)
+            durations.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1,256,3072", help="截图大小 (KB)，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    
+    # 基准只关心中间件本身的开销，日志输出丢弃
+    structlog.configure(logger_factory=structlog.ReturnLoggerFactory())
+    
+    results = []
+    for size_kb in (int(s) for s in args.sizes.split(",")):
+        raw = os.urandom(size_kb * 1024)
+        body = json.dumps({
+            "screen": [b - 256 if b > 127 else b for b in raw],
+            "assertion": "页面显示登录按钮",
+        }).encode()
+        
+        for name, with_middleware in (("none", False), ("logging", True)):
+            durations = asyncio.run(_run(_create_app(with_middleware), body, args.rounds))
+            median = statistics.median(durations)
+            results.append({"size_kb": size_kb, "middleware": name, "median_ms": round(median, 3)})
+            print(f"{size_kb:>6} KB  {name:<8} median {median:>9.3f} ms")
+    
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Maestro AI Server - 基准截图语料
+生成接近真实 App 截图的 PNG: 状态栏、导航栏、卡片列表、文字行和一块照片区域，
+不同分辨率的编码大小与真机截图相近 (约 0.2 ~ 2 MB)
+@author LJY
+"""
+
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+# 常见手机截图分辨率
+SCREEN_SIZES = {
+    "720p": (720, 1280),
+    "1080p": (1080, 2340),
+    "1440p": (1440, 3120),
+    # 4K 宽度的长截图 (滚动截屏)
+    "4k-scroll": (2160, 7680),
+}
+
+
+def generate_screenshot(size: tuple[int, int], seed: int = 0, photo_ratio: float = 0.2) -> bytes:
+    """
+    生成一张合成截图
+    
+    Args:
+        size: (宽, 高)
+        seed: 随机种子，相同种子生成相同截图
+        photo_ratio: 照片区域 (随机噪声，PNG 几乎无法压缩) 占屏幕高度的比例，决定编码大小
+    """
+    rng = random.Random(seed)
+    width, height = size
+    img = Image.new("RGB", size, (248, 248, 250))
+    draw = ImageDraw.Draw(img)
+    unit = width // 36
+    
+    # 状态栏和顶部导航栏
+    draw.rectangle((0, 0, width, unit * 2), fill=(30, 30, 30))
+    draw.rectangle((0, unit * 2, width, unit * 6), fill=(rng.randrange(256), rng.randrange(256), 200))
+    
+    # 照片区域
+    photo_height = int(height * photo_ratio)
+    if photo_height:
+        photo = Image.frombytes("RGB", (width, photo_height), rng.randbytes(width * photo_height * 3))
+        img.paste(photo, (0, unit * 6))
+    
+    # 卡片列表: 标题和若干行 "文字"
+    y = unit * 7 + photo_height
+    while y < height - unit * 8:
+        card_height = unit * rng.randint(5, 9)
+        draw.rounded_rectangle((unit, y, width - unit, y + card_height), radius=unit // 2, fill=(255, 255, 255))
+        line_y = y + unit
+        while line_y < y + card_height - unit:
+            line_width = rng.randint(width // 4, width - unit * 4)
+            for x in range(unit * 2, unit * 2 + line_width, unit):
+                glyph = rng.randint(unit // 3, unit - 2)
+                draw.rectangle((x, line_y, x + glyph, line_y + unit // 2), fill=(rng.randint(20, 90),) * 3)
+            line_y += unit
+        y += card_height + unit
+    
+    # 底部标签栏
+    draw.rectangle((0, height - unit * 6, width, height), fill=(255, 255, 255))
+    for i in range(4):
+        cx = width * (2 * i + 1) // 8
+        draw.ellipse((cx - unit, height - unit * 5, cx + unit, height - unit * 3), fill=(120, 120, 120))
+    
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def generate_corpus(names: list[str] | None = None, variants: int = 4) -> dict[str, list[bytes]]:
+    """按分辨率名称生成若干张不同的截图"""
+    corpus = {}
+    for name in names or list(SCREEN_SIZES):
+        corpus[name] = [generate_screenshot(SCREEN_SIZES[name], seed=i) for i in range(variants)]
+    return corpus
+
+
+def unique_variant(screenshot: bytes, nonce: int) -> bytes:
+    """
+    让每个请求的截图字节都不同，避免结果缓存和并发合并影响吞吐测量
+    PNG 解码器忽略 IEND 之后的字节，追加的序号不改变画面
+    """
+    return screenshot + nonce.to_bytes(8, "big")
@@ -0,0 +1,103 @@
+"""
+Maestro AI Server - 近似截图匹配离线评估
+按文件名顺序回放一组真实截图，统计不同汉明距离阈值下的近似命中率，
+与精确哈希命中率对比；提供标注文件时同时统计误命中 (匹配到不同画面)
+
+运行: uv run python -m benchmarks.eval_near_duplicate screenshots/ --labels labels.json
+labels.json 格式: {"0001.png": "login", "0002.png": "login", "0003.png": "home", ...}
+@author LJY
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+from app.utils import compute_content_hash, compute_perceptual_hash
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def evaluate(
+    fingerprints: list[tuple[str, str, int]],
+    labels: dict[str, str],
+    threshold: int
+) -> dict:
+    """回放截图序列，统计阈值下的命中和误命中"""
+    seen: list[tuple[str, int]] = []
+    hits = false_hits = 0
+    for name, _, fingerprint in fingerprints:
+        best_name, best_distance = None, threshold + 1
+        for other_name, other in seen:
+            distance = (fingerprint ^ other).bit_count()
+            if distance < best_distance:
+                best_name, best_distance = other_name, distance
+        
+        if best_name is not None:
+            hits += 1
+            if labels and labels.get(name) != labels.get(best_name):
+                false_hits += 1
+        seen.append((name, fingerprint))
+    
+    total = len(fingerprints)
+    return {
+        "threshold": threshold,
+        "hits": hits,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "false_hits": false_hits if labels else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", type=Path, help="截图目录")
+    parser.add_argument("--labels", type=Path, help="画面标注文件 (文件名 -> 画面标识)")
+    parser.add_argument("--thresholds", default="0,2,4,8,16,32", help="汉明距离阈值，逗号分隔")
+    parser.add_argument("--hash-size", type=int, default=16)
+    parser.add_argument("--mask-top", type=float, default=0.04)
+    parser.add_argument("--mask-bottom", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+    
+    paths = sorted(p for p in args.directory.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    labels = json.loads(args.labels.read_text(encoding="utf-8")) if args.labels else {}
+    
+    fingerprints = []
+    for path in paths:
+        data = path.read_bytes()
+        fingerprints.append((
+            path.name,
+            compute_content_hash(data),
+            compute_perceptual_hash(data, args.hash_size, args.mask_top, args.mask_bottom),
+        ))
+    
+    # 精确哈希基线: 与之前某张截图字节完全相同
+    seen_hashes: set[str] = set()
+    exact_hits = 0
+    for _, content_hash, _ in fingerprints:
+        exact_hits += content_hash in seen_hashes
+        seen_hashes.add(content_hash)
+    
+    results = [
+        evaluate(fingerprints, labels, int(t))
+        for t in args.thresholds.split(",")
+    ]
+    report = {
+        "screenshots": len(fingerprints),
+        "hash_bits": args.hash_size * args.hash_size,
+        "exact_hit_rate": round(exact_hits / len(fingerprints), 4) if fingerprints else 0.0,
+        "near_duplicate": results,
+    }
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    
+    print(f"截图数: {report['screenshots']}  哈希位数: {report['hash_bits']}")
+    print(f"精确哈希命中率: {report['exact_hit_rate']:.2%}")
+    for result in results:
+        false_hits = "" if result["false_hits"] is None else f"  误命中 {result['false_hits']}"
+        print(f"阈值 {result['threshold']:>3}: 命中率 {result['hit_rate']:.2%} ({result['hits']}){false_hits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Maestro AI Server - OpenAI 兼容的 LLM 桩服务
+实现 POST /v1/chat/completions 和 GET /v1/models，按请求中的 response_format JSON Schema
+生成最小的合法结构化输出；延迟分布和错误率可配置，用于在不消耗提供商 token 的情况下压测服务
+
+运行: uv run python -m benchmarks.llm_stub --port 9100 --latency-ms 800 --latency-dist lognormal
+@author LJY
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class LatencyModel:
+    """
+    模拟的 LLM 调用延迟 (秒)
+    
+    - fixed: 固定为 latency_ms
+    - uniform: [latency_ms * (1 - spread), latency_ms * (1 + spread)] 均匀分布
+    - lognormal: 中位数为 latency_ms、形状参数为 spread 的对数正态分布，有长尾
+    """
+    
+    def __init__(self, latency_ms: float = 800.0, dist: str = "lognormal", spread: float = 0.3, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.dist = dist
+        self.spread = spread
+        self._rng = random.Random(seed)
+    
+    def sample(self) -> float:
+        if self.dist == "fixed":
+            ms = self.latency_ms
+        elif self.dist == "uniform":
+            ms = self._rng.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+        else:
+            ms = self._rng.lognormvariate(0.0, self.spread) * self.latency_ms
+        return max(0.0, ms) / 1000
+
+
+def example_from_schema(schema: dict, defs: dict | None = None) -> object:
+    """按 JSON Schema 生成最小的合法实例 (必填字段、空数组、默认值)"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return example_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "default" in schema:
+        return schema["default"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return example_from_schema(schema[key][0], defs)
+    
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: example_from_schema(properties[name], defs) for name in properties}
+    if kind == "array":
+        return []
+    if kind == "string":
+        return "stub"
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    return None
+
+
+def _response_content(body: dict) -> str:
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema")
+    if schema:
+        return json.dumps(example_from_schema(schema), ensure_ascii=False)
+    return "{}"
+
+
+def _prompt_size(body: dict) -> int:
+    """请求体中消息的大致长度，用于生成看起来合理的 usage"""
+    return len(json.dumps(body.get("messages", []), ensure_ascii=False))
+
+
+def create_stub_app(latency: LatencyModel, error_rate: float = 0.0, error_status: int = 500) -> Starlette:
+    """创建桩服务 ASGI 应用"""
+    rng = random.Random()
+    stats = {"requests": 0, "errors": 0, "abandoned": 0}
+    
+    async def chat_completions(request: Request) -> JSONResponse:
+        body = await request.json()
+        stats["requests"] += 1
+        await asyncio.sleep(latency.sample())
+        
+        if await request.is_disconnected():
+            # 客户端在模拟的生成完成前取消了请求
+            stats["abandoned"] += 1
+        
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            headers = {"Retry-After": "1"} if error_status == 429 else None
+            return JSONResponse(
+                {"error": {"message": "stub error", "type": "server_error", "code": None}},
+                status_code=error_status,
+                headers=headers,
+            )
+        
+        prompt_tokens = 1000 + _prompt_size(body) // 4000
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": _response_content(body)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 20,
+                "total_tokens": prompt_tokens + 20,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        })
+    
+    async def models(request: Request) -> JSONResponse:
+        return JSONResponse({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+    
+    async def stub_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+    
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/models", models),
+        Route("/stats", stub_stats),
+    ])
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """桩服务参数，压测脚本复用"""
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="模拟 LLM 调用延迟的中位数 (毫秒)")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-spread", type=float, default=0.3, help="uniform 的相对幅度 / lognormal 的形状参数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="错误响应状态码 (如 500 / 429)")
+
+
+def main() -> None:
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    
+    app = create_stub_app(
+        LatencyModel(args.latency_ms, args.latency_dist, args.latency_spread),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
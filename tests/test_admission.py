@@ -0,0 +1,102 @@
+"""
+Maestro AI Server - LLM 调用准入控制测试
+@author LJY
+"""
+
+import asyncio
+
+import pytest
+
+from app.core import OverloadedError, RateLimitedError
+from app.core.admission import AdmissionController, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_admission_limits_concurrency_and_queue():
+    """并发名额用尽后排队，排队已满时快速拒绝并给出 Retry-After"""
+    controller = AdmissionController("test", max_concurrency=1, max_queue=1, queue_timeout=10)
+    release = asyncio.Event()
+    
+    async def call():
+        async with controller.admit():
+            await release.wait()
+    
+    first = asyncio.ensure_future(call())
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(call())
+    await asyncio.sleep(0)
+    assert controller.active == 1
+    assert controller.waiting == 1
+    assert not controller.ready
+    
+    with pytest.raises(OverloadedError) as exc_info:
+        async with controller.admit():
+            pass
+    assert exc_info.value.retry_after == 5
+    
+    release.set()
+    await asyncio.gather(first, second)
+    assert controller.stats()["admitted"] == 2
+    assert controller.stats()["rejected"] == 1
+    assert controller.ready
+
+
+@pytest.mark.asyncio
+async def test_admission_queue_timeout():
+    """排队超时后拒绝，并归还排队位置"""
+    controller = AdmissionController("test", max_concurrency=1, max_queue=4, queue_timeout=0.05)
+    release = asyncio.Event()
+    
+    async def call():
+        async with controller.admit():
+            await release.wait()
+    
+    first = asyncio.ensure_future(call())
+    await asyncio.sleep(0)
+    with pytest.raises(OverloadedError):
+        async with controller.admit():
+            pass
+    assert controller.waiting == 0
+    
+    release.set()
+    await first
+
+
+@pytest.mark.asyncio
+async def test_admission_rate_limit():
+    """RPM 配额用尽且期限内等不到配额时返回限速错误，并释放并发名额"""
+    controller = AdmissionController("test", max_concurrency=2, queue_timeout=1, rpm=1)
+    async with controller.admit():
+        pass
+    
+    with pytest.raises(RateLimitedError) as exc_info:
+        async with controller.admit():
+            pass
+    assert 55 < exc_info.value.retry_after <= 60
+    assert controller.stats()["rate_limited"] == 1
+    assert controller.active == 0
+    assert not controller._semaphore.locked()
+
+
+def test_token_bucket_settle():
+    """按实际用量修正预估的 token 消耗"""
+    bucket = TokenBucket(600)
+    bucket.consume(600)
+    assert bucket.delay(60) == pytest.approx(6, abs=0.1)
+    bucket.refund(300)
+    assert bucket.delay(60) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_call_releases_token_reservation():
+    """调用失败时退还预估的 TPM 令牌，成功调用只占用实际用量"""
+    controller = AdmissionController("test", tpm=1000)
+    with pytest.raises(RuntimeError):
+        async with controller.admit(tokens=1000):
+            raise RuntimeError("backend down")
+    assert controller.tpm.delay(1000) == 0
+    
+    async with controller.admit(tokens=1000) as reservation:
+        reservation.actual = 400
+    assert controller.tpm.delay(600) == 0
+    assert controller.tpm.delay(1000) > 0
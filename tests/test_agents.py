@@ -0,0 +1,75 @@
+"""
+Maestro AI Server - Agent 消息布局与用量统计测试
+@author LJY
+"""
+
+import base64
+from unittest.mock import AsyncMock
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_openai import ChatOpenAI
+
+from app.agents import DefectDetectionAgent, TextExtractionAgent
+from app.agents.base import _token_usage
+from app.agents.defect_agent import DefectDetectionOutput
+
+
+def _llm() -> ChatOpenAI:
+    return ChatOpenAI(model="stub-model", api_key="test", base_url="http://127.0.0.1:9/v1")
+
+
+def test_system_prompt_is_static():
+    """系统提示词固定不变，断言/查询只出现在用户提示词中"""
+    agent = DefectDetectionAgent(_llm())
+    assert "输出格式" in agent.system_prompt
+    assert "页面显示登录按钮" not in agent.system_prompt
+    assert "页面显示登录按钮" in agent.get_prompt(assertion="页面显示登录按钮")
+    assert agent.system_prompt not in agent.get_prompt(assertion="页面显示登录按钮")
+    
+    text_agent = TextExtractionAgent(_llm())
+    assert text_agent.get_prompt(query="标题").strip().endswith("标题")
+
+
+@pytest.mark.asyncio
+async def test_variable_content_is_last(mock_image_base64: bytes):
+    """用户消息中截图在前，随请求变化的文本在最后；用量计入后端统计"""
+    agent = DefectDetectionAgent(_llm())
+    graph = agent.agents["default"]
+    message = AIMessage(
+        content="",
+        usage_metadata={
+            "input_tokens": 1200,
+            "output_tokens": 30,
+            "total_tokens": 1230,
+            "input_token_details": {"cache_read": 1024},
+        },
+    )
+    ainvoke = AsyncMock(return_value={"messages": [message], "structured_response": DefectDetectionOutput()})
+    object.__setattr__(graph, "ainvoke", ainvoke)
+    
+    await agent.detect(base64.b64decode(mock_image_base64), "页面显示登录按钮")
+    
+    [user] = ainvoke.await_args.args[0]["messages"]
+    assert [part["type"] for part in user["content"]] == ["image", "text"]
+    assert "页面显示登录按钮" in user["content"][-1]["text"]
+    
+    stats = agent.router.backends[0].stats()
+    assert stats["cached_tokens"] == 1024
+    assert stats["prompt_cache_hit_ratio"] == pytest.approx(1024 / 1200, abs=1e-4)
+
+
+def test_token_usage_reads_kimi_cached_tokens():
+    """Kimi 在 usage 顶层返回 cached_tokens"""
+    message = AIMessage(
+        content="",
+        usage_metadata={"input_tokens": 800, "output_tokens": 20, "total_tokens": 820},
+        response_metadata={"token_usage": {"prompt_tokens": 800, "cached_tokens": 512}},
+    )
+    assert _token_usage({"messages": [message]}) == {
+        "input_tokens": 800,
+        "output_tokens": 20,
+        "total_tokens": 820,
+        "cached_tokens": 512,
+    }
+    assert _token_usage({})["cached_tokens"] == 0
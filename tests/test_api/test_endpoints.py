@@ -3,12 +3,16 @@ Maestro AI Server - 缺陷检测 API 测试
 @author LJY
 """
 
+import base64
+
 import pytest
 from httpx import AsyncClient, ASGITransport
 from unittest.mock import AsyncMock, patch
 
+from app.core import RateLimitedError
 from app.main import app
 from app.schemas import Defect
+from app.services import get_defect_service
 
 
 @pytest.fixture
@@ -86,3 +90,188 @@ class TestHealthEndpoint:
             assert response.status_code == 200
             data = response.json()
             assert data["service"] == "Maestro AI Server"
+
+
+class TestScreenBodyParsing:
+    """测试截图请求体的流式解析"""
+    
+    @pytest.mark.asyncio
+    async def test_find_defects_decodes_screen(self):
+        """screen 有符号字节数组被解码为原始字节后交给服务"""
+        service = AsyncMock()
+        service.find_defects = AsyncMock(return_value=[])
+        app.dependency_overrides[get_defect_service] = lambda: service
+        try:
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/v2/find-defects",
+                    headers={"Authorization": "Bearer test"},
+                    json={"screen": [-119, 80, 78, 71], "assertion": "页面显示登录按钮"}
+                )
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        assert response.json() == {"defects": []}
+        service.find_defects.assert_awaited_once_with(
+            screen=b"\x89PNG",
+            assertion="页面显示登录按钮",
+            use_cache=True
+        )
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("upload", ["base64", "octet-stream", "multipart"])
+    async def test_find_defects_screen_encodings(self, upload: str, mock_image_base64: bytes):
+        """Base64 字符串、原始字节和 multipart 上传得到相同的截图字节"""
+        raw = base64.b64decode(mock_image_base64)
+        if upload == "base64":
+            kwargs = {"json": {"screen": mock_image_base64.decode(), "assertion": "显示登录按钮"}}
+        elif upload == "octet-stream":
+            kwargs = {
+                "content": raw,
+                "params": {"assertion": "显示登录按钮"},
+                "headers": {"Content-Type": "application/octet-stream"},
+            }
+        else:
+            kwargs = {
+                "files": {"screen": ("screen.png", raw, "image/png")},
+                "data": {"assertion": "显示登录按钮"},
+            }
+        
+        service = AsyncMock()
+        service.find_defects = AsyncMock(return_value=[])
+        app.dependency_overrides[get_defect_service] = lambda: service
+        try:
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                headers = {"Authorization": "Bearer test", **kwargs.pop("headers", {})}
+                response = await client.post("/v2/find-defects", headers=headers, **kwargs)
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        service.find_defects.assert_awaited_once_with(
+            screen=raw,
+            assertion="显示登录按钮",
+            use_cache=True
+        )
+    
+    @pytest.mark.asyncio
+    async def test_unsupported_content_type(self):
+        """不支持的 Content-Type 返回 415"""
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/v2/extract-text",
+                headers={"Authorization": "Bearer test", "Content-Type": "text/plain"},
+                content=b"screen"
+            )
+            assert response.status_code == 415
+    
+    @pytest.mark.asyncio
+    async def test_extract_text_invalid_body(self):
+        """非法 JSON 请求体返回 422"""
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/v2/extract-text",
+                headers={"Authorization": "Bearer test", "Content-Type": "application/json"},
+                content=b'{"screen": [1, 2'
+            )
+            assert response.status_code == 422
+    
+    @pytest.mark.asyncio
+    async def test_extract_text_missing_query(self):
+        """缺少必填字段返回 422，错误位置指向 body"""
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/v2/extract-text",
+                headers={"Authorization": "Bearer test"},
+                json={"screen": [1, 2]}
+            )
+            assert response.status_code == 422
+            assert response.json()["detail"][0]["loc"] == ["body", "query"]
+
+
+class TestAdmission:
+    """测试准入控制相关的响应"""
+    
+    @pytest.mark.asyncio
+    async def test_readiness_check(self):
+        """就绪检查返回准入统计"""
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/health/ready")
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "ready"
+            assert data["admission"][0]["waiting"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_rate_limited_returns_429(self):
+        """超出速率限制返回 429 和 Retry-After"""
+        service = AsyncMock()
+        service.find_defects = AsyncMock(side_effect=RateLimitedError("超出速率限制", retry_after=2.5))
+        app.dependency_overrides[get_defect_service] = lambda: service
+        try:
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/v2/find-defects",
+                    headers={"Authorization": "Bearer test"},
+                    json={"screen": [1, 2]}
+                )
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+
+
+class TestFindDefectsBatchEndpoint:
+    """测试 /v2/find-defects/batch 端点"""
+    
+    @pytest.mark.asyncio
+    async def test_batch_results_follow_request_order(self):
+        """结果按请求中的断言顺序返回"""
+        service = AsyncMock()
+        service.find_defects_batch = AsyncMock(return_value=[
+            [],
+            [Defect(category="ASSERTION_FAILED", reasoning="没有登录按钮")],
+        ])
+        app.dependency_overrides[get_defect_service] = lambda: service
+        try:
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post(
+                    "/v2/find-defects/batch",
+                    headers={"Authorization": "Bearer test"},
+                    json={"screen": [1, 2], "assertions": ["标题正确", "显示登录按钮"]}
+                )
+        finally:
+            app.dependency_overrides.clear()
+        
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["assertion"] for r in results] == ["标题正确", "显示登录按钮"]
+        assert results[0]["defects"] == []
+        assert results[1]["defects"][0]["category"] == "ASSERTION_FAILED"
+        service.find_defects_batch.assert_awaited_once_with(
+            screen=b"\x01\x02",
+            assertions=["标题正确", "显示登录按钮"],
+            use_cache=True
+        )
+    
+    @pytest.mark.asyncio
+    async def test_batch_requires_assertions(self):
+        """断言列表为空返回 422"""
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/v2/find-defects/batch",
+                headers={"Authorization": "Bearer test"},
+                json={"screen": [1, 2], "assertions": []}
+            )
+            assert response.status_code == 422
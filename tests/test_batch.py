@@ -0,0 +1,86 @@
+"""
+Maestro AI Server - 批量断言测试
+@author LJY
+"""
+
+import base64
+from unittest.mock import AsyncMock
+
+import pytest
+from langchain_openai import ChatOpenAI
+
+from app.agents.defect_agent import AssertionVerdict, BatchDefectDetectionOutput, split_verdicts
+from app.core import ValidationError
+from app.core.router import LLMBackend, LLMRouter
+from app.schemas import Defect
+from app.services.defect_service import DefectService
+
+
+@pytest.fixture
+def defect_service(monkeypatch: pytest.MonkeyPatch) -> DefectService:
+    """指向本地桩地址的缺陷检测服务 (Agent 调用由测试替换)"""
+    llm = ChatOpenAI(model="stub-model", api_key="test", base_url="http://127.0.0.1:9/v1")
+    monkeypatch.setattr(
+        "app.services.defect_service.get_llm_router",
+        lambda: LLMRouter([LLMBackend("stub", llm)])
+    )
+    monkeypatch.setattr("app.services.defect_service.get_result_cache", lambda settings: None)
+    return DefectService()
+
+
+def test_split_verdicts():
+    """公共缺陷分配给每条断言，断言不成立时追加 ASSERTION_FAILED"""
+    output = BatchDefectDetectionOutput(
+        defects=[Defect(category="UI_BUG", reasoning="文字截断")],
+        verdicts=[
+            AssertionVerdict(index=2, passed=False, reasoning="没有登录按钮"),
+            AssertionVerdict(index=1, passed=True, reasoning="标题正确"),
+        ],
+    )
+    first, second = split_verdicts(output, 2)
+    assert [d.category for d in first] == ["UI_BUG"]
+    assert [d.category for d in second] == ["UI_BUG", "ASSERTION_FAILED"]
+    assert second[1].reasoning == "没有登录按钮"
+
+
+@pytest.mark.parametrize("indexes", [[1], [1, 1], [1, 3]])
+def test_split_verdicts_rejects_mismatch(indexes: list[int]):
+    """返回的断言序号与请求不对应时视为结构化输出无效"""
+    output = BatchDefectDetectionOutput(
+        verdicts=[AssertionVerdict(index=i, passed=True, reasoning="") for i in indexes]
+    )
+    with pytest.raises(ValidationError):
+        split_verdicts(output, 2)
+
+
+@pytest.mark.asyncio
+async def test_batch_single_call_and_dedup(defect_service: DefectService, mock_image_base64: bytes):
+    """多条断言合并为一次 LLM 调用，归一化后相同的断言只验证一次"""
+    failed = [Defect(category="ASSERTION_FAILED", reasoning="没有登录按钮")]
+    defect_service.batch_agent.detect_batch = AsyncMock(return_value=[[], failed])
+    
+    results = await defect_service.find_defects_batch(
+        base64.b64decode(mock_image_base64),
+        ["标题正确", "显示 登录按钮", " 标题正确 "],
+    )
+    
+    assert results == [[], failed, []]
+    defect_service.batch_agent.detect_batch.assert_awaited_once()
+    assert defect_service.batch_agent.detect_batch.await_args.args[1] == ["标题正确", "显示 登录按钮"]
+
+
+@pytest.mark.asyncio
+async def test_batch_falls_back_to_single_calls(defect_service: DefectService, mock_image_base64: bytes):
+    """批量输出无效时回退为并发的单条断言调用"""
+    defect_service.batch_agent.detect_batch = AsyncMock(side_effect=ValidationError("无效输出"))
+    defect_service.agent.detect = AsyncMock(side_effect=lambda image, assertion, hints=(): [
+        Defect(category="ASSERTION_FAILED", reasoning=assertion)
+    ])
+    
+    results = await defect_service.find_defects_batch(
+        base64.b64decode(mock_image_base64),
+        ["a", "b"],
+    )
+    
+    assert [[d.reasoning for d in defects] for defects in results] == [["a"], ["b"]]
+    assert defect_service.agent.detect.await_count == 2
@@ -0,0 +1,119 @@
+"""
+Maestro AI Server - 结果缓存测试
+@author LJY
+"""
+
+import pytest
+
+from app.core.cache import MemoryResultCache, SQLiteResultCache, make_cache_key
+
+
+def test_cache_key_normalizes_text():
+    """断言文本的空白差异不影响缓存键"""
+    assert make_cache_key("ns", "hash", "  页面显示\n登录按钮 ") == make_cache_key("ns", "hash", "页面显示 登录按钮")
+    assert make_cache_key("ns", "hash", None) == make_cache_key("ns", "hash", "")
+    assert make_cache_key("ns", "hash", "a") != make_cache_key("other", "hash", "a")
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_and_miss():
+    """命中返回独立副本，并记录命中/未命中次数"""
+    cache = MemoryResultCache()
+    assert await cache.get("k") is None
+    
+    await cache.set("k", [{"category": "UI_BUG", "reasoning": "重叠"}])
+    value = await cache.get("k")
+    assert value == [{"category": "UI_BUG", "reasoning": "重叠"}]
+    
+    value.clear()
+    assert await cache.get("k") == [{"category": "UI_BUG", "reasoning": "重叠"}]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_lru_eviction_by_entries_and_bytes():
+    """超出条目数或字节数时淘汰最久未使用的条目"""
+    cache = MemoryResultCache(max_entries=2)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "1"
+    
+    cache = MemoryResultCache(max_bytes=10)
+    await cache.set("a", "12345")
+    await cache.set("b", "12345")
+    assert await cache.get("a") is None
+    assert cache.stats()["bytes"] <= 10
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl(monkeypatch: pytest.MonkeyPatch):
+    """过期条目视为未命中"""
+    cache = MemoryResultCache(ttl=10)
+    await cache.set("k", "v")
+    
+    import app.core.cache as cache_module
+    now = cache_module.time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 11)
+    
+    assert await cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_persists_across_instances(tmp_path):
+    """SQLite 缓存在新实例 (重启/其他 worker) 中仍可命中，并预热到内存层"""
+    path = tmp_path / "cache.sqlite3"
+    cache = SQLiteResultCache(path, memory=MemoryResultCache())
+    await cache.set("k", {"result": "ok"})
+    await cache.close()
+    
+    other = SQLiteResultCache(path, memory=MemoryResultCache())
+    assert await other.warm_up() == 1
+    assert other.memory.stats()["entries"] == 1
+    assert await other.get("k") == {"result": "ok"}
+    assert await other.get("missing") is None
+    assert other.stats()["hits"] == 1
+    assert other.stats()["misses"] == 1
+    await other.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_ttl_and_eviction(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """过期条目视为未命中，超出条目数时淘汰最久未访问的条目"""
+    cache = SQLiteResultCache(tmp_path / "cache.sqlite3", max_entries=2, ttl=10)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "1"
+    
+    import app.core.cache as cache_module
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 11)
+    assert await cache.get("a") is None
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_evicts_only_excess_bytes(tmp_path):
+    """超出字节数时只淘汰覆盖超出部分的最旧条目，覆盖写入时总量随之调整"""
+    path = tmp_path / "cache.sqlite3"
+    cache = SQLiteResultCache(path, max_bytes=1000)
+    for i in range(9):
+        await cache.set(f"k{i}", "x" * 98)
+    await cache.set("k0", "x" * 198)
+    await cache.set("k9", "x" * 98)
+    
+    assert cache.stats()["evictions"] == 1
+    assert await cache.get("k1") is None
+    assert await cache.get("k2") is not None
+    await cache.close()
+    
+    other = SQLiteResultCache(path, max_bytes=1000)
+    assert await other._run(other._totals) == (9, 1000)
+    await other.close()
@@ -0,0 +1,135 @@
+"""
+Maestro AI Server - 请求截止时间与取消测试
+@author LJY
+"""
+
+import asyncio
+import io
+import socket
+import time
+
+import httpx
+import pytest
+import uvicorn
+from httpx import AsyncClient, ASGITransport
+from langchain_openai import ChatOpenAI
+from PIL import Image
+
+from app.agents import TextExtractionAgent
+from app.config import Settings
+from app.core.deadline import resolve_timeout
+from app.core.metrics import LLM_CALLS_CANCELLED, LLM_TOKENS_SAVED, REQUESTS_CANCELLED
+from app.middleware.deadline import DeadlineMiddleware
+from benchmarks.llm_stub import LatencyModel, create_stub_app
+
+
+def test_resolve_timeout():
+    """请求头优先 (不超过上限)，无效请求头回退到端点默认值"""
+    settings = Settings(request_timeouts={"/v2/extract-text": 30.0}, request_max_timeout=100.0)
+    assert resolve_timeout("/v2/extract-text", None, settings) == 30.0
+    assert resolve_timeout("/v2/extract-text", "5.5", settings) == 5.5
+    assert resolve_timeout("/v2/extract-text", "3600", settings) == 100.0
+    assert resolve_timeout("/v2/extract-text", "abc", settings) == 30.0
+    assert resolve_timeout("/v2/extract-text", "-1", settings) == 30.0
+    assert resolve_timeout("/v2/other", None, settings) is None
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_request():
+    """请求体读完后客户端断开，处理任务被取消，响应记为 499"""
+    cancelled = asyncio.Event()
+    
+    async def endpoint(scope, receive, send):
+        await receive()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    messages = [{"type": "http.request", "body": b"{}", "more_body": False}]
+    
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+    
+    sent = []
+    
+    async def send(message):
+        sent.append(message)
+    
+    before = REQUESTS_CANCELLED.value(endpoint="", reason="disconnect")
+    scope = {"type": "http", "method": "POST", "path": "/v2/find-defects", "headers": []}
+    await asyncio.wait_for(DeadlineMiddleware(endpoint)(scope, receive, send), timeout=2)
+    
+    assert cancelled.is_set()
+    assert sent[0]["status"] == 499
+    assert REQUESTS_CANCELLED.value(endpoint="", reason="disconnect") == before + 1
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_llm_call():
+    """超过截止时间返回 504，进行中的 LLM 调用和发往桩服务的 HTTP 请求被取消"""
+    latency = 2.0
+    stub = create_stub_app(LatencyModel(latency * 1000, dist="fixed"))
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    http_client = httpx.AsyncClient()
+    try:
+        while not server.started:
+            await asyncio.sleep(0.01)
+        
+        llm = ChatOpenAI(
+            model="stub-vision",
+            api_key="test",
+            base_url=f"http://127.0.0.1:{port}/v1",
+            max_retries=0,
+            http_async_client=http_client,
+        )
+        agent = TextExtractionAgent(llm)
+        
+        async def endpoint(scope, receive, send):
+            await receive()
+            await agent.invoke(_png(), query="标题")
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+        
+        before = LLM_CALLS_CANCELLED.value(endpoint="", backend="default", reason="deadline")
+        saved = LLM_TOKENS_SAVED.value(endpoint="", backend="default", reason="deadline")
+        app = DeadlineMiddleware(endpoint)
+        started = time.perf_counter()
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/v2/extract-text", content=b"{}", headers={"X-Request-Timeout": "0.5"})
+        elapsed = time.perf_counter() - started
+        
+        assert response.status_code == 504
+        assert elapsed < latency
+        # 路由取消后端调用任务后不等待其结束，让出事件循环使其处理取消
+        await asyncio.sleep(0.05)
+        assert LLM_CALLS_CANCELLED.value(endpoint="", backend="default", reason="deadline") == before + 1
+        assert LLM_TOKENS_SAVED.value(endpoint="", backend="default", reason="deadline") > saved
+        
+        # 桩服务模拟的生成结束时发现客户端已断开
+        await asyncio.sleep(latency)
+        stats = (await http_client.get(f"http://127.0.0.1:{port}/stats")).json()
+        assert stats["requests"] == 1
+        assert stats["abandoned"] == 1
+    finally:
+        await http_client.aclose()
+        server.should_exit = True
+        await serving
@@ -0,0 +1,168 @@
+"""
+Maestro AI Server - 请求体解压中间件测试
+@author LJY
+"""
+
+import gzip
+import json
+import os
+import tracemalloc
+import zlib
+
+import pytest
+import zstandard
+from fastapi import FastAPI, Request
+from httpx import ASGITransport, AsyncClient
+from starlette.exceptions import HTTPException
+
+from app.middleware.decompression import OUTPUT_CHUNK_SIZE, DecompressionMiddleware, get_decompression_stats
+from app.utils.screen_parser import ScreenBodyParser
+
+
+def _build_app(max_size: int = 1024 * 1024) -> FastAPI:
+    """回显请求体解析结果的测试应用"""
+    app = FastAPI()
+    app.add_middleware(DecompressionMiddleware, max_size=max_size)
+    
+    @app.post("/v2/echo")
+    async def echo(request: Request):
+        parser = ScreenBodyParser()
+        chunks = 0
+        async for chunk in request.stream():
+            parser.feed(chunk)
+            chunks += 1
+        fields = parser.close()
+        return {
+            "screen_size": len(fields["screen"]),
+            "assertion": fields.get("assertion"),
+            "chunks": chunks,
+            "content_encoding": request.headers.get("content-encoding"),
+        }
+    
+    return app
+
+
+def _body(raw: bytes) -> bytes:
+    return json.dumps({"screen": [b - 256 if b > 127 else b for b in raw], "assertion": "ok"}).encode()
+
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "deflate": zlib.compress,
+    "zstd": lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "zstd"])
+async def test_decompress_request_body(encoding: str):
+    """压缩请求体逐块解压后交给截图解析器"""
+    raw = os.urandom(20000)
+    body = _body(raw)
+    transport = ASGITransport(app=_build_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/v2/echo",
+            content=COMPRESSORS[encoding](body),
+            headers={"Content-Type": "application/json", "Content-Encoding": encoding},
+        )
+    
+    assert response.status_code == 200
+    assert response.json()["screen_size"] == len(raw)
+    assert response.json()["assertion"] == "ok"
+    assert response.json()["content_encoding"] is None
+    assert get_decompression_stats()["decompressed_bytes"] >= len(body)
+
+
+@pytest.mark.asyncio
+async def test_raw_deflate_is_accepted():
+    """deflate 兼容不带 zlib 头的原始 deflate 数据"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    body = _body(b"\x01\x02")
+    transport = ASGITransport(app=_build_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/v2/echo",
+            content=compressor.compress(body) + compressor.flush(),
+            headers={"Content-Encoding": "deflate"},
+        )
+    assert response.json()["screen_size"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_decompressed_size_cap(encoding: str):
+    """解压后超过上限返回 413 (压缩炸弹)"""
+    bomb = COMPRESSORS[encoding](b"[" + b"0," * 500_000 + b"0]")
+    transport = ASGITransport(app=_build_app(max_size=64 * 1024))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/v2/echo", content=bomb, headers={"Content-Encoding": encoding})
+    assert response.status_code == 413
+
+
+async def _drain(app, body: bytes, encoding: str) -> list[int]:
+    """body 作为一条 receive 消息到达，下游逐条读取，返回每条消息的大小"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sizes = []
+    
+    async def receive():
+        return messages.pop(0)
+    
+    async def endpoint(scope, receive, send):
+        while True:
+            message = await receive()
+            sizes.append(len(message["body"]))
+            if not message["more_body"]:
+                return
+    
+    scope = {"type": "http", "method": "POST", "path": "/v2/echo", "headers": [(b"content-encoding", encoding.encode())]}
+    await app(endpoint)(scope, receive, None)
+    return sizes
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+async def test_decompression_is_pulled_per_receive(encoding: str):
+    """一条高压缩比的消息按下游的 receive 逐片解压，压缩炸弹在超过上限时停止，内存不随解压总量增长"""
+    body = COMPRESSORS[encoding](bytes(8 * 1024 * 1024))
+    tracemalloc.start()
+    try:
+        sizes = await _drain(lambda endpoint: DecompressionMiddleware(endpoint, max_size=16 * 1024 * 1024), body, encoding)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 4 * OUTPUT_CHUNK_SIZE
+    assert sum(sizes) == 8 * 1024 * 1024
+    assert len(sizes) > 8
+    assert max(sizes) <= OUTPUT_CHUNK_SIZE
+    
+    max_size = 1024 * 1024
+    bomb = COMPRESSORS[encoding](bytes(64 * 1024 * 1024))
+    tracemalloc.start()
+    try:
+        with pytest.raises(HTTPException) as exc_info:
+            await _drain(lambda endpoint: DecompressionMiddleware(endpoint, max_size=max_size), bomb, encoding)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    assert exc_info.value.status_code == 413
+    assert peak < 2 * max_size
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("encoding", "content", "status_code"),
+    [
+        ("gzip", b"not gzip", 400),
+        ("gzip", gzip.compress(b'{"screen": []}')[:-8], 400),
+        ("zstd", zstandard.ZstdCompressor().compress(b'{"screen": []}')[:-2], 400),
+        ("br", b"{}", 415),
+    ],
+)
+async def test_invalid_compressed_body(encoding: str, content: bytes, status_code: int):
+    """损坏或截断的压缩数据返回 400，不支持的编码返回 415"""
+    transport = ASGITransport(app=_build_app())
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/v2/echo", content=content, headers={"Content-Encoding": encoding})
+    assert response.status_code == status_code
@@ -0,0 +1,72 @@
+"""
+Maestro AI Server - 图像处理执行器测试
+@author LJY
+"""
+
+import asyncio
+import base64
+import threading
+
+import pytest
+
+from app.core import OverloadedError
+from app.core.executor import ImageExecutor
+from app.utils import prepare_image
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["thread", "process"])
+async def test_prepare_image_payload_off_loop(kind: str, mock_image_base64: bytes):
+    """图像预处理在执行器中完成"""
+    executor = ImageExecutor(kind=kind, max_workers=1)
+    try:
+        image_data = base64.b64decode(mock_image_base64)
+        image = await executor.run(prepare_image, image_data)
+    finally:
+        executor.shutdown()
+    
+    assert image.is_prepared
+    assert image.base64 == mock_image_base64.decode()
+    assert image.mime_type == "image/png"
+
+
+@pytest.mark.asyncio
+async def test_executor_rejects_when_queue_full():
+    """排队任务超过上限时快速拒绝"""
+    executor = ImageExecutor(kind="thread", max_workers=1, queue_size=0)
+    release = threading.Event()
+    try:
+        blocked = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        
+        with pytest.raises(OverloadedError):
+            await executor.run(sum, [1, 2])
+        
+        release.set()
+        assert await blocked is True
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_wait_keeps_slot_until_task_finishes():
+    """等待方被取消时，名额在池中的任务结束后才归还"""
+    executor = ImageExecutor(kind="thread", max_workers=1, queue_size=0)
+    release = threading.Event()
+    try:
+        waiting = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        
+        assert executor.pending == 1
+        with pytest.raises(OverloadedError):
+            await executor.run(sum, [1, 2])
+        
+        release.set()
+        await asyncio.sleep(0.05)
+        assert executor.pending == 0
+        assert await executor.run(sum, [1, 2]) == 3
+    finally:
+        executor.shutdown()
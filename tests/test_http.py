@@ -0,0 +1,89 @@
+"""
+Maestro AI Server - 共享 HTTP 客户端测试
+@author LJY
+"""
+
+import asyncio
+
+import pytest
+
+from app.config import LLMBackendConfig, Settings, get_settings
+from app.core.http import SharedHTTPClient, keep_warm_targets
+from app.core.llm import create_llm_backends, get_llm_router
+
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """最小的 HTTP/1.1 keep-alive 服务端"""
+    try:
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: application/json\r\n\r\n{}")
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_reuse_stats():
+    """第二个请求复用第一个请求建立的连接，保温请求计入统计"""
+    server = await asyncio.start_server(_serve, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}/v1"
+    shared = SharedHTTPClient(Settings(
+        llm_provider="openai",
+        openai_api_base=base_url,
+        openai_api_key="test",
+        llm_http2=False,
+    ))
+    try:
+        await shared.ping()
+        await shared.client.get(f"{base_url}/models")
+        stats = shared.stats.snapshot()
+    finally:
+        await shared.close()
+        server.close()
+        await server.wait_closed()
+    
+    assert stats["requests"] == 2
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 1
+    assert stats["keep_warm_pings"] == 1
+    assert stats["tls_handshakes"] == 0
+
+
+def test_backends_share_http_client():
+    """每个后端的 ChatOpenAI 都注入同一个共享 httpx.AsyncClient，保温目标与后端一致"""
+    settings = Settings(llm_backends=[
+        LLMBackendConfig(name="a", base_url="http://a/v1", api_key="ka", model="m"),
+        LLMBackendConfig(name="b", base_url="http://b/v1", api_key="kb", model="m"),
+    ])
+    first, second = create_llm_backends(settings)
+    assert first.llm.http_async_client is second.llm.http_async_client
+    assert first.llm.http_async_client is not None
+    assert keep_warm_targets(settings) == [("http://a/v1", "ka"), ("http://b/v1", "kb")]
+
+
+def test_second_lifespan_gets_open_client(monkeypatch: pytest.MonkeyPatch):
+    """同一进程中第二次启动时，LLM 路由和服务绑定新的共享 HTTP 客户端"""
+    from fastapi.testclient import TestClient
+    
+    from app.main import app
+    from app.services import get_text_service
+    
+    monkeypatch.setenv("KIMI_API_KEY", "test")
+    monkeypatch.setenv("EAGER_STARTUP", "false")
+    monkeypatch.setenv("LLM_KEEP_WARM_INTERVAL", "0")
+    get_settings.cache_clear()
+    try:
+        with TestClient(app):
+            first = get_text_service()
+            assert first.agent.router is get_llm_router()
+        
+        with TestClient(app):
+            second = get_text_service()
+            assert second is not first
+            [backend] = second.agent.router.backends
+            assert not backend.llm.http_async_client.is_closed
+    finally:
+        get_settings.cache_clear()
@@ -0,0 +1,93 @@
+"""
+Maestro AI Server - 图像工具测试
+@author LJY
+"""
+
+import base64
+import hashlib
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from pydantic import ValidationError
+
+from app.core import ImageProcessingError
+from app.schemas import ExtractTextRequest, FindDefectsRequest
+from app.utils import PreparedImage, decode_byte_array_image
+
+
+def test_decode_signed_byte_array():
+    """有符号字节按位转换为无符号字节"""
+    assert decode_byte_array_image([-119, 80, 78, 71, -1, 0, 127, -128]) == bytes(
+        [0x89, 0x50, 0x4E, 0x47, 0xFF, 0x00, 0x7F, 0x80]
+    )
+
+
+def test_decode_unsigned_byte_array():
+    """兼容已是无符号的字节数组"""
+    assert decode_byte_array_image([0, 200, 255]) == bytes([0, 200, 255])
+
+
+def test_decode_invalid_byte_array():
+    """非整数元素应报图像处理错误"""
+    with pytest.raises(ImageProcessingError):
+        decode_byte_array_image(["a", "b"])
+
+
+def test_request_schema_decodes_screen():
+    """请求 schema 直接产出原始字节"""
+    request = FindDefectsRequest.model_validate({"screen": [-1, 1], "assertion": "ok"})
+    assert request.screen == b"\xff\x01"
+    
+    request = ExtractTextRequest.model_validate({"screen": [], "query": "title"})
+    assert request.screen == b""
+
+
+def test_request_schema_rejects_invalid_screen():
+    """screen 既不是字节数组也不是合法 Base64 字符串时校验失败"""
+    with pytest.raises(ValidationError):
+        FindDefectsRequest.model_validate({"screen": 123})
+    with pytest.raises(ValidationError):
+        FindDefectsRequest.model_validate({"screen": "abc"})
+
+
+def test_request_schema_accepts_base64_screen(mock_image_base64: bytes):
+    """screen 为 Base64 字符串 (可带 data URL 前缀) 时解码为原始字节"""
+    raw = base64.b64decode(mock_image_base64)
+    assert FindDefectsRequest.model_validate({"screen": mock_image_base64.decode()}).screen == raw
+    data_url = "data:image/png;base64," + mock_image_base64.decode()
+    assert FindDefectsRequest.model_validate({"screen": data_url}).screen == raw
+
+
+def _png(size: tuple[int, int]) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", size, (255, 0, 0)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_prepared_image_without_resize():
+    """未超出尺寸时直接复用原始字节"""
+    data = _png((100, 50))
+    image = PreparedImage(data).prepare()
+    
+    assert image.format == "PNG"
+    assert image.size == (100, 50)
+    assert image.mime_type == "image/png"
+    assert image.payload is data
+    assert image.content_hash == hashlib.sha256(data).hexdigest()
+    assert image.base64 == base64.b64encode(data).decode()
+
+
+def test_prepared_image_with_resize():
+    """超出尺寸时缩放一次并缓存结果"""
+    image = PreparedImage(_png((400, 200)), max_size=(100, 100))
+    
+    assert image.needs_resize
+    assert Image.open(BytesIO(image.payload)).size == (100, 50)
+    assert image.payload is image.payload
+
+
+def test_prepared_image_invalid_data():
+    """无法识别的图像数据抛出图像处理错误"""
+    with pytest.raises(ImageProcessingError):
+        PreparedImage(b"not an image").prepare()
@@ -0,0 +1,88 @@
+"""
+Maestro AI Server - 日志配置测试
+@author LJY
+"""
+
+import json
+import threading
+from io import BytesIO
+
+import pytest
+import structlog
+
+from app.config import Settings, get_settings
+from app.core import logging as app_logging
+from app.core.logging import LogSink, configure_logging, parse_log_level
+
+
+class BlockingStream(BytesIO):
+    """第一次写入前阻塞，模拟 stdout 写满"""
+    
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+    
+    def write(self, data: bytes) -> int:
+        self.release.wait(5)
+        return super().write(data)
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    app_logging.close_log_sink()
+    configure_logging(get_settings())
+
+
+def test_sink_batches_and_flushes_on_close():
+    """队列中的日志按批写出，关闭时写出剩余日志"""
+    stream = BytesIO()
+    sink = LogSink(stream, batch_size=100)
+    for i in range(250):
+        sink.write(b'{"n": %d}' % i)
+    sink.close()
+    
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line)["n"] for line in lines] == list(range(250))
+    assert sink.stats()["written"] == 250
+    assert sink.stats()["dropped"] == 0
+    assert sink.batches < 250
+
+
+def test_sink_drops_when_full():
+    """队列已满时丢弃新日志，不阻塞调用方，之后写出丢弃计数"""
+    stream = BlockingStream()
+    sink = LogSink(stream, max_queue=2, batch_size=1)
+    for i in range(20):
+        sink.write(b'{"n": %d}' % i)
+    assert sink.dropped > 0
+    stream.release.set()
+    sink.close()
+    
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    [report] = [r for r in records if r.get("event") == "log_records_dropped"]
+    assert report["dropped_total"] == sink.dropped
+    assert len(records) - 1 + sink.dropped == 20
+
+
+def test_json_logging_honors_level(restore_logging):
+    """json 模式按 LOG_LEVEL 过滤，输出一行一条 JSON"""
+    stream = BytesIO()
+    app_logging._log_sink = LogSink(stream)
+    configure_logging(Settings(log_format="json", log_level="WARNING"))
+    
+    logger = structlog.get_logger()
+    logger.info("ignored")
+    logger.warning("kept", screen_bytes=1024)
+    app_logging._log_sink.close()
+    
+    [record] = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert record["event"] == "kept"
+    assert record["level"] == "warning"
+    assert record["screen_bytes"] == 1024
+
+
+def test_parse_log_level():
+    assert parse_log_level("debug") == 10
+    assert parse_log_level("ERROR") == 40
+    assert parse_log_level("verbose") == 20
@@ -0,0 +1,121 @@
+"""
+Maestro AI Server - Prometheus 指标测试
+@author LJY
+"""
+
+import base64
+from unittest.mock import AsyncMock
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from langchain_core.messages import AIMessage
+from langchain_openai import ChatOpenAI
+
+from app.agents import DefectDetectionAgent
+from app.agents.defect_agent import DefectDetectionOutput
+from app.core.metrics import (
+    LLM_TOKENS,
+    STAGE_DURATION,
+    MetricsRegistry,
+    record_provider_request,
+    reset_endpoint,
+    set_endpoint,
+    track_provider_time,
+)
+from app.main import app
+from app.services import get_defect_service
+
+
+def test_render_text_format():
+    """计数器带标签输出，直方图按桶累计并输出 _sum / _count"""
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "示例计数器", ("kind",))
+    histogram = registry.histogram("demo_seconds", "示例直方图", buckets=(0.1, 1.0))
+    counter.labels(kind='a"b').inc(2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+    
+    text = registry.render()
+    assert "# TYPE demo_total counter" in text
+    assert 'demo_total{kind="a\\"b"} 2.0' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 3' in text
+    assert "demo_seconds_sum 5.55" in text
+    assert "demo_seconds_count 3" in text
+    
+    with pytest.raises(ValueError):
+        registry.counter("demo_total", "重复注册")
+
+
+@pytest.mark.asyncio
+async def test_agent_records_stages_and_tokens(mock_image_base64: bytes):
+    """Agent 调用按端点记录准入等待、解析耗时和 token 用量，提供商耗时从解析耗时中扣除"""
+    agent = DefectDetectionAgent(ChatOpenAI(model="metrics-model", api_key="test", base_url="http://127.0.0.1:9/v1"))
+    message = AIMessage(
+        content="",
+        usage_metadata={
+            "input_tokens": 900,
+            "output_tokens": 40,
+            "total_tokens": 940,
+            "input_token_details": {"cache_read": 512},
+        },
+    )
+    
+    async def ainvoke(state: dict, config: dict | None = None) -> dict:
+        record_provider_request(0.2)
+        return {"messages": [message], "structured_response": DefectDetectionOutput()}
+    
+    object.__setattr__(agent.agents["default"], "ainvoke", AsyncMock(side_effect=ainvoke))
+    
+    token = set_endpoint("/v2/test-metrics")
+    try:
+        await agent.detect(base64.b64decode(mock_image_base64), "页面显示登录按钮")
+    finally:
+        reset_endpoint(token)
+    
+    labels = {"endpoint": "/v2/test-metrics", "model": "metrics-model"}
+    assert LLM_TOKENS.value(**labels, kind="prompt") == 900
+    assert LLM_TOKENS.value(**labels, kind="completion") == 40
+    assert LLM_TOKENS.value(**labels, kind="cached") == 512
+    for stage in ("image_prepare", "base64", "admission_wait", "llm_provider", "llm_parse"):
+        assert STAGE_DURATION.count(endpoint="/v2/test-metrics", stage=stage) == 1
+    assert STAGE_DURATION.labels(endpoint="/v2/test-metrics", stage="llm_parse").sum < 0.2
+
+
+def test_provider_time_scoped_to_block():
+    """提供商耗时只收集到当前代码块中"""
+    with track_provider_time() as samples:
+        record_provider_request(0.5)
+    record_provider_request(0.25)
+    assert samples == [0.5]
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    """请求按路由路径计数，未知路径归为 other，阶段耗时按端点输出"""
+    service = AsyncMock()
+    service.find_defects = AsyncMock(return_value=[])
+    app.dependency_overrides[get_defect_service] = lambda: service
+    try:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post(
+                "/v2/find-defects",
+                headers={"Authorization": "Bearer test"},
+                json={"screen": [1, 2]},
+            )
+            await client.get("/no-such-path")
+            response = await client.get("/metrics")
+    finally:
+        app.dependency_overrides.clear()
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'maestro_http_requests_total{method="POST",endpoint="/v2/find-defects",status="200"}' in text
+    assert 'maestro_http_requests_total{method="GET",endpoint="other",status="404"}' in text
+    assert 'maestro_stage_duration_seconds_count{endpoint="/v2/find-defects",stage="body_read"}' in text
+    assert "maestro_http_requests_in_flight 1.0" in text
+    assert "maestro_admission_waiting" in text
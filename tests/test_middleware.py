@@ -4,10 +4,10 @@ Maestro AI Server - Middleware Tests
 """
 
 import pytest
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from httpx import AsyncClient, ASGITransport
 
-from app.middleware.logging import LoggingMiddleware
+from app.middleware.logging import MAX_LOGGED_BODY_SIZE, LoggingMiddleware, _BodyStats
 
 
 @pytest.mark.asyncio
@@ -31,3 +31,50 @@ async def test_logging_middleware():
         response = await client.post("/test", json={"screen": "base64data", "other": "data"})
         assert response.status_code == 200
         assert response.json() == {"received": {"screen": "base64data", "other": "data"}}
+
+
+@pytest.mark.asyncio
+async def test_logging_middleware_streams_large_body():
+    """中间件不缓冲请求体，端点仍能流式读取完整数据"""
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware, sample_rate=1.0)
+    
+    @app.post("/stream")
+    async def stream_endpoint(request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return {"size": size}
+    
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/stream", content=b"x" * (MAX_LOGGED_BODY_SIZE + 1))
+        assert response.status_code == 200
+        assert response.json() == {"size": MAX_LOGGED_BODY_SIZE + 1}
+
+
+def test_mask_headers():
+    """敏感 Header 被屏蔽"""
+    middleware = LoggingMiddleware(FastAPI(), sample_rate=0.0)
+    masked = middleware._mask_headers([
+        (b"Authorization", b"Bearer secret"),
+        (b"content-type", b"application/json"),
+    ])
+    assert masked == {"authorization": "***", "content-type": "application/json"}
+
+
+def test_describe_body():
+    """小请求体脱敏记录，大请求体只记录大小和哈希"""
+    middleware = LoggingMiddleware(FastAPI(), sample_rate=0.0)
+    
+    small = _BodyStats(detailed=True)
+    small.update(b'{"screen": [' + b"1," * 200 + b'1], "query": "title"}')
+    assert middleware._describe_body(small) == {"screen": "<byte_array_len_201>", "query": "title"}
+    
+    large = _BodyStats(detailed=True)
+    large.update(b"x" * (MAX_LOGGED_BODY_SIZE + 1))
+    assert middleware._describe_body(large).startswith(f"<body_len_{MAX_LOGGED_BODY_SIZE + 1}_sha256_")
+    
+    unsampled = _BodyStats(detailed=False)
+    unsampled.update(b"x" * 10)
+    assert middleware._describe_body(unsampled) == "<body_len_10>"
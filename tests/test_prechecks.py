@@ -0,0 +1,94 @@
+"""
+Maestro AI Server - 截图本地预检测试
+@author LJY
+"""
+
+from io import BytesIO
+from unittest.mock import AsyncMock
+
+import pytest
+from langchain_openai import ChatOpenAI
+from PIL import Image, ImageDraw
+
+from app.config import Settings
+from app.core.prechecks import BlackFrameRule, BlankFrameRule, LowVarianceRule, Prechecker, create_precheck_rules
+from app.core.router import LLMBackend, LLMRouter
+from app.services.defect_service import DefectService
+from app.utils.image import PreparedImage, compute_frame_stats
+
+
+def _screen(color: tuple[int, int, int], text: bool = False, status_bar: bool = False) -> bytes:
+    img = Image.new("RGB", (1080, 2400), color)
+    draw = ImageDraw.Draw(img)
+    if text:
+        # 纯色背景上的一行小字
+        draw.rectangle((100, 1200, 400, 1230), fill=(40, 40, 40))
+    if status_bar:
+        draw.rectangle((900, 20, 1060, 60), fill=(255, 255, 255))
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def _prechecker() -> Prechecker:
+    return Prechecker([BlackFrameRule(), BlankFrameRule(), LowVarianceRule()], mask_top=0.05, mask_bottom=0.05)
+
+
+def test_frame_stats_keeps_small_content():
+    """缩小后的像素统计仍能区分纯色截图和带少量文字的截图"""
+    assert compute_frame_stats(_screen((255, 255, 255))).channel_range == 0
+    assert compute_frame_stats(_screen((255, 255, 255), text=True)).channel_range > 100
+
+
+@pytest.mark.asyncio
+async def test_black_frame_short_circuits():
+    """全黑截图 (忽略状态栏) 直接判定为缺陷，并记录命中统计"""
+    prechecker = _prechecker()
+    result = await prechecker.run(PreparedImage(_screen((0, 0, 0), status_bar=True)), None)
+    
+    assert result.rule == "black_frame"
+    assert [d.category for d in result.defects] == ["UI_BUG"]
+    stats = prechecker.stats()
+    assert stats["short_circuits"] == 1
+    assert stats["rules"]["black_frame"] == {"evaluated": 1, "hits": 1}
+    assert stats["rules"]["blank_frame"] == {"evaluated": 0, "hits": 0}
+
+
+@pytest.mark.asyncio
+async def test_assertion_only_gets_hints():
+    """有断言时不直接给出结论，只附加提示；内容正常的截图不附加提示"""
+    prechecker = _prechecker()
+    result = await prechecker.run(PreparedImage(_screen((255, 255, 255))), "页面显示登录按钮")
+    assert result.defects is None
+    assert len(result.hints) == 1
+    
+    result = await prechecker.run(PreparedImage(_screen((255, 255, 255))), None)
+    assert result.rule == "blank_frame"
+    
+    result = await prechecker.run(PreparedImage(b"not an image"), None)
+    assert result.defects is None and result.hints == []
+
+
+def test_only_black_frame_is_default_verdict():
+    """默认只有全黑截图直接给出结论，纯色截图只附加提示"""
+    assert [rule.name for rule in create_precheck_rules(Settings())] == ["black_frame", "low_variance"]
+
+
+@pytest.mark.asyncio
+async def test_service_skips_llm_on_precheck_verdict(monkeypatch: pytest.MonkeyPatch):
+    """预检给出结论时不调用 Agent，提示会传给 Agent"""
+    llm = ChatOpenAI(model="stub-model", api_key="test", base_url="http://127.0.0.1:9/v1")
+    monkeypatch.setattr("app.services.defect_service.get_llm_router", lambda: LLMRouter([LLMBackend("stub", llm)]))
+    monkeypatch.setattr("app.services.defect_service.get_result_cache", lambda settings: None)
+    monkeypatch.setattr("app.services.defect_service.get_prechecker", lambda settings: _prechecker())
+    service = DefectService()
+    service.agent.detect = AsyncMock(return_value=[])
+    
+    defects = await service.find_defects(_screen((0, 0, 0)))
+    assert defects[0].category == "UI_BUG"
+    service.agent.detect.assert_not_awaited()
+    
+    await service.find_defects(_screen((250, 250, 250)), assertion="页面显示登录按钮")
+    hints = service.agent.detect.await_args.kwargs["hints"]
+    assert len(hints) == 1
+    assert "本地预检提示" in service.agent.get_prompt(assertion="页面显示登录按钮", hints=hints)
@@ -0,0 +1,185 @@
+"""
+Maestro AI Server - 重试预算、退避重试与熔断测试
+@author LJY
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.core import CircuitOpenError, OverloadedError
+from app.core.metrics import LLM_RETRIES, LLM_RETRIES_DENIED
+from app.core.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, RetryBudget
+from app.core.router import LLMBackend, LLMRouter
+
+
+def make_backend(name: str, threshold: int = 5, recovery: float = 30.0) -> LLMBackend:
+    breaker = CircuitBreaker(name, failure_threshold=threshold, recovery_timeout=recovery)
+    return LLMBackend(name, SimpleNamespace(model_name=f"{name}-model"), breaker=breaker)
+
+
+def make_flaky(failures: dict[str, int], error: type[Exception] = httpx.ConnectError):
+    """本地桩后端: 每个后端先失败指定次数再成功，记录调用顺序"""
+    calls = []
+    
+    async def call(backend: LLMBackend) -> str:
+        calls.append(backend.name)
+        if failures.get(backend.name, 0) > 0:
+            failures[backend.name] -= 1
+            raise error(f"{backend.name} 不可用")
+        return backend.name
+    
+    return call, calls
+
+
+def test_retry_budget_limits_retries():
+    """重试次数不超过请求数的 ratio 倍，预算用尽后拒绝"""
+    budget = RetryBudget(ratio=0.1, min_retries=0, window=60.0)
+    for _ in range(20):
+        budget.record_request()
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.stats()["denied"] == 1
+    
+    assert RetryBudget(ratio=0.1, min_retries=1).try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_transitions():
+    """连续失败后打开，恢复时间后半开只放行一个探测，探测成功后关闭"""
+    breaker = CircuitBreaker("kimi", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 0
+    
+    await asyncio.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.opened == 2
+
+
+@pytest.mark.asyncio
+async def test_router_retries_transient_errors():
+    """暂时性故障在同一后端退避重试，其他错误不重试也不计入熔断"""
+    backend = make_backend("primary")
+    router = LLMRouter([backend], max_retries=3, retry_initial_delay=0.001, retry_budget=RetryBudget())
+    call, calls = make_flaky({"primary": 2})
+    before = LLM_RETRIES.value(backend="primary")
+    
+    assert await router.call(call) == "primary"
+    assert calls == ["primary"] * 3
+    assert router.stats()["retries"] == 2
+    assert LLM_RETRIES.value(backend="primary") == before + 2
+    assert backend.breaker.consecutive_failures == 0
+    
+    call, calls = make_flaky({"primary": 1}, error=RuntimeError)
+    with pytest.raises(RuntimeError):
+        await router.call(call)
+    assert calls == ["primary"]
+    assert backend.breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_do_not_draw_budget():
+    """最后一次尝试失败后不再重试，不消耗重试预算"""
+    budget = RetryBudget(ratio=0.0, min_retries=10)
+    router = LLMRouter([make_backend("down")], max_retries=2, retry_initial_delay=0.001, retry_budget=budget)
+    call, calls = make_flaky({"down": 5})
+    
+    with pytest.raises(httpx.ConnectError):
+        await router.call(call)
+    assert len(calls) == 3
+    assert budget.retries == 2
+    assert router.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_local_rejections_do_not_reset_breaker():
+    """本地准入拒绝没有到达提供商，不重置连续失败计数，也不计入后端失败"""
+    backend = make_backend("brownout", threshold=3)
+    router = LLMRouter([backend])
+    
+    for error in (httpx.ConnectError, OverloadedError, httpx.ConnectError, OverloadedError, httpx.ConnectError):
+        call, _ = make_flaky({"brownout": 1}, error=error)
+        with pytest.raises(error):
+            await router.call(call)
+    
+    assert backend.breaker.state == OPEN
+    assert backend.failures == 3
+
+
+@pytest.mark.asyncio
+async def test_router_respects_retry_budget():
+    """重试预算用尽时不再重试，直接转移或失败"""
+    backend = make_backend("budgeted")
+    router = LLMRouter(
+        [backend],
+        max_retries=3,
+        retry_initial_delay=0.001,
+        retry_budget=RetryBudget(ratio=0.0, min_retries=0),
+    )
+    call, calls = make_flaky({"budgeted": 5})
+    before = LLM_RETRIES_DENIED.value(backend="budgeted")
+    
+    with pytest.raises(httpx.ConnectError):
+        await router.call(call)
+    assert calls == ["budgeted"]
+    assert LLM_RETRIES_DENIED.value(backend="budgeted") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_over_then_fails_fast():
+    """熔断的后端被跳过，所有后端都熔断时直接拒绝并给出 Retry-After"""
+    primary, secondary = make_backend("primary", threshold=2), make_backend("secondary", threshold=2)
+    router = LLMRouter([primary, secondary], max_retries=1, retry_initial_delay=0.001)
+    call, calls = make_flaky({"primary": 2})
+    
+    assert await router.call(call) == "secondary"
+    assert calls == ["primary", "primary", "secondary"]
+    assert primary.breaker.state == OPEN
+    
+    call, calls = make_flaky({})
+    assert await router.call(call) == "secondary"
+    assert calls == ["secondary"]
+    
+    for _ in range(2):
+        secondary.breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as exc_info:
+        await router.call(call)
+    assert exc_info.value.retry_after > 0
+    assert router.stats()["circuit_rejections"] == 1
+
+
+@pytest.mark.asyncio
+async def test_health_reports_circuits(monkeypatch: pytest.MonkeyPatch):
+    """/health 返回各后端熔断器状态，有后端熔断时为 degraded"""
+    from app.main import app
+    
+    backend = make_backend("kimi", threshold=1)
+    backend.breaker.record_failure()
+    router = LLMRouter([backend], retry_budget=RetryBudget())
+    monkeypatch.setattr("app.main.get_llm_router_stats", router.stats)
+    
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/health")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "degraded"
+    assert data["circuits"]["kimi"]["state"] == OPEN
+    assert data["retry_budget"]["ratio"] == 0.1
@@ -0,0 +1,148 @@
+"""
+Maestro AI Server - 多后端 LLM 路由测试
+@author LJY
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import Settings
+from app.core import OverloadedError
+from app.core.llm import create_llm_backends
+from app.core.metrics import LLM_BACKEND_FAILURES
+from app.core.router import MIN_LATENCY_SAMPLES, LLMBackend, LLMRouter
+
+
+def make_backend(name: str, weight: float = 1.0) -> LLMBackend:
+    return LLMBackend(name, SimpleNamespace(model_name=f"{name}-model"), weight=weight)
+
+
+def make_stub(latencies: dict[str, float], failing: set[str] = frozenset()):
+    """本地桩后端: 按名称模拟延迟和失败，记录调用和取消"""
+    calls, cancelled = [], []
+    
+    async def call(backend: LLMBackend) -> str:
+        calls.append(backend.name)
+        try:
+            await asyncio.sleep(latencies[backend.name])
+        except asyncio.CancelledError:
+            cancelled.append(backend.name)
+            raise
+        if backend.name in failing:
+            raise RuntimeError(f"{backend.name} 不可用")
+        return backend.name
+    
+    return call, calls, cancelled
+
+
+@pytest.mark.asyncio
+async def test_router_prefers_fastest_healthy_backend():
+    """按 EWMA 延迟选择最快的后端，失败率高的后端排在最后"""
+    slow, fast = make_backend("slow"), make_backend("fast")
+    router = LLMRouter([slow, fast])
+    slow.record_success(2.0)
+    fast.record_success(0.5)
+    assert [b.name for b in router.rank()] == ["fast", "slow"]
+    
+    for _ in range(5):
+        fast.record_failure()
+    assert not fast.healthy
+    assert [b.name for b in router.rank()] == ["slow", "fast"]
+    assert router.model_name == "fast-model+slow-model"
+
+
+@pytest.mark.asyncio
+async def test_recovered_backend_is_preferred_again():
+    """不健康的后端没有新的失败时错误率随时间衰减，恢复后重新排在前面"""
+    primary = LLMBackend("primary", SimpleNamespace(model_name="m"), weight=2, error_half_life=0.02)
+    secondary = make_backend("secondary")
+    router = LLMRouter([primary, secondary])
+    for _ in range(5):
+        primary.record_failure()
+    assert [b.name for b in router.rank()] == ["secondary", "primary"]
+    
+    await asyncio.sleep(0.1)
+    assert primary.healthy
+    assert [b.name for b in router.rank()] == ["primary", "secondary"]
+
+
+@pytest.mark.asyncio
+async def test_router_fails_over():
+    """首选后端失败时转移到下一个后端"""
+    primary, secondary = make_backend("primary", weight=2), make_backend("secondary")
+    router = LLMRouter([primary, secondary])
+    call, calls, _ = make_stub({"primary": 0, "secondary": 0}, failing={"primary"})
+    
+    assert await router.call(call) == "secondary"
+    assert calls == ["primary", "secondary"]
+    assert primary.failures == 1
+    assert router.stats()["failovers"] == 1
+    
+    call, _, _ = make_stub({"primary": 0, "secondary": 0}, failing={"primary", "secondary"})
+    with pytest.raises(RuntimeError):
+        await router.call(call)
+
+
+@pytest.mark.asyncio
+async def test_local_rejection_is_not_backend_failure():
+    """本地准入拒绝不计入后端失败，也不转移到其他后端"""
+    primary, secondary = make_backend("primary", weight=2), make_backend("secondary")
+    router = LLMRouter([primary, secondary])
+    calls = []
+    
+    async def call(backend: LLMBackend) -> str:
+        calls.append(backend.name)
+        raise OverloadedError("LLM 并发已满")
+    
+    before = LLM_BACKEND_FAILURES.value(backend="primary", error="OverloadedError")
+    with pytest.raises(OverloadedError):
+        await router.call(call)
+    assert calls == ["primary"]
+    assert primary.failures == 0
+    assert primary.healthy
+    assert router.stats()["failovers"] == 0
+    assert LLM_BACKEND_FAILURES.value(backend="primary", error="OverloadedError") == before
+
+
+@pytest.mark.asyncio
+async def test_router_hedges_slow_primary():
+    """首选后端超过对冲延迟未返回时向次选后端再发一次，取先返回的结果并取消另一个"""
+    primary, secondary = make_backend("primary", weight=2), make_backend("secondary")
+    router = LLMRouter([primary, secondary], hedge_enabled=True, hedge_min_delay=0.02)
+    call, calls, cancelled = make_stub({"primary": 1.0, "secondary": 0.01})
+    
+    assert await router.call(call) == "secondary"
+    assert calls == ["primary", "secondary"]
+    await asyncio.sleep(0)
+    assert cancelled == ["primary"]
+    assert router.stats()["hedges"] == 1
+    assert router.stats()["hedge_wins"] == 1
+    assert primary.in_flight == 0
+    assert primary.failures == 0
+
+
+def test_hedge_delay_uses_latency_percentile():
+    """延迟样本足够时按分位数触发对冲，不低于最短等待时间"""
+    backend = make_backend("primary")
+    router = LLMRouter([backend], hedge_percentile=0.9, hedge_min_delay=0.5)
+    assert router.hedge_delay(backend) == 0.5
+    
+    for i in range(MIN_LATENCY_SAMPLES):
+        backend.record_success(float(i + 1))
+    assert router.hedge_delay(backend) == 18.0
+
+
+def test_backends_from_settings(monkeypatch: pytest.MonkeyPatch):
+    """LLM_BACKENDS 以 JSON 配置多个 OpenAI 兼容后端"""
+    monkeypatch.setenv(
+        "LLM_BACKENDS",
+        '[{"name": "kimi", "base_url": "http://127.0.0.1:9001/v1", "api_key": "k", "model": "moonshot-v1-vision"},'
+        ' {"name": "gateway", "base_url": "http://127.0.0.1:9002/v1", "api_key": "k", "model": "gpt-4o", "weight": 2}]'
+    )
+    backends = create_llm_backends(Settings(_env_file=None))
+    assert [(b.name, b.model_name, b.weight) for b in backends] == [
+        ("kimi", "moonshot-v1-vision", 1.0),
+        ("gateway", "gpt-4o", 2.0),
+    ]
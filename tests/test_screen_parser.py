@@ -0,0 +1,71 @@
+"""
+Maestro AI Server - 请求体增量解析器测试
+@author LJY
+"""
+
+import json
+import os
+
+import pytest
+
+from app.utils.screen_parser import ScreenBodyParser
+
+
+def _parse(body: bytes, chunk_size: int) -> dict:
+    parser = ScreenBodyParser()
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+def test_parse_across_chunk_boundaries(chunk_size: int):
+    """任意切块方式下结果一致"""
+    raw = os.urandom(2000)
+    body = json.dumps({
+        "assertion": 'contains "screen": [1, 2]',
+        "screen": [b - 256 if b > 127 else b for b in raw],
+        "extra": {"screen": [1]},
+    }, ensure_ascii=False, indent=2).encode()
+    
+    fields = _parse(body, chunk_size)
+    
+    assert fields["screen"] == raw
+    assert fields["assertion"] == 'contains "screen": [1, 2]'
+    assert fields["extra"] == {"screen": [1]}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_parse_base64_screen_string(chunk_size: int):
+    """screen 为字符串时原样保留，转义字符不受整段复制影响"""
+    body = json.dumps({"query": 'say \\"hi\\"', "screen": "iVBORw0KGgo="}).encode()
+    fields = _parse(body, chunk_size)
+    assert fields == {"query": 'say \\"hi\\"', "screen": "iVBORw0KGgo="}
+
+
+def test_parse_large_chunk_in_batches():
+    """单块内的长数组分批解码，结果与整体解析一致"""
+    raw = os.urandom(50000)
+    body = json.dumps({"screen": [b - 256 if b > 127 else b for b in raw]}).encode()
+    assert _parse(body, len(body))["screen"] == raw
+
+
+def test_parse_without_screen():
+    """缺少 screen 字段时原样返回其余字段"""
+    assert _parse(b'{"query": "title"}', 4) == {"query": "title"}
+
+
+@pytest.mark.parametrize("body", [
+    b'{"screen": [1, 2',
+    b'{"screen": [1.5]}',
+    b'{"screen": ["a"]}',
+    pytest.param(b'{"screen": [' + b"1, " * 20000 + b'2, ]}', id="long-trailing-comma"),
+    pytest.param(b'{"screen": [' + b"1, " * 20000 + b'2, , 3]}', id="long-empty-element"),
+    b'[1, 2]',
+    b'',
+])
+@pytest.mark.parametrize("chunk_size", [5, 1024 * 1024])
+def test_parse_invalid_body(body: bytes, chunk_size: int):
+    """非法请求体抛出 ValueError"""
+    with pytest.raises(ValueError):
+        _parse(body, chunk_size)
@@ -0,0 +1,60 @@
+"""
+Maestro AI Server - 近似截图匹配测试
+@author LJY
+"""
+
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from app.core.similarity import NearDuplicateIndex, near_duplicate_scope
+from app.utils import compute_perceptual_hash
+
+
+def _screen(clock: str, body_color: tuple[int, int, int]) -> bytes:
+    """模拟手机截图: 顶部状态栏时钟 + 主体内容"""
+    img = Image.new("RGB", (360, 800), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 5), clock, fill=(0, 0, 0))
+    draw.rectangle((40, 200, 320, 300), fill=body_color)
+    draw.rectangle((40, 500, 200, 560), fill=(0, 0, 0))
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_perceptual_hash_ignores_masked_status_bar():
+    """仅状态栏不同的截图感知哈希一致，主体内容不同则差异明显"""
+    base = compute_perceptual_hash(_screen("10:01", (30, 120, 200)), mask_top=0.04)
+    clock_changed = compute_perceptual_hash(_screen("10:02", (30, 120, 200)), mask_top=0.04)
+    body_changed = compute_perceptual_hash(_screen("10:01", (255, 255, 255)), mask_top=0.04)
+    
+    assert (base ^ clock_changed).bit_count() == 0
+    assert (base ^ body_changed).bit_count() > 4
+
+
+def test_near_duplicate_index():
+    """在阈值内返回最接近的缓存键，不同 scope 互不影响"""
+    index = NearDuplicateIndex(threshold=2)
+    scope = near_duplicate_scope("ns", "页面显示登录按钮")
+    index.add(scope, 0b1111, "a")
+    index.add(scope, 0b0000, "b")
+    
+    assert index.find(scope, 0b0111) == "a"
+    assert index.find(scope, 0b0011) in {"a", "b"}
+    assert index.find(near_duplicate_scope("ns", "其他断言"), 0b1111) is None
+    
+    index.discard(scope, "a")
+    assert index.find(scope, 0b1111) is None
+
+
+def test_near_duplicate_index_bounded():
+    """超出条目上限时淘汰最久未使用的条目"""
+    index = NearDuplicateIndex(threshold=0, max_entries=2)
+    index.add("s", 1, "a")
+    index.add("s", 2, "b")
+    index.add("s", 3, "c")
+    
+    assert len(index) == 2
+    assert index.find("s", 1) is None
+    assert index.find("s", 3) == "c"
@@ -0,0 +1,101 @@
+"""
+Maestro AI Server - 并发请求合并测试
+@author LJY
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    """N 个相同 key 的并发请求只触发一次调用"""
+    flight = SingleFlight()
+    calls = 0
+    
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+    
+    results = await asyncio.gather(*(flight.do("k", fn) for _ in range(10)))
+    
+    assert results == ["result"] * 10
+    assert calls == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 9}
+
+
+@pytest.mark.asyncio
+async def test_exception_shared_and_forgotten():
+    """调用失败时所有等待者收到异常，之后的请求重新发起调用"""
+    flight = SingleFlight()
+    
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+    
+    results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    
+    async def ok():
+        return "ok"
+    
+    assert await flight.do("k", ok) == "ok"
+    assert flight.stats()["calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    """单个等待者取消不影响其他等待者；全部取消后共享调用被取消"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+    
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+            return "done"
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    first = asyncio.ensure_future(flight.do("k", slow))
+    second = asyncio.ensure_future(flight.do("k", slow))
+    await started.wait()
+    
+    first.cancel()
+    assert await second == "done"
+    assert not cancelled.is_set()
+    
+    third = asyncio.ensure_future(flight.do("k2", slow))
+    await asyncio.sleep(0.01)
+    third.cancel()
+    await asyncio.sleep(0.01)
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_request_after_last_waiter_cancelled_starts_new_call():
+    """唯一的等待者取消后立即到达的相同请求不会加入正在取消的调用"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.01)
+        return "done"
+    
+    first = asyncio.ensure_future(flight.do("k", slow))
+    await started.wait()
+    first.cancel()
+    retry = asyncio.ensure_future(flight.do("k", slow))
+    
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await retry == "done"
+    assert flight.stats()["calls"] == 2
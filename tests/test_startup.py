@@ -0,0 +1,32 @@
+"""
+Maestro AI Server - 启动预热测试
+@author LJY
+"""
+
+import subprocess
+import sys
+
+from app.core.startup import HEAVY_MODULES, StartupReport
+
+
+def test_app_import_defers_heavy_modules():
+    """导入 app.main 不加载 LangChain / OpenAI，/health 不需要这些模块"""
+    code = (
+        "import sys, app.main; "
+        f"print([m for m in {list(HEAVY_MODULES[:3])!r} if m in sys.modules])"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_startup_report():
+    """报告包含模块导入耗时、阶段耗时和就绪耗时"""
+    report = StartupReport()
+    report.import_module("json")
+    with report.phase("services"):
+        pass
+    
+    result = report.log()
+    assert result["imports_ms"] == {"json": 0.0}
+    assert "services" in result["phases_ms"]
+    assert result["time_to_ready_ms"] >= result["lifespan_ms"]
@@ -0,0 +1,176 @@
+"""
+Maestro AI Server - 链路追踪测试
+@author LJY
+"""
+
+import json
+import threading
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from langchain_core.messages import HumanMessage
+
+from app.core.metrics import observe_stage, time_stage
+from app.core.logging import LogSink
+from app.core.tracing import (
+    FileSpanExporter,
+    LangSmithAdapter,
+    Span,
+    SpanExporter,
+    StreamSpanExporter,
+    Tracer,
+    activate,
+    otlp_payload,
+    redact_images,
+    span,
+)
+from app.middleware.tracing import TracingMiddleware
+
+
+class MemoryExporter(SpanExporter):
+    def __init__(self):
+        self.traces: list[list[Span]] = []
+    
+    def export(self, spans: list[Span]) -> None:
+        self.traces.append(list(spans))
+
+
+def test_spans_nest_under_root():
+    """子 span 的父子关系、补记的阶段和异常状态，根 span 结束时整条追踪导出一次"""
+    exporter = MemoryExporter()
+    root = Tracer(exporter).start_trace("POST /v2/find-defects")
+    with activate(root):
+        with span("body_read") as child:
+            observe_stage("screen_decode", 0.01)
+        with pytest.raises(ValueError):
+            with span("llm_call", backend="default"):
+                raise ValueError("boom")
+    
+    [spans] = exporter.traces
+    by_name = {s.name: s for s in spans}
+    assert set(by_name) == {"POST /v2/find-defects", "body_read", "screen_decode", "llm_call"}
+    assert by_name["screen_decode"].parent_id == child.span_id
+    assert by_name["body_read"].parent_id == root.span_id
+    assert by_name["llm_call"].status == "ERROR"
+    assert {s.trace_id for s in spans} == {root.trace_id}
+    
+    [otlp] = otlp_payload(spans)["resourceSpans"][0]["scopeSpans"][0]["spans"][-1:]
+    assert otlp["kind"] == "SPAN_KIND_SERVER"
+    assert "parentSpanId" not in otlp
+    assert int(otlp["endTimeUnixNano"]) >= int(otlp["startTimeUnixNano"])
+
+
+class BlockingStream:
+    """写入会阻塞直到放行的字节流，用来确认 export 不在调用方线程中写出"""
+    
+    def __init__(self):
+        self.release = threading.Event()
+        self.data = b""
+    
+    def write(self, data: bytes) -> None:
+        self.release.wait(5)
+        self.data += data
+    
+    def flush(self) -> None:
+        pass
+
+
+def test_export_does_not_block(tmp_path):
+    """export 只入队，由后台线程写出；关闭时写出剩余的追踪"""
+    stream = BlockingStream()
+    exporter = StreamSpanExporter(stream)
+    root = Tracer(exporter).start_trace("GET /")
+    with activate(root):
+        pass
+    assert stream.data == b""
+    stream.release.set()
+    exporter.shutdown()
+    assert json.loads(stream.data)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "GET /"
+    
+    path = tmp_path / "traces.jsonl"
+    exporter = FileSpanExporter(str(path))
+    with activate(Tracer(exporter).start_trace("GET /health")):
+        pass
+    exporter.shutdown()
+    assert len(path.read_bytes().splitlines()) == 1
+
+
+def test_stdout_exporter_shares_log_sink():
+    """共用 json 日志的写线程时不关闭它"""
+    sink = LogSink(BlockingStream())
+    exporter = StreamSpanExporter(sink=sink)
+    exporter.shutdown()
+    assert not sink._closed
+    sink.close(timeout=0.1)
+
+
+def test_sampling_and_traceparent():
+    """未采样或没有进行中的追踪时 span 为空操作；traceparent 决定 trace_id 和采样"""
+    exporter = MemoryExporter()
+    assert Tracer(exporter, sample_rate=0.0).start_trace("GET /") is None
+    with span("orphan") as orphan:
+        assert orphan is None
+    
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    tracer = Tracer(exporter, sample_rate=0.0)
+    root = tracer.start_trace("GET /", traceparent=f"00-{trace_id}-00f067aa0ba902b7-01")
+    assert root.trace_id == trace_id
+    assert root.parent_id == "00f067aa0ba902b7"
+    assert Tracer(exporter, sample_rate=1.0).start_trace("GET /", traceparent=f"00-{trace_id}-00f067aa0ba902b7-00") is None
+
+
+def test_redact_images():
+    """截图 Base64 替换为摘要，其余内容保留"""
+    data = "iVBORw0KGgo" * 100
+    inputs = {
+        "messages": [
+            {"role": "user", "content": [
+                {"type": "image", "source_type": "base64", "data": data, "mime_type": "image/png"},
+                {"type": "text", "text": "页面显示登录按钮"},
+            ]},
+            HumanMessage(content=[{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{data}"}}]),
+        ]
+    }
+    redacted = redact_images(inputs)
+    text = str(redacted)
+    assert data not in text
+    assert "页面显示登录按钮" in text
+    assert redacted["messages"][0]["content"][0]["data"].startswith(f"<image {len(data)} chars")
+    assert inputs["messages"][0]["content"][0]["data"] == data
+
+
+def test_langsmith_sampling(monkeypatch):
+    """按采样率决定是否挂上 LangSmith 回调，客户端配置了脱敏函数"""
+    clients = []
+    
+    class FakeClient:
+        def __init__(self, **kwargs):
+            clients.append(kwargs)
+    
+    monkeypatch.setattr("langsmith.Client", FakeClient)
+    never = LangSmithAdapter("http://127.0.0.1:9", "test", "test", sample_rate=0.0)
+    always = LangSmithAdapter("http://127.0.0.1:9", "test", "test", sample_rate=1.0)
+    assert never.callbacks() == []
+    assert always.callbacks() == [always.tracer]
+    assert never.stats()["skipped"] == 1
+    assert clients[0]["hide_inputs"] is redact_images
+
+
+@pytest.mark.asyncio
+async def test_tracing_middleware():
+    """中间件为请求创建根 span，处理阶段记为子 span"""
+    async def endpoint(scope, receive, send):
+        with time_stage("precheck"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    
+    exporter = MemoryExporter()
+    app = TracingMiddleware(endpoint, tracer=Tracer(exporter))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/v2/find-defects")
+    
+    assert response.status_code == 200
+    [spans] = exporter.traces
+    assert [s.name for s in spans] == ["precheck", "GET /v2/find-defects"]
+    assert spans[1].attributes["http.response.status_code"] == 200